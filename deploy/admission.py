@@ -0,0 +1,189 @@
+# Bounded admission in front of generation: at most N generations run, at most M wait.
+from __future__ import annotations
+import itertools, math, threading, time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from metrics import METRICS
+from cancellation import CancelToken
+from quotas import ClientRegistry, ANONYMOUS
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; `retry_after` is a hint in seconds."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ("cost", "t0", "seq", "client", "tag")
+
+    def __init__(self, cost: float, t0: float, seq: int, client: str = ANONYMOUS, tag: float = 0.0):
+        self.cost, self.t0, self.seq, self.client, self.tag = cost, t0, seq, client, tag
+
+class Ticket:
+    """A held slot. Set `tokens` to what the generation produced; it settles the client's quota and fair share."""
+    __slots__ = ("client", "cost", "tokens")
+
+    def __init__(self, client: str, cost: float):
+        self.client, self.cost, self.tokens = client, cost, None
+
+class AdmissionController:
+    """
+    policy="fifo" serves waiters in arrival order; policy="sjf" serves the smallest `cost`
+    (predicted output tokens) first, minus `aging_per_s` per second waited so nothing starves;
+    policy="wfq" is start-time fair queueing over clients: a waiter's tag is where its client's
+    share of the token stream starts (cost / weight per request), smallest tag first.
+
+    `clients` (quotas.ClientRegistry) adds per-client token-bucket quotas, max_queued / max_in_flight
+    caps, and per-client metrics; without it everyone is one unlimited client.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait_s: float,
+                 policy: str = "fifo", aging_per_s: float = 50.0, clients: Optional[ClientRegistry] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max_wait_s
+        self.policy = policy
+        self.aging_per_s = aging_per_s
+        self.clients = clients or ClientRegistry.single()
+        self._cv = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._ewma_s = 10.0  # running estimate of one generation, seeds Retry-After
+        self._vtime = 0.0  # wfq virtual time: tag of the last admitted request
+        self._finish: Dict[str, float] = {}  # wfq: where each client's next request starts
+        self._client_active: Dict[str, int] = {}
+        self._client_waiting: Dict[str, int] = {}
+
+    def _eligible(self, client: str) -> bool:
+        """Under its max_in_flight and not overdrawn (queued requests of an overdrawn client wait for the refill)."""
+        cap = self.clients.policy(client).max_in_flight
+        if cap is not None and self._client_active.get(client, 0) >= cap:
+            return False
+        return self.clients.quota_wait_s(client) <= 0
+
+    def _next(self) -> Optional[_Waiter]:
+        queue = [w for w in self._queue if self._eligible(w.client)]
+        if not queue:
+            return None
+        if self.policy == "sjf":
+            now = time.monotonic()
+            return min(queue, key=lambda w: (w.cost - self.aging_per_s * (now - w.t0), w.seq))
+        if self.policy == "wfq":
+            return min(queue, key=lambda w: (w.tag, w.seq))
+        return min(queue, key=lambda w: w.seq)
+
+    def _publish(self, client: Optional[str] = None) -> None:
+        METRICS.set("admission_in_flight", self._active)
+        METRICS.set("admission_queue_depth", self._waiting)
+        if client is not None:
+            METRICS.set("client_in_flight", self._client_active.get(client, 0), client=client)
+            METRICS.set("client_queue_depth", self._client_waiting.get(client, 0), client=client)
+
+    def retry_after(self) -> int:
+        """Rough time until a freshly queued request would be served."""
+        return max(1, math.ceil(self._ewma_s * (self._waiting + 1) / self.max_concurrent))
+
+    def _reject(self, reason: str, client: str, retry_after: Optional[int] = None) -> AdmissionRejected:
+        METRICS.inc("admission_shed_total", reason=reason)
+        METRICS.inc("client_requests_total", client=client, outcome=reason)
+        return AdmissionRejected(reason, retry_after or self.retry_after())
+
+    def _tag(self, client: str, cost: float) -> float:
+        """wfq start tag for a new request of `client`; advances the client's finish time."""
+        start = max(self._vtime, self._finish.get(client, 0.0))
+        self._finish[client] = start + cost / self.clients.policy(client).weight
+        return start
+
+    def _admit(self, client: str, cost: float, tag: float) -> Ticket:
+        self._active += 1
+        self._client_active[client] = self._client_active.get(client, 0) + 1
+        self._vtime = max(self._vtime, tag)
+        self.clients.charge(client, cost)  # reserved now, settled to the real token count on release
+        METRICS.inc("admission_admitted_total")
+        METRICS.inc("client_requests_total", client=client, outcome="admitted")
+        return Ticket(client, cost)
+
+    def acquire(self, cancel: CancelToken | None = None, cost: float = 0.0, client: str = ANONYMOUS) -> Ticket:
+        """Take a generation slot. A request's deadline can only shorten max_wait_s, and a
+        request cancelled while queued (disconnect/deadline) leaves the queue immediately.
+        A client over its token quota is rejected with reason "quota" (Retry-After = refill time)."""
+        timeout_s = cancel.remaining() if cancel is not None else None
+        cost = cost if cost > 0 else self.clients.default_cost
+        policy = self.clients.policy(client)
+        wait_s = self.clients.quota_wait_s(client)
+        if wait_s > 0:
+            raise self._reject("quota", client, math.ceil(wait_s))
+        with self._cv:
+            if self._active < self.max_concurrent and self._waiting == 0 and self._eligible(client):
+                ticket = self._admit(client, cost, self._tag(client, cost))
+                self._publish(client)
+                return ticket
+            if self._waiting >= self.max_queue:
+                raise self._reject("queue_full", client)
+            if policy.max_queued is not None and self._client_waiting.get(client, 0) >= policy.max_queued:
+                raise self._reject("client_queue_full", client)
+            t0 = time.monotonic()
+            me = _Waiter(cost, t0, next(self._seq), client, self._tag(client, cost))
+            self._queue.append(me)
+            self._waiting += 1
+            self._client_waiting[client] = self._client_waiting.get(client, 0) + 1
+            self._publish(client)
+            deadline = t0 + (self.max_wait_s if timeout_s is None else min(self.max_wait_s, timeout_s))
+            ticket = None
+            try:
+                while self._active >= self.max_concurrent or self._next() is not me:
+                    if cancel is not None and cancel.cancelled:
+                        METRICS.inc("admission_cancelled_total", reason=cancel.reason)
+                        cancel.raise_if_cancelled()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject("queue_timeout", client)
+                    self._cv.wait(min(remaining, 0.25))
+                ticket = self._admit(client, cost, me.tag)
+            finally:
+                if ticket is None:
+                    self._finish[client] -= cost / policy.weight  # never served: give the share back
+                self._queue.remove(me)
+                self._waiting -= 1
+                self._client_waiting[client] -= 1
+                self._publish(client)
+                self._cv.notify_all()  # the head may have changed
+            METRICS.observe("admission_wait_s", time.monotonic() - t0)
+            METRICS.observe("client_wait_s", time.monotonic() - t0, client=client)
+            return ticket
+
+    def release(self, service_s: float | None = None, ticket: Ticket | None = None) -> None:
+        with self._cv:
+            self._active -= 1
+            if service_s is not None:
+                self._ewma_s = 0.8 * self._ewma_s + 0.2 * service_s
+            client = None
+            if ticket is not None:
+                client = ticket.client
+                self._client_active[client] -= 1
+                if ticket.tokens is not None:
+                    # settle the reservation made at admission against what was actually generated
+                    delta = ticket.tokens - ticket.cost
+                    self.clients.charge(client, delta)
+                    self._finish[client] = self._finish.get(client, 0.0) + delta / self.clients.policy(client).weight
+                    self.clients.record(client, ticket.tokens)
+            self._publish(client)
+            self._cv.notify_all()  # only the policy's head may proceed
+
+    @contextmanager
+    def slot(self, cancel: CancelToken | None = None, cost: float = 0.0, client: str = ANONYMOUS):
+        """Yields the Ticket; a GenerationCancelled leaving the block settles with its new_tokens."""
+        ticket = self.acquire(cancel, cost, client)
+        t0 = time.monotonic()
+        try:
+            yield ticket
+        except Exception as e:
+            if ticket.tokens is None and getattr(e, "new_tokens", None) is not None:
+                ticket.tokens = e.new_tokens
+            raise
+        finally:
+            self.release(time.monotonic() - t0, ticket)
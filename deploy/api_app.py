@@ -1,16 +1,47 @@
 from __future__ import annotations
-import os, json
-from fastapi import FastAPI, HTTPException
+import os, json, asyncio, hmac, tempfile
+from typing import Optional, List
+from fastapi import FastAPI, HTTPException, Request, Header, Query, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
 
-from config import MODEL_ID, DEFAULT_SCHEMA
-from schemas import CampaignRequest, CampaignResponse
-from generator import generate_campaign_plan
-from model_loader import load_llama
+from config import (MODEL_ID, DEFAULT_SCHEMA, ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE,
+                    ADMISSION_MAX_WAIT_S, SHED_MODE, MODEL_SERVER_SOCKET, API_WORKERS, INFERENCE_BACKEND,
+                    SCHED_POLICY, SCHED_AGING_TOKENS_PER_S, PLAN_SOLVER, DEBUG_ENDPOINTS, ADMIN_TOKEN,
+                    DEBUG_TRACEMALLOC_FRAMES, AUDIT_LOG_DIR, AUDIT_QUEUE_SIZE, AUDIT_OVERFLOW, AUDIT_BLOCK_TIMEOUT_S,
+                    AUDIT_BATCH, AUDIT_FLUSH_S, AUDIT_SEGMENT_MB, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P,
+                    OUTPUT_FORMAT, SECTIONED_GENERATION, PLAN_STORE_PATH, PLAN_STORE_TOKENIZER, EXPORT_MAX_CHANNELS,
+                    EXPORT_MAX_KPIS, EXPORT_MAX_UPLOAD_MB, CLIENTS_PATH)
+from schemas import CampaignRequest, CampaignResponse, RefineRequest, RefineResponse, PlanSearchResponse
+from admission import AdmissionController, AdmissionRejected
+from quotas import ClientRegistry, UnknownClient
+from fallback import template_plan
+from planner import solve_plan
+from metrics import METRICS
+from length_model import expected_tokens
+from cancellation import CancelToken, GenerationCancelled
+import memdiag
+from audit_log import AuditSink, audit_record
+from plan_store import PlanStore
+from export import StreamExporter, MEDIA_TYPES
 
 import uvicorn
 
+if MODEL_SERVER_SOCKET:
+    # lightweight worker: the model (and its admission queue) live in model_server.py
+    from model_client import ModelServerClient
+    MODEL_SERVER = ModelServerClient(MODEL_SERVER_SOCKET)
+    generate_campaign_plan = MODEL_SERVER.generate_campaign_plan
+    refine_plan = MODEL_SERVER.refine_plan
+    load_model = MODEL_SERVER.health
+else:
+    MODEL_SERVER = None
+    from generator import generate_campaign_plan
+    from refine import refine_plan
+    from backends import get_backend as load_model
+from refine import apply_edit, affected_fields, PLAN_FIELDS
+
 app = FastAPI(title="Campaign Ideation API (Llama 3.1 8B)")
 
 app.add_middleware(
@@ -20,31 +51,226 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+CLIENTS = ClientRegistry.load(CLIENTS_PATH) if CLIENTS_PATH else ClientRegistry.single()
+ADMISSION = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S,
+                                SCHED_POLICY, SCHED_AGING_TOKENS_PER_S, CLIENTS)
+if DEBUG_TRACEMALLOC_FRAMES > 0:
+    memdiag.tracemalloc_control("start", DEBUG_TRACEMALLOC_FRAMES)
+
+AUDIT = AuditSink(AUDIT_LOG_DIR, AUDIT_QUEUE_SIZE, AUDIT_OVERFLOW, AUDIT_BLOCK_TIMEOUT_S, AUDIT_BATCH, AUDIT_FLUSH_S,
+                  int(AUDIT_SEGMENT_MB * 2**20)) if AUDIT_LOG_DIR else None
+# what every generation in this process runs with (recorded per audit line)
+GEN_PARAMS = {"model": MODEL_ID, "backend": INFERENCE_BACKEND, "max_new_tokens": GEN_MAX_NEW_TOKENS,
+              "temperature": GEN_TEMPERATURE, "top_p": GEN_TOP_P, "output_format": OUTPUT_FORMAT,
+              "plan_solver": PLAN_SOLVER, "sectioned": SECTIONED_GENERATION}
+
+STORE = PlanStore(PLAN_STORE_PATH, PLAN_STORE_TOKENIZER) if PLAN_STORE_PATH else None
+
+def _store(brief: dict, plan: dict, source: str) -> None:
+    """Background task (after the response is sent): keep the plan searchable."""
+    if "plan_raw" in plan:
+        return
+    try:
+        if STORE.add(brief, plan, source) is not None:
+            METRICS.inc("plan_store_added_total", source=source)
+    except Exception:
+        METRICS.inc("plan_store_errors_total")
+
+@app.on_event("shutdown")
+def _close_audit():
+    if AUDIT is not None:
+        AUDIT.close()
+
+async def _audit(endpoint: str, brief: dict, plan: Optional[dict], meta: Optional[dict] = None,
+                 status: str = "ok", error: Optional[str] = None, **extra) -> None:
+    """Queue an audit line; never fails the request. Only overflow=block can wait, and then off the event loop."""
+    if AUDIT is None:
+        return
+    rec = audit_record(endpoint, brief, plan, meta or {}, GEN_PARAMS, status, error)
+    rec["meta"].update(extra)
+    if AUDIT.overflow == "block":
+        await run_in_threadpool(AUDIT.submit, rec)
+    else:
+        AUDIT.submit(rec)
+
 @app.get("/health")
 def health():
     try:
-        load_llama()
+        load_model()
         return {"status": "ok", "model": MODEL_ID}
     except Exception as e:
         return JSONResponse(status_code=503, content={"status":"error","detail":str(e)})
 
 @app.get("/version")
 def version():
-    import transformers, torch, jsonschema
-    return {
-        "model": MODEL_ID,
-        "transformers": transformers.__version__,
-        "torch": torch.__version__,
-        "jsonschema": jsonschema.__version__,
-    }
+    import jsonschema
+    out = {"model": MODEL_ID, "backend": INFERENCE_BACKEND, "jsonschema": jsonschema.__version__}
+    try:
+        import transformers, torch
+        out.update(transformers=transformers.__version__, torch=torch.__version__)
+    except ImportError:
+        pass  # stand-in backend on a box without torch
+    return out
 
 @app.get("/schema")
 def schema():
     return DEFAULT_SCHEMA
 
-@app.post("/campaign/generate", response_model=CampaignResponse)
-def generate(req: CampaignRequest):
-    brief = {
+@app.get("/metrics")
+def metrics():
+    CLIENTS.publish()
+    snap = METRICS.snapshot()
+    if MODEL_SERVER is not None:
+        snap["worker_pid"] = os.getpid()
+        try:
+            snap["model_server"] = MODEL_SERVER.metrics()
+        except Exception as e:
+            snap["model_server"] = {"error": str(e)}
+    return snap
+
+def _require_admin(token: Optional[str]) -> None:
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if ADMIN_TOKEN and not hmac.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required (X-Admin-Token)")
+
+@app.get("/debug/memory")
+def debug_memory(tensors: bool = False, top: int = 0, reset: bool = False,
+                 x_admin_token: Optional[str] = Header(None)):
+    """
+    RSS, torch allocator stats, KV-cache occupancy, in-process cache sizes of this worker (and of the model
+    server). `tensors=1` adds a live-tensor census (slow), `top=N` the N allocation sites grown most since the
+    tracemalloc baseline, `reset=1` moves the baseline to now.
+    """
+    _require_admin(x_admin_token)
+    out = memdiag.report(tensors, top, reset)
+    if MODEL_SERVER is not None:
+        try:
+            out["model_server"] = MODEL_SERVER.memory(tensors=tensors, top=top, reset=reset)
+        except Exception as e:
+            out["model_server"] = {"error": str(e)}
+    return out
+
+@app.post("/debug/memory/tracemalloc")
+def debug_tracemalloc(action: str = "start", frames: int = 1, x_admin_token: Optional[str] = Header(None)):
+    """start (sets the baseline) | mark (new baseline) | stop, here and in the model server."""
+    _require_admin(x_admin_token)
+    try:
+        out = memdiag.tracemalloc_control(action, frames)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if MODEL_SERVER is not None:
+        try:
+            MODEL_SERVER.memory(tracemalloc=action, frames=frames)
+            out["model_server"] = "ok"
+        except Exception as e:
+            out["model_server"] = {"error": str(e)}
+    return out
+
+def _client(api_key: Optional[str]) -> str:
+    try:
+        return CLIENTS.resolve(api_key)
+    except UnknownClient as e:
+        METRICS.inc("client_auth_failed_total")
+        raise HTTPException(status_code=401, detail=str(e))
+
+def _api_client(x_api_key: Optional[str] = Header(None)) -> str:
+    """Dependency for routes that only need the caller to be a known client."""
+    return _client(x_api_key)
+
+@app.get("/plans/search", response_model=PlanSearchResponse, response_model_exclude_none=True)
+def search_plans(q: Optional[str] = Query(None, description="Words in concept title / big idea / key message"),
+                 industry: Optional[str] = None, objective: Optional[str] = None, age: Optional[str] = None,
+                 geo: Optional[str] = None, tone: Optional[str] = None, language: Optional[str] = None,
+                 channel: Optional[List[str]] = Query(None, description="Plan uses every one of these channels"),
+                 min_budget: Optional[float] = None, max_budget: Optional[float] = None,
+                 limit: int = Query(20, ge=1, le=100), cursor: Optional[int] = None, offset: int = Query(0, ge=0),
+                 order: str = Query("recent", pattern="^(recent|relevance)$",
+                                    description="relevance: best full-text match first (with q; pages by offset)"),
+                 full: bool = Query(False, description="Include brief and plan JSON"),
+                 client: str = Depends(_api_client)):
+    """Stored plans (PLAN_STORE_PATH) by brief filters and full text; newest first, or best match first."""
+    if STORE is None:
+        raise HTTPException(status_code=404, detail="Plan store is off (set PLAN_STORE_PATH)")
+    res = STORE.search(q, channel, min_budget, max_budget, limit, cursor, offset, full, order, industry=industry,
+                       objective=objective, age=age, geo=geo, tone=tone, language=language)
+    METRICS.observe("plan_search_ms", res["took_ms"])
+    return res
+
+@app.get("/plans/{plan_id}")
+def get_plan(plan_id: int, client: str = Depends(_api_client)):
+    if STORE is None:
+        raise HTTPException(status_code=404, detail="Plan store is off (set PLAN_STORE_PATH)")
+    found = STORE.get(plan_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"No plan {plan_id}")
+    return found
+
+@app.post("/plans/export")
+async def export_plans(request: Request, format: str = Query("csv", pattern="^(md|csv|xlsx)$"),
+                       bom: bool = Query(False, description="CSV: UTF-8 BOM for Excel"),
+                       client: str = Depends(_api_client)):
+    """
+    Export a JSONL request body of plans ({"input", "output"} lines, plan-store hits or bare plans) as Markdown /
+    CSV / XLSX; scripts/export_plans.py is the offline equivalent. The upload is spooled (to disk past 8 MB) and
+    the export streamed from it, so neither side is held in memory. Uploads over EXPORT_MAX_UPLOAD_MB get 413.
+    """
+    cap = int(EXPORT_MAX_UPLOAD_MB * 2**20)
+    too_large = HTTPException(status_code=413, detail=f"Upload over EXPORT_MAX_UPLOAD_MB ({EXPORT_MAX_UPLOAD_MB:g} MB)")
+    if int(request.headers.get("content-length") or 0) > cap:
+        raise too_large
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 2**20)
+    async for data in request.stream():
+        if spool.tell() + len(data) > cap:  # chunked uploads carry no Content-Length
+            spool.close()
+            raise too_large
+        spool.write(data)
+    spool.seek(0)
+
+    def body():
+        # sync generator: Starlette iterates it in the threadpool, off the event loop
+        exporter = StreamExporter(format, EXPORT_MAX_CHANNELS, EXPORT_MAX_KPIS, bom)
+        try:
+            for data in iter(lambda: spool.read(1 << 16), b""):
+                out = exporter.feed(data)
+                if out:
+                    yield out
+            yield exporter.finish()
+        finally:
+            spool.close()
+        METRICS.inc("export_records_total", exporter.stats["records"], format=format)
+        METRICS.inc("export_skipped_total", exporter.stats["skipped"], format=format)
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="plans.{format}"'})
+
+async def _watch_disconnect(request: Request, cancel: CancelToken, interval_s: float = 0.25) -> None:
+    while not cancel.cancelled:
+        if await request.is_disconnected():
+            cancel.cancel("disconnect")
+            return
+        await asyncio.sleep(interval_s)
+
+
+def _generate_admitted(brief: dict, cancel: CancelToken, client: str):
+    if MODEL_SERVER is not None:
+        # admitted (and accounted) server-side
+        return generate_campaign_plan(brief, DEFAULT_SCHEMA, cancel=cancel, client=client)
+    with ADMISSION.slot(cancel, expected_tokens(brief), client) as ticket:
+        plan, meta = generate_campaign_plan(brief, DEFAULT_SCHEMA, cancel=cancel)
+        ticket.tokens = meta.get("new_tokens")
+        return plan, meta
+
+def _refine_admitted(brief: dict, plan: dict, fields: list, cancel: CancelToken, client: str):
+    if MODEL_SERVER is not None:
+        return refine_plan(brief, plan, fields, DEFAULT_SCHEMA, cancel=cancel, client=client)
+    with ADMISSION.slot(cancel, expected_tokens(brief) * len(fields) / len(PLAN_FIELDS), client) as ticket:
+        plan, meta = refine_plan(brief, plan, fields, DEFAULT_SCHEMA, cancel=cancel)
+        ticket.tokens = meta.get("new_tokens")
+        return plan, meta
+
+def _brief(req: CampaignRequest) -> dict:
+    return {
         "industry": req.industry,
         "audience": req.audience.dict(),
         "budget_thb": req.budget_thb,
@@ -52,19 +278,115 @@ def generate(req: CampaignRequest):
         "constraints": (req.constraints.dict() if req.constraints else {}),
         "language": req.language
     }
+
+@app.post("/campaign/generate", response_model=CampaignResponse)
+async def generate(req: CampaignRequest, request: Request, background: BackgroundTasks,
+                   x_request_timeout: Optional[float] = Header(None), x_api_key: Optional[str] = Header(None)):
+    client = _client(x_api_key)
+    brief = _brief(req)
+    cancel = CancelToken(timeout_s=x_request_timeout or req.timeout_s)
+    watcher = asyncio.create_task(_watch_disconnect(request, cancel))
     try:
-        plan, meta = generate_campaign_plan(brief, DEFAULT_SCHEMA)
+        plan, meta = await run_in_threadpool(_generate_admitted, brief, cancel, client)
+    except GenerationCancelled as e:
+        await _audit("generate", brief, None, status="cancelled", error=str(e), new_tokens=e.new_tokens, client=client)
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail=str(e))
+        raise HTTPException(status_code=499, detail=str(e))  # client went away; nobody reads this
+    except AdmissionRejected as e:
+        # a client over its own quota / queue share gets 429 even in degrade mode: the server is not overloaded
+        if SHED_MODE != "degrade" or e.reason in ("quota", "client_queue_full"):
+            await _audit("generate", brief, None, status="rejected", error=str(e), client=client)
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        METRICS.inc("degraded_responses_total", reason=e.reason)
+        plan = template_plan(brief)
+        budget = solve_plan(plan, brief) if PLAN_SOLVER else None
+        # not model output: kept out of `output` so it never becomes training data
+        await _audit("generate", brief, None, status="degraded", error=str(e), template_plan=plan, client=client)
+        return CampaignResponse(
+            status="ok",
+            plan=plan,
+            model="template",
+            elapsed_ms=0,
+            warnings=[f"Degraded template plan served: {e}"],
+            degraded=True,
+            budget=budget,
+            brief_echo=req
+        )
     except Exception as e:
+        await _audit("generate", brief, None, status="error", error=str(e), client=client)
         raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+    finally:
+        watcher.cancel()
 
+    await _audit("generate", brief, plan, meta, client=client)
+    if STORE is not None:
+        background.add_task(_store, brief, plan, "api")
     return CampaignResponse(
         status="ok",
         plan=plan,
-        model=MODEL_ID,
+        model=MODEL_ID if meta.get("backend", "hf").startswith("hf") else meta["backend"],
         elapsed_ms=meta.get("elapsed_ms", 0),
         warnings=meta.get("warnings"),
+        budget=meta.get("budget"),
+        memory=meta.get("memory"),
+        cascade=meta.get("cascade"),
         brief_echo=req
     )
 
+@app.post("/campaign/refine", response_model=RefineResponse)
+async def refine(req: RefineRequest, request: Request, background: BackgroundTasks,
+                 x_request_timeout: Optional[float] = Header(None), x_api_key: Optional[str] = Header(None)):
+    """Apply `edit` to the brief and re-decode only the plan fields it affects (or `fields`)."""
+    client = _client(x_api_key)
+    old = _brief(req.brief)
+    brief = apply_edit(old, req.edit.dict(exclude_unset=True))
+    fields = req.fields if req.fields is not None else affected_fields(old, brief)
+    try:
+        new_req = CampaignRequest(**{**brief, "timeout_s": req.brief.timeout_s})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Edited brief is invalid: {e}")
+
+    cancel = CancelToken(timeout_s=x_request_timeout or req.timeout_s)
+    watcher = asyncio.create_task(_watch_disconnect(request, cancel))
+    try:
+        plan, meta = await run_in_threadpool(_refine_admitted, brief, req.plan, fields, cancel, client)
+    except GenerationCancelled as e:
+        await _audit("refine", brief, None, status="cancelled", error=str(e), new_tokens=e.new_tokens,
+                     refine_from=req.plan, refine_fields=fields, client=client)
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail=str(e))
+        raise HTTPException(status_code=499, detail=str(e))
+    except AdmissionRejected as e:
+        await _audit("refine", brief, None, status="rejected", error=str(e), refine_from=req.plan, refine_fields=fields,
+                     client=client)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        await _audit("refine", brief, None, status="error", error=str(e), refine_from=req.plan, refine_fields=fields,
+                     client=client)
+        raise HTTPException(status_code=500, detail=f"Refine failed: {e}")
+    finally:
+        watcher.cancel()
+
+    await _audit("refine", brief, plan, meta, refine_from=req.plan, refine_fields=fields, client=client)
+    if STORE is not None:
+        background.add_task(_store, brief, plan, "api-refine")
+
+    return RefineResponse(
+        status="ok",
+        plan=plan,
+        model=MODEL_ID if meta.get("backend", "hf").startswith("hf") else meta["backend"],
+        elapsed_ms=meta.get("elapsed_ms", 0),
+        refined_fields=meta.get("refined_fields", fields),
+        new_tokens=meta.get("new_tokens", 0),
+        full_regen_tokens=meta.get("full_regen_tokens"),
+        warnings=meta.get("warnings"),
+        budget=meta.get("budget"),
+        memory=meta.get("memory"),
+        brief_echo=new_req
+    )
+
 if __name__ == "__main__":
-    uvicorn.run("api_app:app", host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    if API_WORKERS > 1 and not MODEL_SERVER_SOCKET:
+        print("[WARN] API_WORKERS > 1 without MODEL_SERVER_SOCKET loads one model copy per worker.")
+    uvicorn.run("api_app:app", host="0.0.0.0", port=8000, log_level="info", workers=API_WORKERS)
\ No newline at end of file
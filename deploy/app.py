@@ -1,42 +1,25 @@
 import os, json, traceback
 import streamlit as st
 
-from config import MODEL_ID, DEFAULT_SCHEMA, CHANNEL_CATALOG, SYSTEM_PROMPT
+from config import MODEL_ID, DEFAULT_SCHEMA, CHANNEL_CATALOG, SYSTEM_PROMPT, INFERENCE_BACKEND, PLAN_SOLVER, DEBUG_ENDPOINTS
 from prompts import build_user_prompt
-from utils import extract_first_json_block, normalize_budget_split, safe_load_json, json_after_assistant, align_plan_to_schema
+from utils import extract_first_json_block, normalize_budget_split, safe_load_json, align_plan_to_schema
 from validators import validate_plan
-from model_loader import load_llama
-from generator import generate_json_plan
+from backends import get_backend, BACKENDS
+from generator import generate_json_plan, parse_plan_text
+from planner import solve_plan
+from export import render_markdown
 
 st.set_page_config(page_title="Campaign Ideation AI (Llama 3.1 8B)", page_icon="🧠", layout="wide")
 st.markdown("<h1>🧠 Campaign Ideation AI</h1><p>Meta-Llama-3.1-8B-Instruct only.</p>", unsafe_allow_html=True)
 
 def to_markdown(plan: dict) -> str:
-    lines = []
-    lines.append(f"# {plan.get('concept_title','(no title)')}")
-    lines.append(plan.get("big_idea",""))
-    lines.append(f"**Key message:** {plan.get('key_message','')}")
-    lines.append("\n## Channels & Activations")
-    for ch in plan.get("channels", []):
-        name = ch.get("name","")
-        act = ch.get("activation","")
-        kpi = ", ".join([f"{k}: {v}" for k,v in (ch.get("kpis") or {}).items()])
-        lines.append(f"- **{name}** — {act}  \n  KPIs: {kpi}")
-    lines.append("\n## Assets")
-    for a in plan.get("assets", []):
-        lines.append(f"- {a}")
-    lines.append("\n## Budget Split")
-    for item in plan.get("budget_split", []):
-        if isinstance(item, list) and len(item)==2:
-            lines.append(f"- {item[0]}: {int(item[1]*100)}%")
-    lines.append(f"\n## Timeline\n- {plan.get('timeline_weeks','?')} weeks")
-    lines.append("\n## KPIs")
-    for k,v in (plan.get("kpis") or {}).items():
-        lines.append(f"- {k}: {v}")
-    return "\n".join(lines)
+    return render_markdown(plan)
 
 with st.sidebar:
     st.header("Settings")
+    backend_name = st.selectbox("Backend", BACKENDS, index=BACKENDS.index(INFERENCE_BACKEND) if INFERENCE_BACKEND in BACKENDS else 0,
+                                help="hf = GPU + LoRA, hf-cpu = CPU, standin = deterministic replay (no model)")
     model_dir = st.text_input("Local model path (optional)", value="", help="Leave empty to load from Hugging Face (requires HF token and access).")
     local_only = st.checkbox("Local files only (offline)", value=bool(model_dir))
     hf_token = st.text_input("HF token (needed for gated repo)", type="password", value=os.getenv("HF_TOKEN",""))
@@ -46,6 +29,14 @@ with st.sidebar:
     st.markdown("---")
     st.caption("JSON schema (edit as needed)")
     schema_str = st.text_area("Schema", value=json.dumps(DEFAULT_SCHEMA, ensure_ascii=False, indent=2), height=240)
+    if DEBUG_ENDPOINTS:
+        with st.expander("Memory (this process)"):
+            # same report as the API's /debug/memory
+            import memdiag
+            if st.checkbox("Live tensor census (slow)", value=False):
+                st.json(memdiag.report(tensors=True))
+            else:
+                st.json(memdiag.report())
 
 st.subheader("Brief")
 with st.form("brief_form"):
@@ -84,34 +75,36 @@ if submitted:
         }
         user_prompt = build_user_prompt(brief)
 
-        # Load model (Llama 3.1 8B only)
+        # Load backend (Llama 3.1 8B on GPU/CPU, or the stand-in)
         try:
             mdl_dir = model_dir or None
-            tok, mdl = load_llama(model_dir=mdl_dir, local_files_only=local_only, hf_token=hf_token or None)
+            backend = get_backend(backend_name, model_dir=mdl_dir, local_files_only=local_only, hf_token=hf_token or None)
         except Exception as e:
             st.error(f"Model load error: {e}")
             st.stop()
 
         # Generate raw text
         try:
-            raw = generate_json_plan(tok, mdl, SYSTEM_PROMPT, user_prompt, max_new_tokens, temperature, top_p)
+            raw = generate_json_plan(backend, SYSTEM_PROMPT, user_prompt, max_new_tokens, temperature, top_p)
         except Exception as e:
             st.error("Generation error")
             st.code(traceback.format_exc())
             st.stop()
 
-        # Extract JSON
+        # Extract the plan (JSON or compact lines, per OUTPUT_FORMAT)
         print(raw)
         # cand = extract_first_json_block(raw) or raw
         # plan = safe_load_json(cand)
-        plan = align_plan_to_schema(json_after_assistant(raw))
+        parsed = parse_plan_text(raw)
+        plan = align_plan_to_schema(parsed) if parsed else None
         if not plan:
-            st.warning("Could not parse a clean JSON block; showing raw text.")
+            st.warning("Could not parse a clean plan from the output; showing raw text.")
             st.code(raw)
             st.stop()
 
-        # Normalize + validate
+        # Normalize (or solve) + validate
         normalize_budget_split(plan)
+        budget = solve_plan(plan, brief) if PLAN_SOLVER else None
         ok, err = validate_plan(plan, schema)
         if not ok:
             st.warning("Plan generated but failed schema validation:")
@@ -134,9 +127,13 @@ if submitted:
             st.markdown("\n".join(rows) or "_No channels_")
         with c3:
             st.markdown("**Budget split**")
-            for item in plan.get("budget_split", []):
-                if isinstance(item, list) and len(item)==2:
-                    st.write(f"- {item[0]}: {int(item[1]*100)}%")
+            if budget:
+                for row in budget["channels"]:
+                    st.write(f"- {row['channel']}: {int(row['share']*100)}% ({row['thb']:,} THB)")
+            else:
+                for item in plan.get("budget_split", []):
+                    if isinstance(item, list) and len(item)==2:
+                        st.write(f"- {item[0]}: {int(item[1]*100)}%")
             st.write(f"**Timeline:** {plan.get('timeline_weeks','?')} weeks")
             kpis = plan.get("kpis", {})
             if kpis:
@@ -144,6 +141,10 @@ if submitted:
                 for k, v in kpis.items():
                     st.write(f"- {k}: {v}")
 
+        if budget:
+            with st.expander("Weekly flighting (THB)"):
+                st.dataframe([{"week": w["week"], "total": w["thb"], **w["channels"]} for w in budget["weekly"]])
+
         with st.expander("Full JSON"):
             st.code(json.dumps(plan, ensure_ascii=False, indent=2), language="json")
 
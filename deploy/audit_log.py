@@ -0,0 +1,152 @@
+# Asynchronous audit log (AUDIT_LOG_DIR): every brief, plan, sampling parameters and timings, written off the
+# request path. Handlers enqueue records; a background thread drains the queue in batches and appends each
+# batch as one gzip member to the current segment, rotating to a new segment at AUDIT_SEGMENT_MB. Segments are
+# JSONL in the training-data shape ({"input": brief, "output": plan, "meta": {...}}), so
+# scripts/split_jsonl.py and scripts/train_lora.py read them directly (read_lines); a crash loses at most one batch.
+#
+# When the queue is full: AUDIT_OVERFLOW=drop discards the record, =block waits up to AUDIT_BLOCK_TIMEOUT_S
+# (then discards). Both are counted (audit_dropped_total{reason}, audit_blocked_total).
+from __future__ import annotations
+import gzip, json, os, queue, socket, sys, threading, time
+from typing import Dict, Any, Iterator, List, Optional
+
+from metrics import METRICS
+
+_CLOSE = object()
+
+def read_lines(path: str) -> Iterator[str]:
+    """Lines of a plain or gzip'd JSONL file. A segment whose last gzip member was cut short by a crash ends with a
+    warning instead of an error; everything read before it is kept."""
+    if not path.endswith(".gz"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from f
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            yield from f
+        except (EOFError, gzip.BadGzipFile) as e:
+            print(f"[WARN] {path}: incomplete gzip member at the end ({e}); kept the records before it.", file=sys.stderr)
+
+class AuditSink:
+    def __init__(self, directory: str, queue_size: int = 1000, overflow: str = "drop", block_timeout_s: float = 1.0,
+                 batch_size: int = 64, flush_interval_s: float = 1.0, segment_bytes: int = 64 * 2**20,
+                 compresslevel: int = 6):
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"AUDIT_OVERFLOW must be drop or block, not {overflow!r}")
+        self.directory = directory
+        self.overflow = overflow
+        self.block_timeout_s = block_timeout_s
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.segment_bytes = segment_bytes
+        self.compresslevel = compresslevel
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._closed = False
+        self._seq = 0
+        self._path: Optional[str] = None
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="audit-writer")
+        self._thread.start()
+
+    # ---------- producer side
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Enqueue one record; False if it was dropped. With overflow=block this can wait (call off the event loop)."""
+        if self._closed:
+            METRICS.inc("audit_dropped_total", reason="closed")
+            return False
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "drop":
+                METRICS.inc("audit_dropped_total", reason="overflow")
+                return False
+            METRICS.inc("audit_blocked_total")
+            t0 = time.perf_counter()
+            try:
+                self._q.put(record, timeout=self.block_timeout_s)
+            except queue.Full:
+                METRICS.inc("audit_dropped_total", reason="block_timeout")
+                return False
+            finally:
+                METRICS.observe("audit_block_ms", (time.perf_counter() - t0) * 1000)
+        METRICS.inc("audit_enqueued_total")
+        METRICS.set("audit_queue_depth", self._q.qsize())
+        return True
+
+    def close(self, timeout_s: float = 10.0) -> None:
+        """Stop accepting records and write what is queued."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_CLOSE)  # blocks only while the writer frees a slot
+        self._thread.join(timeout_s)
+
+    # ---------- writer side
+
+    def _new_segment(self) -> str:
+        self._seq += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        name = f"audit-{stamp}-{socket.gethostname()}-{os.getpid()}-{self._seq:04d}.jsonl.gz"
+        METRICS.inc("audit_segments_total")
+        return os.path.join(self.directory, name)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch).encode("utf-8")
+        if self._path is None or os.path.getsize(self._path) >= self.segment_bytes:
+            self._path = self._new_segment()
+        # one complete gzip member per batch: readers (gzip.open) see every finished batch, even mid-segment
+        member = memoryview(gzip.compress(data, self.compresslevel))
+        with open(self._path, "ab", buffering=0) as f:
+            size = f.tell()
+            try:
+                while member:
+                    member = member[f.write(member):]
+                os.fsync(f.fileno())
+            except Exception:
+                # a partial member (e.g. ENOSPC) would hide every later batch from readers: cut it off, or start
+                # the next batch in a new segment if even that fails (unbuffered, so close() rewrites nothing)
+                try:
+                    f.truncate(size)
+                except OSError:
+                    self._path = None
+                raise
+        METRICS.inc("audit_written_total", len(batch))
+        METRICS.inc("audit_batches_total")
+
+    def _run(self) -> None:
+        done = False
+        while not done:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    done = True
+                    break
+                batch.append(item)
+            METRICS.set("audit_queue_depth", self._q.qsize())
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception:
+                # a full disk must not take the API down; the records are counted as lost
+                METRICS.inc("audit_write_errors_total")
+                METRICS.inc("audit_dropped_total", len(batch), reason="write_error")
+
+def audit_record(endpoint: str, brief: Dict[str, Any], plan: Optional[Dict[str, Any]], meta: Dict[str, Any],
+                 params: Dict[str, Any], status: str = "ok", error: Optional[str] = None) -> Dict[str, Any]:
+    """One audit line: training shape (input/output) plus what produced it. `output` is None for failures."""
+    if isinstance(plan, dict) and "plan_raw" in plan:
+        status, error, plan = "unparsed", plan["plan_raw"], None
+    keep = ("backend", "elapsed_ms", "prompt_tokens", "new_tokens", "finish_reason", "token_budget", "continuations",
+            "attempts", "sections", "compliance", "refined_fields", "full_regen_tokens", "replica", "warnings")
+    rec_meta = {"ts": round(time.time(), 3), "endpoint": endpoint, "status": status, "params": params,
+                **{k: meta[k] for k in keep if k in meta}}
+    if error:
+        rec_meta["error"] = error
+    return {"input": brief, "output": plan, "meta": rec_meta}
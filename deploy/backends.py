@@ -0,0 +1,289 @@
+# Inference backends: one interface (prefill / decode / generate + tokenizer + capabilities)
+# so the API, the Streamlit app and the scripts can run on HF+PEFT (GPU), plain HF on CPU,
+# an ONNX Runtime export, or a deterministic stand-in that needs neither a GPU nor model weights.
+from __future__ import annotations
+import json, os, re, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Union
+
+from config import (INFERENCE_BACKEND, STANDIN_REPLAY_PATH, STANDIN_PREFILL_MS, STANDIN_DECODE_MS,
+                    MODEL_DIR, LOCAL_FILES_ONLY, HF_TOKEN, ADAPTER_DIR, ONNX_DIR, ONNX_QUANT, ONNX_THREADS,
+                    HF_STATIC_CACHE, STATIC_WARMUP_BATCH_SIZES, STATIC_WARMUP_LENS)
+from cancellation import CancelToken
+
+@dataclass
+class Completion:
+    text: str               # completion only, prompt excluded
+    prompt_tokens: int
+    new_tokens: int
+    prefill_ms: int
+    decode_ms: int
+    finish_reason: str      # "stop" | "length" | "cancelled"
+
+# stop(text_so_far) -> True ends decoding (finish_reason "stop"), e.g. once a JSON value is complete
+StopFn = Callable[[str], bool]
+
+def branch_stops(stop: Union[StopFn, List[StopFn], None], n: int) -> List[Optional[StopFn]]:
+    """generate_branches takes one stop test for all branches or one per branch."""
+    return list(stop) if isinstance(stop, (list, tuple)) else [stop] * n
+
+class InferenceBackend:
+    """
+    prefill(prompt) -> state; decode(state, ...) -> Completion; generate = prefill + decode.
+    generate_branches continues one prompt with several suffixes (sectioned generation).
+    `capabilities` tells callers what the backend can do (device, kv_cache, batching, ...).
+    """
+    name = "base"
+    capabilities: Dict[str, Any] = {}
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        raise NotImplementedError
+
+    def count_tokens(self, text: str) -> int:
+        raise NotImplementedError
+
+    def prefill(self, prompt: str) -> Any:
+        raise NotImplementedError
+
+    def decode(self, state: Any, max_new_tokens: int, temperature: float, top_p: float,
+               cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        raise NotImplementedError
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: float, top_p: float,
+                 cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        return self.decode(self.prefill(prompt), max_new_tokens, temperature, top_p, cancel, stop)
+
+    def generate_branches(self, prompt: str, suffixes: List[str], max_new_tokens: int, temperature: float,
+                          top_p: float, cancel: Optional[CancelToken] = None,
+                          stop: Union[StopFn, List[StopFn], None] = None) -> List[Completion]:
+        """Decode prompt + suffix for every suffix (`stop`: one test, or one per suffix). Batching backends
+        share the prompt's KV cache and decode all branches together; the default runs them one after another."""
+        return [self.generate(prompt + s, max_new_tokens, temperature, top_p, cancel, st)
+                for s, st in zip(suffixes, branch_stops(stop, len(suffixes)))]
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """What this backend holds beyond its weights (KV caches, pools, replay data); see memdiag.py."""
+        return {}
+
+# ---------- deterministic stand-in
+
+_piece = re.compile(r"\s+|\w{1,4}|[^\w\s]", re.UNICODE)
+
+class ApproxTokenizer:
+    """BPE-like piece split (~4 chars per word piece) for token counts and timing without a vocab."""
+
+    def pieces(self, text: str) -> List[str]:
+        return _piece.findall(text)
+
+    def encode(self, text: str) -> List[int]:
+        return [zlib.crc32(p.encode("utf-8")) & 0xFFFF for p in self.pieces(text)]
+
+    def __len__(self) -> int:
+        return 0x10000
+
+_ASSISTANT_HEADER = "<|start_header_id|>assistant<|end_header_id|>\n"
+_OPEN_KEY_RE = re.compile(r'"([^"]+)":\s*$')
+_USER_RE = re.compile(r"<\|start_header_id\|>user<\|end_header_id\|>\n(.*?)\n?<\|eot_id\|>", re.S)
+
+def parse_user_prompt(user: str) -> Dict[str, Any]:
+    """Inverse of prompts.build_user_prompt (best effort)."""
+    def line(label: str) -> str:
+        m = re.search(rf"^- {re.escape(label)}: (.*)$", user, re.M)
+        return m.group(1).strip() if m else ""
+    def js(label: str) -> Any:
+        try:
+            return json.loads(line(label))
+        except Exception:
+            return {}
+    try:
+        budget = float(line("Budget (THB)") or 0)
+    except ValueError:
+        budget = 0.0
+    return {"industry": line("Industry") or "Brand", "audience": js("Audience"), "budget_thb": budget,
+            "objective": line("Objective") or "awareness", "constraints": js("Constraints")}
+
+def brief_key(brief: Dict[str, Any]) -> str:
+    """Canonical brief identity (600000 == 600000.0, key order ignored) for replay lookups."""
+    cons = brief.get("constraints") or {}
+    return json.dumps({
+        "industry": brief.get("industry"), "audience": brief.get("audience") or {},
+        "budget_thb": float(brief.get("budget_thb") or 0), "objective": brief.get("objective"),
+        "constraints": {k: v for k, v in cons.items() if v not in (None, [], "")},
+    }, sort_keys=True, ensure_ascii=False)
+
+def _continue_compact(plan: Dict[str, Any], head: str) -> str:
+    """Compact-format counterpart of StandInBackend.respond's continuation rules."""
+    from compact import encode_plan, decode_plan, FIELDS
+    full = encode_plan(plan)
+    if full.startswith(head):
+        return full[len(head):]
+    done, _, open_line = head.rpartition("\n")
+    try:
+        given = decode_plan(done)
+    except ValueError:
+        given = {}
+    rest = {k: v for k, v in plan.items() if k not in given}
+    tag = open_line.strip().rstrip(":")
+    if FIELDS.get(tag) in rest:
+        # an opened "A:" line (sectioned generation): that field's lines first
+        own = encode_plan({FIELDS[tag]: rest.pop(FIELDS[tag])})
+        return own[len(tag) + 1:] + ("\n" + encode_plan(rest) if rest else "")
+    return encode_plan(rest)
+
+class StandInBackend(InferenceBackend):
+    """
+    Replays the plan recorded for an identical brief in STANDIN_REPLAY_PATH files, or synthesizes one
+    from the brief (fallback.template_plan), and emits it piece by piece at a fixed per-token cost
+    so latency, truncation at max_new_tokens and cancellation behave like a real decode.
+    """
+    name = "standin"
+    capabilities = {"device": "cpu", "deterministic": True, "kv_cache": False, "batching": False,
+                    "weights": False}
+
+    def __init__(self, replay_path: Optional[str] = STANDIN_REPLAY_PATH,
+                 prefill_ms_per_token: float = STANDIN_PREFILL_MS,
+                 decode_ms_per_token: float = STANDIN_DECODE_MS):
+        self.tokenizer = ApproxTokenizer()
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self._replay: Dict[str, Dict[str, Any]] = {}
+        for path in (replay_path or "").split(","):
+            if not path.strip() or not os.path.exists(path.strip()):
+                continue
+            with open(path.strip(), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self._replay.setdefault(brief_key(rec["input"]), rec["output"])
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        # Llama 3.1 chat layout, as in scripts/*.build_chat
+        out = "<|begin_of_text|>"
+        for m in messages:
+            out += f"<|start_header_id|>{m['role']}<|end_header_id|>\n{m['content']}\n<|eot_id|>"
+        return out + _ASSISTANT_HEADER
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.pieces(text))
+
+    def memory_stats(self) -> Dict[str, Any]:
+        return {"replay_plans": len(self._replay)}
+
+    def respond(self, prompt: str) -> str:
+        from fallback import template_plan
+        m = _USER_RE.search(prompt)
+        user = m.group(1) if m else prompt
+        brief = parse_user_prompt(user)
+        plan = self._replay.get(brief_key(brief))
+        if plan is None:
+            plan = template_plan(brief)
+        # like a tuned model, emit only the fields the prompt asks for (PLAN_SOLVER drops the solved ones),
+        # in the encoding it asks for
+        asked = re.search(r"^(JSON fields|Compact plan lines) to produce: (.*)$", user, re.M)
+        if asked:
+            names = {f.strip().rstrip("[]{}") for f in asked.group(2).split(",")}
+            plan = {k: v for k, v in plan.items() if k in names}
+        head = prompt.rsplit(_ASSISTANT_HEADER, 1)[1] if _ASSISTANT_HEADER in prompt else ""
+        if asked and asked.group(1) == "Compact plan lines":
+            return _continue_compact(plan, head)
+        # text already in the assistant turn: an overflow continuation of this very plan,
+        # refine.fixed_prefix (kept fields) -> continue with the remaining keys, or such a prefix
+        # ending in an open key (sectioned generation) -> that key's value first
+        full = json.dumps(plan, ensure_ascii=False)
+        if head and full.startswith(head):
+            return full[len(head):]
+        if head.lstrip().startswith("{"):
+            body = head.strip().rstrip(",")
+            m = _OPEN_KEY_RE.search(body)
+            if m:
+                body = body[:m.start()].rstrip().rstrip(",")
+            try:
+                given = json.loads(body + "}") if body != "{" else {}
+            except ValueError:
+                given = {}
+            rest = {k: v for k, v in plan.items() if k not in given}
+            if m:
+                value = json.dumps(rest.pop(m.group(1), None), ensure_ascii=False)
+                return value + (", " + json.dumps(rest, ensure_ascii=False)[1:] if rest else "}")
+            return json.dumps(rest, ensure_ascii=False)[1:]
+        return full
+
+    def prefill(self, prompt: str) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        n = self.count_tokens(prompt)
+        if self.prefill_ms_per_token > 0:
+            time.sleep(n * self.prefill_ms_per_token / 1000.0)
+        return {"prompt": prompt, "prompt_tokens": n, "prefill_ms": int((time.perf_counter() - t0) * 1000)}
+
+    def decode(self, state: Dict[str, Any], max_new_tokens: int, temperature: float, top_p: float,
+               cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        pieces = self.tokenizer.pieces(self.respond(state["prompt"]))
+        t0 = time.perf_counter()
+        out: List[str] = []
+        finish = "stop"
+        for p in pieces:
+            if len(out) >= max_new_tokens:
+                finish = "length"
+                break
+            if cancel is not None and cancel.cancelled:
+                finish = "cancelled"
+                break
+            if self.decode_ms_per_token > 0:
+                time.sleep(self.decode_ms_per_token / 1000.0)
+            out.append(p)
+            if stop is not None and stop("".join(out)):
+                break
+        return Completion("".join(out), state["prompt_tokens"], len(out), state["prefill_ms"],
+                          int((time.perf_counter() - t0) * 1000), finish)
+
+    def generate_branches(self, prompt: str, suffixes: List[str], max_new_tokens: int, temperature: float,
+                          top_p: float, cancel: Optional[CancelToken] = None,
+                          stop: Union[StopFn, List[StopFn], None] = None) -> List[Completion]:
+        # one shared prefill, then the branches decode concurrently (one batched step costs one token time)
+        shared = self.prefill(prompt)
+        states = [{"prompt": prompt + s, "prompt_tokens": shared["prompt_tokens"] + self.count_tokens(s),
+                   "prefill_ms": shared["prefill_ms"]} for s in suffixes]
+        stops = branch_stops(stop, len(states))
+        with ThreadPoolExecutor(max_workers=max(1, len(states))) as pool:
+            return list(pool.map(lambda i: self.decode(states[i], max_new_tokens, temperature, top_p, cancel, stops[i]),
+                                 range(len(states))))
+
+# ---------- registry
+
+BACKENDS = ("hf", "hf-cpu", "onnx", "standin")
+LOADED_BACKENDS: List[InferenceBackend] = []  # everything get_backend has loaded, for memdiag.backend_stats
+
+def _loaded(backend: InferenceBackend) -> InferenceBackend:
+    LOADED_BACKENDS.append(backend)
+    return backend
+
+@lru_cache(maxsize=4)
+def get_backend(name: str = INFERENCE_BACKEND,
+                model_dir: str | None = MODEL_DIR,
+                local_files_only: bool = LOCAL_FILES_ONLY,
+                hf_token: str | None = HF_TOKEN,
+                num_threads: int | None = None,
+                adapter_dir: str | None = ADAPTER_DIR) -> InferenceBackend:
+    """Load (once per process and argument set) the backend selected by INFERENCE_BACKEND."""
+    if name == "standin":
+        return _loaded(StandInBackend())
+    if name == "onnx":
+        from onnx_backend import OnnxBackend
+        return _loaded(OnnxBackend(ONNX_DIR, ONNX_QUANT, num_threads=num_threads or ONNX_THREADS or None))
+    if name in ("hf", "hf-cpu"):
+        from hf_backend import HFBackend  # torch/transformers only when actually needed
+        from model_loader import load_llama, load_llama_cpu
+        if name == "hf":
+            tok, mdl = load_llama(model_dir=model_dir, local_files_only=local_files_only, hf_token=hf_token)
+        else:
+            tok, mdl = load_llama_cpu(model_dir=model_dir, local_files_only=local_files_only, hf_token=hf_token,
+                                      adapter_dir=adapter_dir, num_threads=num_threads)
+        if HF_STATIC_CACHE:
+            from static_cache import StaticCacheBackend
+            backend = StaticCacheBackend(tok, mdl, name)
+            backend.warmup(STATIC_WARMUP_BATCH_SIZES, STATIC_WARMUP_LENS)  # compile now, not on the first request
+            return _loaded(backend)
+        return _loaded(HFBackend(tok, mdl, name))
+    raise ValueError(f"Unknown INFERENCE_BACKEND {name!r}; expected one of {BACKENDS}")
@@ -0,0 +1,37 @@
+# Cooperative cancellation for in-flight generations (client disconnect / request deadline).
+from __future__ import annotations
+import threading, time
+from typing import Optional
+
+class GenerationCancelled(Exception):
+    """Raised when a generation stopped early; `reason` is 'disconnect' or 'deadline'."""
+    def __init__(self, reason: str, new_tokens: int = 0):
+        super().__init__(f"Generation cancelled ({reason}) after {new_tokens} new tokens")
+        self.reason = reason
+        self.new_tokens = new_tokens
+
+class CancelToken:
+    """Set by the HTTP layer, polled by the decode loop once per step."""
+
+    def __init__(self, timeout_s: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout_s if timeout_s else None
+        self.reason: Optional[str] = None
+        self._ev = threading.Event()
+
+    def cancel(self, reason: str) -> None:
+        if not self._ev.is_set():
+            self.reason = reason
+            self._ev.set()
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._ev.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._ev.is_set()
+
+    def raise_if_cancelled(self, new_tokens: int = 0) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason or "cancelled", new_tokens)
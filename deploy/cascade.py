@@ -0,0 +1,120 @@
+# Cascade serving (CASCADE_FAST_BACKEND): a small fast model drafts the plan and the LoRA-adapted 8B only sees what
+# the small model gets wrong. The fast tier's plan goes through the normal finish_plan path (solve, validate,
+# compliance repair) and is kept if it parsed, passes the schema and meets the brief's constraints; otherwise the
+# brief is regenerated from scratch on the full tier. A cheap router scores each brief's difficulty up front and
+# sends hard ones (many channel constraints, Thai, contradictory constraints) straight to the full tier.
+#
+# meta["cascade"] = {tier, hardness, features, escalation (None | hard | parse | schema | compliance | error),
+#                    fast_ms, fast_tokens}; meta["new_tokens"] counts both tiers.
+from __future__ import annotations
+import time
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (CASCADE_FAST_BACKEND, CASCADE_FAST_MODEL_DIR, CASCADE_HARD_SCORE, LOCAL_FILES_ONLY, HF_TOKEN,
+                    DEFAULT_SCHEMA, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P)
+from backends import InferenceBackend, get_backend
+from validators import validate_plan
+from length_model import language_of
+from cancellation import CancelToken, GenerationCancelled
+from generator import generate_plan_with
+from metrics import METRICS
+
+TIERS = ("fast", "full")
+
+def _norm(name: Any) -> str:
+    return str(name or "").strip().lower()
+
+def hardness(brief: Dict[str, Any]) -> Tuple[float, List[str]]:
+    """Router score in [0, 1] and the features that raised it; >= CASCADE_HARD_SCORE skips the fast tier."""
+    cons = brief.get("constraints") or {}
+    mandatory = {_norm(c) for c in cons.get("mandatory_channels") or []}
+    banned = {_norm(c) for c in cons.get("banned_channels") or []}
+    score, features = 0.0, []
+    if mandatory:
+        score += min(0.45, 0.15 * len(mandatory))
+        features.append(f"mandatory_channels={len(mandatory)}")
+    if banned:
+        score += min(0.3, 0.1 * len(banned))
+        features.append(f"banned_channels={len(banned)}")
+    if language_of(brief) == "th":
+        score += 0.2  # small students are much weaker at Thai copy
+        features.append("thai")
+    if mandatory & banned:
+        score = 1.0
+        features.append("conflicting_channels")
+    return round(min(1.0, score), 3), features
+
+def escalation_reason(plan: Dict[str, Any], meta: Dict[str, Any], schema: Dict[str, Any]) -> Optional[str]:
+    """Why a fast-tier result cannot be served (None = keep it)."""
+    if "plan_raw" in plan:
+        return "parse"
+    if not validate_plan(plan, schema)[0]:
+        return "schema"
+    if not (meta.get("compliance") or {}).get("ok", True):
+        return "compliance"
+    return None
+
+class Cascade:
+    def __init__(self, fast: InferenceBackend, hard_score: float = CASCADE_HARD_SCORE):
+        self.fast = fast
+        self.hard_score = hard_score
+
+    def generate_plan_with(self, backend: InferenceBackend,
+                           brief: Dict[str, Any],
+                           schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                           max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                           temperature: float = GEN_TEMPERATURE,
+                           top_p: float = GEN_TOP_P,
+                           cancel: Optional[CancelToken] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Same contract as generator.generate_plan_with; `backend` is the full tier."""
+        t0 = time.time()
+        score, features = hardness(brief)
+        METRICS.observe("cascade_hardness", score)
+        info: Dict[str, Any] = {"tier": "fast", "hardness": score, "features": features, "escalation": None,
+                                "fast_ms": 0, "fast_tokens": 0}
+        warnings: List[str] = []
+        if score >= self.hard_score:
+            reason = "hard"
+        else:
+            try:
+                plan, meta = generate_plan_with(self.fast, brief, schema, max_new_tokens, temperature, top_p, cancel)
+            except GenerationCancelled:
+                raise
+            except Exception as e:  # a broken fast tier must not take the service down with it
+                plan, meta = {"plan_raw": ""}, {"elapsed_ms": int((time.time() - t0) * 1000), "new_tokens": 0}
+                warnings.append(f"Fast tier failed: {e}")
+            info["fast_ms"], info["fast_tokens"] = meta["elapsed_ms"], meta["new_tokens"]
+            reason = "error" if warnings else escalation_reason(plan, meta, schema)
+            if reason is None:
+                meta["backend"] = f"cascade-fast:{meta.get('backend', self.fast.name)}"  # the API reports it instead of the 8B's id
+                meta["cascade"] = info
+                self._record(info, meta["elapsed_ms"])
+                return plan, meta
+            METRICS.inc("cascade_fast_wasted_tokens_total", info["fast_tokens"])
+
+        METRICS.inc("cascade_escalations_total", reason=reason)
+        info["tier"], info["escalation"] = "full", reason
+        try:
+            plan, meta = generate_plan_with(backend, brief, schema, max_new_tokens, temperature, top_p, cancel)
+        except GenerationCancelled as e:
+            e.new_tokens += info["fast_tokens"]
+            raise
+        meta["new_tokens"] += info["fast_tokens"]
+        meta["warnings"] = warnings + meta.get("warnings", [])
+        meta["elapsed_ms"] = int((time.time() - t0) * 1000)
+        meta["cascade"] = info
+        self._record(info, meta["elapsed_ms"])
+        return plan, meta
+
+    @staticmethod
+    def _record(info: Dict[str, Any], elapsed_ms: int) -> None:
+        METRICS.inc("cascade_requests_total", tier=info["tier"])
+        METRICS.observe("cascade_latency_ms", elapsed_ms, tier=info["tier"])
+
+@lru_cache(maxsize=1)
+def get_cascade() -> Cascade:
+    """The configured cascade; loads the fast tier (without the 8B's LoRA adapter) on first use."""
+    fast = get_backend(CASCADE_FAST_BACKEND, model_dir=CASCADE_FAST_MODEL_DIR, local_files_only=LOCAL_FILES_ONLY,
+                       hf_token=HF_TOKEN, adapter_dir=None)
+    return Cascade(fast)
@@ -0,0 +1,146 @@
+# Compact, line-oriented plan encoding (OUTPUT_FORMAT=compact): one-letter tags instead of JSON keys and
+# no per-channel "name"/"activation"/"kpis" keys, so the model decodes fewer tokens per plan.
+#
+#   T: Wing It                              concept_title
+#   I: Embracing the imperfections ...      big_idea
+#   M: Life's too short ...                 key_message
+#   C: Facebook | Paid + organic posts      channels[] item (name | activation [| kpis as JSON])
+#   A: Video: 60-second ads ...             assets[] item
+#   W: 12                                   timeline_weeks
+#   B: Facebook | 0.3                       budget_split[] item
+#   K: awareness | 20                       kpis entry (key | value)
+#
+# Anything the compact form cannot carry exactly is written as JSON: "X= <json>" for one item of a list
+# field, "@<field>= <json>" for a whole field (empty lists, odd shapes, fields outside the schema).
+# encode_plan / decode_plan round-trip losslessly, key order included.
+from __future__ import annotations
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import OUTPUT_FORMAT, PLAN_SOLVER
+from planner import SOLVED_FIELDS
+
+TAGS = {"concept_title": "T", "big_idea": "I", "key_message": "M", "channels": "C", "assets": "A",
+        "timeline_weeks": "W", "budget_split": "B", "kpis": "K"}
+FIELDS = {t: k for k, t in TAGS.items()}
+LIST_FIELDS = ("channels", "assets", "budget_split")
+SEP = " | "
+
+def _enc(v: Any) -> str:
+    """Strings go raw unless that would be ambiguous; everything else as JSON."""
+    if isinstance(v, str) and v and v == v.strip() and "\n" not in v and SEP.strip() not in v:
+        try:
+            json.loads(v)
+        except ValueError:
+            return v
+    return json.dumps(v, ensure_ascii=False)
+
+def _dec(s: str) -> Any:
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s
+
+def _item(field: str, it: Any) -> Optional[str]:
+    """Compact payload of one list item / kpi entry, or None if it needs JSON."""
+    if field == "channels":
+        if isinstance(it, dict) and list(it)[:2] == ["name", "activation"] and set(it) <= {"name", "activation", "kpis"} \
+                and all(isinstance(it[k], str) for k in ("name", "activation")) and isinstance(it.get("kpis", {}), dict):
+            parts = [_enc(it["name"]), _enc(it["activation"])]
+            if "kpis" not in it or any(SEP in p for p in parts):
+                return None
+            if it["kpis"]:
+                parts.append(json.dumps(it["kpis"], ensure_ascii=False))
+            return SEP.join(parts)
+        return None
+    if field == "budget_split":
+        if isinstance(it, list) and len(it) == 2 and isinstance(it[0], str):
+            return _enc(it[0]) + SEP + json.dumps(it[1])
+        return None
+    if field == "assets":
+        return _enc(it)
+    return None
+
+def encode_plan(plan: Dict[str, Any]) -> str:
+    lines: List[str] = []
+    for k, v in plan.items():
+        tag = TAGS.get(k)
+        if tag is None:
+            lines.append(f"@{k}= {json.dumps(v, ensure_ascii=False)}")
+        elif k in LIST_FIELDS:
+            if not isinstance(v, list) or not v:
+                lines.append(f"@{k}= {json.dumps(v, ensure_ascii=False)}")
+                continue
+            for it in v:
+                c = _item(k, it)
+                lines.append(f"{tag}: {c}" if c is not None else f"{tag}= {json.dumps(it, ensure_ascii=False)}")
+        elif k == "kpis":
+            if not isinstance(v, dict) or not v:
+                lines.append(f"@{k}= {json.dumps(v, ensure_ascii=False)}")
+                continue
+            for kk, vv in v.items():
+                ok = isinstance(kk, str) and _enc(kk) == kk
+                lines.append(f"{tag}: {kk}{SEP}{_enc(vv)}" if ok else f"{tag}= {json.dumps({kk: vv}, ensure_ascii=False)}")
+        else:
+            lines.append(f"{tag}: {_enc(v)}")
+    return "\n".join(lines)
+
+def _parse_line(line: str) -> Tuple[str, bool, str]:
+    """-> (field, is_json, payload)"""
+    if line.startswith("@"):
+        name, sep, rest = line[1:].partition("= ")
+        if not sep:
+            raise ValueError(f"bad field line: {line[:60]!r}")
+        return name, True, rest
+    if len(line) >= 2 and line[0] in FIELDS and line[1] in ":=":
+        return FIELDS[line[0]], line[1] == "=", line[2:].strip()
+    raise ValueError(f"bad compact line: {line[:60]!r}")
+
+def decode_plan(text: str) -> Dict[str, Any]:
+    """Inverse of encode_plan; raises ValueError on malformed input. Blank lines are ignored."""
+    plan: Dict[str, Any] = {}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        field, is_json, payload = _parse_line(line)
+        if line.startswith("@"):
+            plan[field] = json.loads(payload)
+        elif field in LIST_FIELDS:
+            items = plan.setdefault(field, [])
+            if is_json:
+                items.append(json.loads(payload))
+            elif field == "channels":
+                parts = payload.split(SEP, 2)
+                if len(parts) not in (2, 3):
+                    raise ValueError(f"bad channel line: {line[:60]!r}")
+                items.append({"name": _dec(parts[0]), "activation": _dec(parts[1]),
+                              "kpis": json.loads(parts[2]) if len(parts) == 3 else {}})
+            elif field == "budget_split":
+                label, sep, frac = payload.rpartition(SEP)
+                if not sep:
+                    raise ValueError(f"bad budget line: {line[:60]!r}")
+                items.append([_dec(label), json.loads(frac)])
+            else:
+                items.append(_dec(payload))
+        elif field == "kpis":
+            kpis = plan.setdefault(field, {})
+            if is_json:
+                kpis.update(json.loads(payload))
+            else:
+                key, sep, val = payload.partition(SEP)
+                if not sep:
+                    raise ValueError(f"bad kpi line: {line[:60]!r}")
+                kpis[key] = _dec(val)
+        else:
+            plan[field] = json.loads(payload) if is_json else _dec(payload)
+    return plan
+
+def training_target(output: Any, fmt: str = OUTPUT_FORMAT, solver: bool = PLAN_SOLVER) -> str:
+    """Fine-tuning target for a teacher plan, in the encoding the model is served with (scripts/train_lora.py,
+    scripts/distill_student.py). With the solver on, its fields are left out. Outputs already converted by
+    scripts/convert_compact.py (strings) are used as they are."""
+    if isinstance(output, str):
+        return output
+    plan = {k: v for k, v in output.items() if not (solver and k in SOLVED_FIELDS)}
+    return encode_plan(plan) if fmt == "compact" else json.dumps(plan, ensure_ascii=False)
@@ -0,0 +1,109 @@
+# Brief-constraint compliance: mandatory channels present, banned channels absent, budget_split
+# labels matching the channels, timeline within bounds. Violations are repaired by re-decoding only
+# the offending fields (refine.refine_plan_with) instead of regenerating the whole plan.
+from __future__ import annotations
+import re, string
+from typing import Dict, Any, List, Optional
+
+from config import COMPLIANCE_REPAIR, TIMELINE_MIN_WEEKS, TIMELINE_MAX_WEEKS, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P
+from cancellation import CancelToken
+from metrics import METRICS
+
+_PUNCT = re.compile(f"[{re.escape(string.punctuation)}]+")  # ASCII only: Thai vowel / tone marks are kept
+
+# rule -> plan fields to re-decode when it fails (budget_split follows the channel list)
+RULE_FIELDS = {
+    "mandatory_missing": ["channels", "budget_split"],
+    "banned_present": ["channels", "budget_split"],
+    "budget_split_mismatch": ["budget_split"],
+    "timeline_out_of_bounds": ["timeline_weeks"],
+}
+
+def _norm(name: Any) -> str:
+    """Channel name for comparison: case, spacing and punctuation ("Line-OA", "Twitter / X") do not count."""
+    return " ".join(_PUNCT.sub(" ", str(name or "").lower()).split())
+
+def _channel_names(plan: Dict[str, Any]) -> List[str]:
+    out = []
+    for c in plan.get("channels") or []:
+        out.append(c.get("name") if isinstance(c, dict) else c)
+    return [str(c) for c in out if c]
+
+def check_compliance(plan: Dict[str, Any], brief: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return violations as [{"rule", "field", "detail"}]; empty list = compliant."""
+    cons = brief.get("constraints") or {}
+    names = _channel_names(plan)
+    have = {_norm(c) for c in names}
+    split = [p[0] for p in plan.get("budget_split") or [] if isinstance(p, (list, tuple)) and p]
+    out: List[Dict[str, Any]] = []
+
+    missing = [c for c in cons.get("mandatory_channels") or [] if _norm(c) not in have]
+    if missing:
+        out.append({"rule": "mandatory_missing", "field": "channels", "detail": missing})
+    banned = {_norm(c) for c in cons.get("banned_channels") or []}
+    present = [c for c in names + split if _norm(c) in banned]
+    if present:
+        out.append({"rule": "banned_present", "field": "channels", "detail": sorted(set(present))})
+    if {_norm(c) for c in split} != have:
+        out.append({"rule": "budget_split_mismatch", "field": "budget_split",
+                    "detail": {"not_in_channels": [c for c in split if _norm(c) not in have],
+                               "unfunded": [c for c in names if _norm(c) not in {_norm(s) for s in split}]}})
+    weeks = plan.get("timeline_weeks")
+    if not isinstance(weeks, int) or not TIMELINE_MIN_WEEKS <= weeks <= TIMELINE_MAX_WEEKS:
+        out.append({"rule": "timeline_out_of_bounds", "field": "timeline_weeks",
+                    "detail": {"value": weeks, "min": TIMELINE_MIN_WEEKS, "max": TIMELINE_MAX_WEEKS}})
+    return out
+
+def repair_fields(violations: List[Dict[str, Any]]) -> List[str]:
+    fields: List[str] = []
+    for v in violations:
+        fields += [f for f in RULE_FIELDS[v["rule"]] if f not in fields]
+    return fields
+
+def check_and_repair(backend, brief: Dict[str, Any], plan: Dict[str, Any], meta: Dict[str, Any],
+                     schema: Dict[str, Any],
+                     max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                     temperature: float = GEN_TEMPERATURE,
+                     top_p: float = GEN_TOP_P,
+                     cancel: Optional[CancelToken] = None,
+                     repair: bool = COMPLIANCE_REPAIR) -> Dict[str, Any]:
+    """
+    Check `plan`; on violations re-decode only the offending fields once (if `repair`).
+    Records meta["compliance"] = {ok, first_pass, first_violations, violations, repaired_fields}
+    and returns the (possibly repaired) plan.
+    """
+    violations = check_compliance(plan, brief)
+    first_ok = not violations
+    for v in violations:
+        METRICS.inc("compliance_violations_total", rule=v["rule"])
+    info: Dict[str, Any] = {"first_pass": first_ok, "first_violations": [v["rule"] for v in violations],
+                            "violations": violations, "repaired_fields": []}
+
+    if violations and repair:
+        from refine import refine_plan_with  # refine imports generator, which imports this module
+        fields = repair_fields(violations)
+        fixed, rmeta = refine_plan_with(backend, brief, plan, fields, schema, max_new_tokens, temperature,
+                                        top_p, cancel, repair=False)
+        meta["attempts"] = meta.get("attempts", 1) + 1
+        meta["new_tokens"] = meta.get("new_tokens", 0) + rmeta.get("new_tokens", 0)
+        info["repaired_fields"] = fields
+        info["repair_tokens"] = rmeta.get("new_tokens", 0)
+        if "plan_raw" not in fixed:
+            after = check_compliance(fixed, brief)
+            METRICS.inc("compliance_repairs_total", outcome="fixed" if not after else "still_violating")
+            if len(after) < len(violations):
+                plan, violations = fixed, after
+                if "budget" in rmeta:
+                    meta["budget"] = rmeta["budget"]
+        else:
+            METRICS.inc("compliance_repairs_total", outcome="parse_failed")
+        info["violations"] = violations
+
+    info["ok"] = not violations
+    if violations:
+        meta.setdefault("warnings", []).append(
+            "Constraint violations: " + ", ".join(sorted({v["rule"] for v in violations})))
+    METRICS.observe("compliance_first_pass", 1.0 if first_ok else 0.0)
+    METRICS.observe("compliance_final_pass", 1.0 if not violations else 0.0)
+    meta["compliance"] = info
+    return plan
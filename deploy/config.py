@@ -1,7 +1,7 @@
 # Project-wide constants and defaults.
 import os
-# Hard lock to Meta-Llama-3.1-8B-Instruct (HF gated repo)
-MODEL_ID = "meta-llama/Meta-Llama-3.1-8B-Instruct"
+# Meta-Llama-3.1-8B-Instruct (HF gated repo); BASE_MODEL overrides it, as in the training / eval scripts
+MODEL_ID = os.getenv("BASE_MODEL", "meta-llama/Meta-Llama-3.1-8B-Instruct").strip()
 
 # Optional local directory to load the model from (offline). If set, this must contain the exact model.
 MODEL_DIR = os.getenv("MODEL_DIR", "").strip() or None
@@ -9,14 +9,133 @@ MODEL_DIR = os.getenv("MODEL_DIR", "").strip() or None
 # Hugging Face token for gated access. Must include "read" and "public gated repositories".
 HF_TOKEN = os.getenv("HF_TOKEN", "").strip() or None
 
+# LoRA adapter trained by scripts/train_lora.py
+ADAPTER_DIR = os.getenv("ADAPTER_DIR", "outputs/lora-llama31-8b")
+
 # Force offline mode (no HF calls). Set to "1" to require local files only.
 LOCAL_FILES_ONLY = os.getenv("LOCAL_FILES_ONLY", "0") in ("1","true","True")
 
+# Inference backend (see backends.py): "hf" = GPU NF4 + LoRA (default), "hf-cpu" = CPU weights with the
+# adapter merged, "onnx" = exported graph on ONNX Runtime (CPU), "standin" = deterministic replay/synthesis
+# with simulated token timing (no GPU, no weights).
+INFERENCE_BACKEND   = os.getenv("INFERENCE_BACKEND", "hf").strip().lower()
+STANDIN_REPLAY_PATH = os.getenv("STANDIN_REPLAY_PATH", "data/train_synth_clean.jsonl,data/val.jsonl")  # comma-separated
+STANDIN_PREFILL_MS  = float(os.getenv("STANDIN_PREFILL_MS", "0.2"))   # per prompt token
+STANDIN_DECODE_MS   = float(os.getenv("STANDIN_DECODE_MS", "25"))     # per generated token
+
+# "onnx" backend: directory written by scripts/export_onnx.py; ONNX_QUANT=int8 loads model.int8.onnx.
+ONNX_DIR     = os.getenv("ONNX_DIR", "outputs/onnx-llama31-8b")
+ONNX_QUANT   = os.getenv("ONNX_QUANT", "").strip().lower()
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default (all physical cores)
+
+# Cascade serving (cascade.py): with CASCADE_FAST_BACKEND set, a small fast model (e.g. a student written by
+# scripts/distill_student.py to CASCADE_FAST_MODEL_DIR) drafts every plan first. Plans that do not parse, fail the
+# schema or still violate the brief's constraints are regenerated on INFERENCE_BACKEND, as are briefs the router
+# scores at or above CASCADE_HARD_SCORE (0..1), which skip the fast tier.
+CASCADE_FAST_BACKEND   = os.getenv("CASCADE_FAST_BACKEND", "").strip().lower() or None
+CASCADE_FAST_MODEL_DIR = os.getenv("CASCADE_FAST_MODEL_DIR", "").strip() or None
+CASCADE_HARD_SCORE     = float(os.getenv("CASCADE_HARD_SCORE", "0.6"))
+
 # Generation defaults (tune as desired)
 GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", "1024"))
 GEN_TEMPERATURE    = float(os.getenv("GEN_TEMPERATURE", "0.7"))
 GEN_TOP_P          = float(os.getenv("GEN_TOP_P", "0.9"))
 
+# Length-aware generation (length_model.py, fitted by scripts/fit_length_model.py): the first decode pass gets a
+# per-brief budget instead of GEN_MAX_NEW_TOKENS and continues (up to GEN_MAX_NEW_TOKENS in total) if it overflows.
+LENGTH_MODEL_PATH   = os.getenv("LENGTH_MODEL_PATH", "data/length_model.json")
+ADAPTIVE_MAX_TOKENS = os.getenv("ADAPTIVE_MAX_TOKENS", "1") in ("1","true","True")
+# Per-client quotas (quotas.py): JSON mapping X-API-Key values to clients with a weight, a generated-token quota
+# (token bucket) and queue caps; see quotas.py for the format. Unset: one unlimited anonymous client.
+CLIENTS_PATH = os.getenv("CLIENTS_PATH", "").strip() or None
+# Admission queue order: "fifo" (default), "sjf" = shortest predicted output first, aged so long jobs cannot starve
+# (a waiting request's cost drops by SCHED_AGING_TOKENS_PER_S for every second it waits; opt-in: it cuts refine
+# latency but raised overall and generate p95 in scripts/bench_scheduling.py), or "wfq" = weighted-fair across clients by
+# predicted tokens (the default when CLIENTS_PATH is set).
+SCHED_POLICY             = os.getenv("SCHED_POLICY", "wfq" if CLIENTS_PATH else "fifo").strip().lower()
+SCHED_AGING_TOKENS_PER_S = float(os.getenv("SCHED_AGING_TOKENS_PER_S", "50"))
+
+# Opt-in HF fast path (static_cache.py, hf / hf-cpu backends): preallocated StaticCache + torch.compile'd decode
+# step. Cache lengths round up to STATIC_CACHE_BUCKET; graphs for the listed batch sizes x cache lengths are
+# compiled when the backend loads.
+HF_STATIC_CACHE           = os.getenv("HF_STATIC_CACHE", "0") in ("1","true","True")
+STATIC_CACHE_BUCKET       = int(os.getenv("STATIC_CACHE_BUCKET", "512"))
+STATIC_WARMUP_BATCH_SIZES = [int(x) for x in os.getenv("STATIC_WARMUP_BATCH_SIZES", "1").split(",") if x.strip()]
+STATIC_WARMUP_LENS        = [int(x) for x in os.getenv("STATIC_WARMUP_LENS", "1024,1536").split(",") if x.strip()]
+
+# Brief-constraint compliance (compliance.py): violating plans get their offending fields re-decoded once.
+# Cost: with PLAN_SOLVER off, budget_split labels that do not match the channel list (ignoring case, spacing and
+# punctuation) are the common violation, 429 of the 2462 shipped plans (~17%); each costs a second, budget_split-only
+# decode. PLAN_SOLVER=1 computes budget_split from the channels, so it cannot occur; COMPLIANCE_REPAIR=0 only checks.
+COMPLIANCE_REPAIR  = os.getenv("COMPLIANCE_REPAIR", "1") in ("1","true","True")
+TIMELINE_MIN_WEEKS = int(os.getenv("TIMELINE_MIN_WEEKS", "1"))
+TIMELINE_MAX_WEEKS = int(os.getenv("TIMELINE_MAX_WEEKS", "52"))
+
+# Plan output encoding: "json" (default) or "compact" = one tagged line per field / list item (compact.py), fewer
+# decode tokens; needs an adapter trained with OUTPUT_FORMAT=compact (scripts/train_lora.py).
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json").strip().lower()
+
+# Sectioned generation (sections.py): decode the concept core (title, big idea, key message, channels) first, then
+# the remaining fields as parallel branches in one batch that shares the core's KV cache. Lower wall-clock per plan.
+SECTIONED_GENERATION = os.getenv("SECTIONED_GENERATION", "0") in ("1","true","True")
+
+# Deterministic budget / timeline solver (planner.py): the model writes the creative fields and picks the channels;
+# budget_split, timeline_weeks and the THB breakdown per channel and week are computed. Flights are shortened so no
+# week spends less than PLANNER_MIN_WEEKLY_THB. Off by default: it changes the prompt and the expected output, so
+# turn it on only with an adapter retrained with PLAN_SOLVER=1 (scripts/train_lora.py target() drops those fields).
+PLAN_SOLVER            = os.getenv("PLAN_SOLVER", "0") in ("1","true","True")
+PLANNER_MIN_WEEKLY_THB = float(os.getenv("PLANNER_MIN_WEEKLY_THB", "25000"))
+
+# Admission control for the API: concurrent generations, waiting requests, max wait (s).
+# Beyond that a request is shed: SHED_MODE=reject -> 429 + Retry-After, SHED_MODE=degrade -> template plan.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "1"))
+ADMISSION_MAX_QUEUE      = int(os.getenv("ADMISSION_MAX_QUEUE", "8"))
+ADMISSION_MAX_WAIT_S     = float(os.getenv("ADMISSION_MAX_WAIT_S", "30"))
+SHED_MODE                = os.getenv("SHED_MODE", "reject").strip().lower()
+
+# Split serving: if set, API workers forward generation to model_server.py over this Unix socket
+# instead of loading the model themselves, so API_WORKERS > 1 does not duplicate the weights.
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "").strip() or None
+API_WORKERS         = int(os.getenv("API_WORKERS", "1"))
+
+# CPU replica-pool mode for model_server.py: K > 0 starts K CPU replicas, each pinned to its own
+# core set / NUMA node with its own torch thread pool (see replica_pool.py).
+CPU_REPLICAS = int(os.getenv("CPU_REPLICAS", "0"))
+
+# Admin diagnostics (memdiag.py): GET /debug/memory and POST /debug/memory/tracemalloc are served only with
+# DEBUG_ENDPOINTS=1, and then require the X-Admin-Token header when ADMIN_TOKEN is set. DEBUG_TRACEMALLOC_FRAMES > 0
+# starts tracemalloc at startup with that traceback depth (costs CPU on every allocation). MEMORY_META=1 adds the
+# request's RSS / peak memory to the response (meta["memory"]).
+DEBUG_ENDPOINTS          = os.getenv("DEBUG_ENDPOINTS", "0") in ("1","true","True")
+ADMIN_TOKEN              = os.getenv("ADMIN_TOKEN", "").strip() or None
+DEBUG_TRACEMALLOC_FRAMES = int(os.getenv("DEBUG_TRACEMALLOC_FRAMES", "0"))
+MEMORY_META              = os.getenv("MEMORY_META", "0") in ("1","true","True")
+
+# Audit log (audit_log.py): with AUDIT_LOG_DIR set, every API request (brief, plan, sampling parameters, timings) is
+# queued and written by a background thread as gzip'd JSONL segments of ~AUDIT_SEGMENT_MB. Full queue:
+# AUDIT_OVERFLOW=drop (default) discards the record, =block makes the handler wait up to AUDIT_BLOCK_TIMEOUT_S.
+AUDIT_LOG_DIR         = os.getenv("AUDIT_LOG_DIR", "").strip() or None
+AUDIT_QUEUE_SIZE      = int(os.getenv("AUDIT_QUEUE_SIZE", "1000"))
+AUDIT_OVERFLOW        = os.getenv("AUDIT_OVERFLOW", "drop").strip().lower()
+AUDIT_BLOCK_TIMEOUT_S = float(os.getenv("AUDIT_BLOCK_TIMEOUT_S", "1.0"))
+AUDIT_BATCH           = int(os.getenv("AUDIT_BATCH", "64"))
+AUDIT_FLUSH_S         = float(os.getenv("AUDIT_FLUSH_S", "1.0"))
+AUDIT_SEGMENT_MB      = float(os.getenv("AUDIT_SEGMENT_MB", "64"))
+
+# Plan store (plan_store.py): with PLAN_STORE_PATH set (e.g. data/plans.db) the API keeps every generated plan in
+# SQLite, indexed by brief fields and full text, and serves GET /plans/search. scripts/ingest_plans.py bulk-loads JSONL.
+# The FTS tokenizer splits on spaces; "trigram" also matches inside unsegmented (e.g. Thai) text, at ~3x index size.
+PLAN_STORE_PATH      = os.getenv("PLAN_STORE_PATH", "").strip() or None
+PLAN_STORE_TOKENIZER = os.getenv("PLAN_STORE_TOKENIZER", "unicode61 remove_diacritics 2")
+
+# Bulk export (export.py, scripts/export_plans.py, POST /plans/export): CSV / XLSX rows carry the first
+# EXPORT_MAX_CHANNELS channels and EXPORT_MAX_KPIS plan KPIs as flat columns. EXPORT_WORKERS processes render large
+# CLI exports (0 = one per core); the API renders in its threadpool and refuses uploads over EXPORT_MAX_UPLOAD_MB (413).
+EXPORT_MAX_CHANNELS  = int(os.getenv("EXPORT_MAX_CHANNELS", "8"))
+EXPORT_MAX_KPIS      = int(os.getenv("EXPORT_MAX_KPIS", "6"))
+EXPORT_WORKERS       = int(os.getenv("EXPORT_WORKERS", "0"))
+EXPORT_MAX_UPLOAD_MB = float(os.getenv("EXPORT_MAX_UPLOAD_MB", "256"))
+
 # Default JSON schema for a campaign plan
 DEFAULT_SCHEMA = {
   "$schema": "https://json-schema.org/draft/2020-12/schema",
@@ -65,4 +184,8 @@ SYSTEM_PROMPT = (
     "You are a senior marketing strategist for Thailand.\n"
     "Return ONLY a single JSON object that strictly follows the provided schema.\n"
     "No prose, no markdown — JSON only.\n"
+) if OUTPUT_FORMAT != "compact" else (
+    "You are a senior marketing strategist for Thailand.\n"
+    "Return ONLY the plan in compact line format: one tagged line per field or list item.\n"
+    "No prose, no markdown.\n"
 )
\ No newline at end of file
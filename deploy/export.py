@@ -0,0 +1,372 @@
+# Bulk export of plans (JSONL: training data, audit segments, plan-store hits) to Markdown, CSV or XLSX.
+# Records are rendered in chunks by precompiled Jinja2 templates (Markdown, XLSX sheet rows) and csv.writer (CSV),
+# and written as they come, so memory stays flat however large the input is. Chunks can be rendered in worker
+# processes (export_lines(workers=N)); the output keeps the input order.
+#
+# CSV / XLSX have one row per plan with fixed, flattened columns: channel_<i>_{name,activation,share,thb,kpis}
+# for the first EXPORT_MAX_CHANNELS channels and kpi_<i>_{name,target} for the first EXPORT_MAX_KPIS KPIs, so the
+# header is known before the first record. n_channels / n_kpis show when a plan had more.
+from __future__ import annotations
+import csv, io, json, re, time, zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from jinja2 import Environment
+
+FORMATS = ("md", "csv", "xlsx")
+MEDIA_TYPES = {
+    "md": "text/markdown; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+XLSX_MAX_ROWS = 1_048_576  # per sheet, header included; longer exports continue on the next sheet
+
+# ---------- record shapes
+
+def split_record(rec: Any) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """(brief, plan) from {"input", "output"}, {"brief", "plan"} (plan store) or a bare plan; plan None = skip."""
+    if not isinstance(rec, dict):
+        return None, None
+    if "output" in rec or "input" in rec:
+        brief, plan = rec.get("input"), rec.get("output")
+    elif "plan" in rec:
+        brief, plan = rec.get("brief"), rec.get("plan")
+    else:
+        brief, plan = None, rec
+    return (brief if isinstance(brief, dict) else None), (plan if isinstance(plan, dict) else None)
+
+def _view(plan: Dict[str, Any], brief: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """The plan with every list / mapping coerced to the shape the templates and flat rows expect."""
+    budget = (brief or {}).get("budget_thb")
+    budget = budget if isinstance(budget, (int, float)) and not isinstance(budget, bool) else None
+    channels = []
+    for ch in plan.get("channels") or []:
+        ch = ch if isinstance(ch, dict) else {"name": str(ch)}
+        kpis = ch.get("kpis") if isinstance(ch.get("kpis"), dict) else {}
+        channels.append({"name": ch.get("name", ""), "activation": ch.get("activation", ""), "kpis": list(kpis.items())})
+    split = []
+    for item in plan.get("budget_split") or []:
+        if isinstance(item, (list, tuple)) and len(item) == 2 and isinstance(item[1], (int, float)):
+            split.append({"name": str(item[0]), "share": item[1],
+                          "thb": round(item[1] * budget) if budget is not None else None})
+    kpis = plan.get("kpis") if isinstance(plan.get("kpis"), dict) else {}
+    return {"plan": plan, "channels": channels, "assets": list(plan.get("assets") or []), "budget_split": split,
+            "kpis": list(kpis.items()), "brief": brief}
+
+# ---------- templates (compiled once per process, at import)
+
+_ENV = Environment(trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=False, autoescape=False)
+_XML_ENV = Environment(trim_blocks=True, lstrip_blocks=True, autoescape=True)
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_XML_ENV.filters["xmlsafe"] = lambda v: _XML_ILLEGAL.sub("", str(v))
+
+# same layout as the Streamlit download (app.py); `brief` adds a summary line and THB per channel
+MARKDOWN = _ENV.from_string("""\
+# {{ plan.get('concept_title', '(no title)') }}
+{{ plan.get('big_idea', '') }}
+**Key message:** {{ plan.get('key_message', '') }}
+{% if brief %}
+_{{ brief.get('industry', '') }} · {{ brief.get('objective', '') }} · age {{ (brief.get('audience') or {}).get('age', '?') }}\
+{% if brief.get('budget_thb') is number %} · {{ '{:,.0f}'.format(brief.budget_thb) }} THB{% endif %}_
+{% endif %}
+
+## Channels & Activations
+{% for ch in channels %}
+- **{{ ch.name }}** — {{ ch.activation }}{{ '  ' }}
+  KPIs: {{ ch.kpis | map('join', ': ') | join(', ') }}
+{% endfor %}
+
+## Assets
+{% for a in assets %}
+- {{ a }}
+{% endfor %}
+
+## Budget Split
+{% for b in budget_split %}
+- {{ b.name }}: {{ (b.share * 100) | int }}%{% if brief and b.thb is not none %} ({{ '{:,}'.format(b.thb) }} THB){% endif %}
+
+{% endfor %}
+
+## Timeline
+- {{ plan.get('timeline_weeks', '?') }} weeks
+
+## KPIs
+{% for k, v in kpis %}
+- {{ k }}: {{ v }}
+{% endfor %}""")
+
+XLSX_ROW = _XML_ENV.from_string("""\
+<row>{% for v in cells %}{% if v is none or v == '' %}<c/>{% elif v is number %}<c><v>{{ v }}</v></c>\
+{% else %}<c t="inlineStr"><is><t xml:space="preserve">{{ v | xmlsafe }}</t></is></c>{% endif %}{% endfor %}</row>
+""")
+
+def render_markdown(plan: Dict[str, Any], brief: Optional[Dict[str, Any]] = None) -> str:
+    return MARKDOWN.render(**_view(plan, brief)).rstrip("\n")
+
+# ---------- flat rows (CSV / XLSX)
+
+BRIEF_COLUMNS = ["industry", "objective", "age", "geo", "budget_thb", "brand_tone", "language"]
+PLAN_COLUMNS = ["concept_title", "big_idea", "key_message", "timeline_weeks", "assets", "n_channels", "n_kpis"]
+
+def header(max_channels: int, max_kpis: int) -> List[str]:
+    cols = ["record"] + BRIEF_COLUMNS + PLAN_COLUMNS
+    for i in range(1, max_channels + 1):
+        cols += [f"channel_{i}_{k}" for k in ("name", "activation", "share", "thb", "kpis")]
+    for i in range(1, max_kpis + 1):
+        cols += [f"kpi_{i}_name", f"kpi_{i}_target"]
+    return cols
+
+def flat_row(n: int, plan: Dict[str, Any], brief: Optional[Dict[str, Any]], max_channels: int,
+             max_kpis: int) -> List[Any]:
+    """One row under header(): brief fields, plan fields, then each channel with its share / THB of the budget."""
+    v = _view(plan, brief)
+    b = brief or {}
+    aud, cons = b.get("audience") or {}, b.get("constraints") or {}
+    row: List[Any] = [n, b.get("industry"), b.get("objective"), aud.get("age"), aud.get("geo"), b.get("budget_thb"),
+                      cons.get("brand_tone"), b.get("language"),
+                      plan.get("concept_title"), plan.get("big_idea"), plan.get("key_message"), plan.get("timeline_weeks"),
+                      " | ".join(str(a) for a in v["assets"]), len(v["channels"]), len(v["kpis"])]
+    shares = {s["name"].lower(): s for s in v["budget_split"]}
+    for i in range(max_channels):
+        if i < len(v["channels"]):
+            ch = v["channels"][i]
+            s = shares.get(str(ch["name"]).lower(), {})
+            row += [ch["name"], ch["activation"], s.get("share"), s.get("thb"),
+                    "; ".join(f"{k}: {val}" for k, val in ch["kpis"])]
+        else:
+            row += [None] * 5
+    for i in range(max_kpis):
+        row += list(v["kpis"][i]) if i < len(v["kpis"]) else [None, None]
+    return [c if c is None or isinstance(c, (int, float, str)) and not isinstance(c, bool)
+            else json.dumps(c, ensure_ascii=False) for c in row]
+
+# ---------- chunk rendering (runs in worker processes)
+
+def render_chunk(fmt: str, first: int, lines: List[str], max_channels: int = 8,
+                 max_kpis: int = 6) -> Tuple[Any, int, int]:
+    """
+    Render JSONL lines numbered from `first`: Markdown text, CSV text, or a list of XLSX <row> strings.
+    Returns (payload, rendered, skipped); unparsable lines and records without a plan are skipped.
+    """
+    parts: List[str] = []
+    buf = io.StringIO() if fmt == "csv" else None
+    writer = csv.writer(buf, lineterminator="\n") if buf is not None else None
+    done = skipped = 0
+    for i, line in enumerate(lines, first):
+        try:
+            brief, plan = split_record(json.loads(line))
+        except ValueError:
+            brief, plan = None, None
+        if plan is None:
+            skipped += 1
+            continue
+        if fmt == "md":
+            parts.append(render_markdown(plan, brief))
+        elif fmt == "csv":
+            writer.writerow(flat_row(i, plan, brief, max_channels, max_kpis))
+        else:
+            parts.append(XLSX_ROW.render(cells=flat_row(i, plan, brief, max_channels, max_kpis)))
+        done += 1
+    if fmt == "md":
+        payload: Any = "".join(p + "\n\n---\n\n" for p in parts)
+    elif fmt == "csv":
+        payload = buf.getvalue()
+    else:
+        payload = parts
+    return payload, done, skipped
+
+# ---------- writers
+
+class ByteSink:
+    """Write-only byte buffer for streaming a zip (or text) out of a generator: write(), then drain()."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+_XLSX_STATIC = {
+    "_rels/.rels": '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+                   'officeDocument" Target="xl/workbook.xml"/></Relationships>',
+}
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>\n')
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+class ExportWriter:
+    """
+    Appends rendered chunks to a binary stream. XLSX is written as a zip streamed entry by entry (no seeking, so
+    `out` can be a pipe or an HTTP response); the sheet index is written last, once the sheet count is known.
+    """
+
+    def __init__(self, fmt: str, out, max_channels: int = 8, max_kpis: int = 6, bom: bool = False):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}, not {fmt!r}")
+        self.fmt, self.out = fmt, out
+        self._header = header(max_channels, max_kpis)
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._sheet = None
+        self._sheets = 0
+        self._rows = 0
+        if fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator="\n").writerow(self._header)
+            self.out.write((("\ufeff" if bom else "") + buf.getvalue()).encode("utf-8"))
+        elif fmt == "xlsx":
+            self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=6)
+            for name, data in _XLSX_STATIC.items():
+                self._zip.writestr(name, data)
+
+    def _new_sheet(self) -> None:
+        if self._sheet is not None:
+            self._sheet.write(_SHEET_TAIL.encode("utf-8"))
+            self._sheet.close()
+        self._sheets += 1
+        self._sheet = self._zip.open(f"xl/worksheets/sheet{self._sheets}.xml", "w", force_zip64=True)
+        self._sheet.write((_SHEET_HEAD + XLSX_ROW.render(cells=self._header)).encode("utf-8"))
+        self._rows = 1
+
+    def write(self, payload: Any) -> None:
+        if self.fmt != "xlsx":
+            if payload:
+                self.out.write(payload.encode("utf-8"))
+            return
+        for row in payload:
+            if self._sheet is None or self._rows >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self._sheet.write(row.encode("utf-8"))
+            self._rows += 1
+
+    def close(self) -> None:
+        if self._zip is None:
+            return
+        if self._sheet is None:
+            self._new_sheet()  # header-only workbook for an empty export
+        self._sheet.write(_SHEET_TAIL.encode("utf-8"))
+        self._sheet.close()
+        n = range(1, self._sheets + 1)
+        self._zip.writestr("xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="plans{"" if i == 1 else f" {i}"}" sheetId="{i}" r:id="rId{i}"/>' for i in n)
+            + "</sheets></workbook>")
+        self._zip.writestr("xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                      f'relationships/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in n)
+            + "</Relationships>")
+        self._zip.writestr("[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/'
+                      f'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' for i in n)
+            + "</Types>")
+        self._zip.close()
+
+class StreamExporter:
+    """
+    Incremental export of a JSONL byte stream (the API's spooled upload): feed() bytes in any split and get the
+    next piece of output back; finish() flushes the rest. Holds at most one chunk of lines.
+    """
+
+    def __init__(self, fmt: str, max_channels: int = 8, max_kpis: int = 6, bom: bool = False, chunk_lines: int = 500):
+        self.fmt, self.max_channels, self.max_kpis, self.chunk_lines = fmt, max_channels, max_kpis, chunk_lines
+        self._sink = ByteSink()
+        self._writer = ExportWriter(fmt, self._sink, max_channels, max_kpis, bom)
+        self._partial = b""
+        self._lines: List[str] = []
+        self._next = 1
+        self.stats = {"records": 0, "skipped": 0}
+
+    def _render(self) -> None:
+        payload, done, skipped = render_chunk(self.fmt, self._next, self._lines, self.max_channels, self.max_kpis)
+        self._writer.write(payload)
+        self._next += len(self._lines)
+        self._lines = []
+        self.stats["records"] += done
+        self.stats["skipped"] += skipped
+
+    def feed(self, data: bytes) -> bytes:
+        *lines, self._partial = (self._partial + data).split(b"\n")
+        for line in lines:
+            if line.strip():
+                self._lines.append(line.decode("utf-8", "replace"))
+                if len(self._lines) >= self.chunk_lines:
+                    self._render()
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self._partial.strip():
+            self._lines.append(self._partial.decode("utf-8", "replace"))
+        self._partial = b""
+        if self._lines:
+            self._render()
+        self._writer.close()
+        return self._sink.drain()
+
+# ---------- driver
+
+def chunked(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for line in lines:
+        if line.strip():
+            chunk.append(line)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def export_lines(lines: Iterable[str], fmt: str, out, workers: int = 1, chunk_lines: int = 2000,
+                 max_channels: int = 8, max_kpis: int = 6, bom: bool = False) -> Dict[str, Any]:
+    """
+    Stream JSONL lines to `out` (binary) in `fmt`. With workers > 1 chunks render in a process pool with at most
+    2 * workers chunks in flight, so memory is bounded by chunk_lines whatever the input size.
+    """
+    t0 = time.perf_counter()
+    writer = ExportWriter(fmt, out, max_channels, max_kpis, bom)
+    stats = {"records": 0, "skipped": 0, "chunks": 0}
+
+    def take(result: Tuple[Any, int, int]) -> None:
+        payload, done, skipped = result
+        writer.write(payload)
+        stats["records"] += done
+        stats["skipped"] += skipped
+        stats["chunks"] += 1
+
+    first = 1
+    if workers <= 1:
+        for chunk in chunked(lines, chunk_lines):
+            take(render_chunk(fmt, first, chunk, max_channels, max_kpis))
+            first += len(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending: deque = deque()
+            for chunk in chunked(lines, chunk_lines):
+                pending.append(pool.submit(render_chunk, fmt, first, chunk, max_channels, max_kpis))
+                first += len(chunk)
+                if len(pending) >= 2 * workers:
+                    take(pending.popleft().result())
+            while pending:
+                take(pending.popleft().result())
+    writer.close()
+    stats["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return stats
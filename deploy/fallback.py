@@ -0,0 +1,79 @@
+# Instant, model-free campaign plan used when the generator is saturated (load shedding).
+from __future__ import annotations
+from typing import Dict, Any, List, Tuple
+
+from config import CHANNEL_CATALOG
+from utils import _default_activation_for, _renorm_pairs
+
+# channel preference per objective; anything not listed falls back to CHANNEL_CATALOG order
+OBJECTIVE_CHANNELS = {
+    "awareness":   ["TikTok", "YouTube", "Facebook", "Instagram", "LINE OA"],
+    "acquisition": ["LINE OA", "Facebook", "TikTok", "Instagram"],
+    "retention":   ["LINE OA", "Email", "Retail POS", "Facebook"],
+    "loyalty":     ["LINE OA", "Email", "Retail POS", "Instagram"],
+    "upsell":      ["Email", "LINE OA", "Facebook", "Retail POS"],
+}
+
+OBJECTIVE_KPIS = {
+    "awareness":   ("reach", "engagement"),
+    "acquisition": ("membership_signup", "cpl"),
+    "retention":   ("retention", "redemption"),
+    "loyalty":     ("membership_signup", "redemption"),
+    "upsell":      ("redemption", "ctr"),
+}
+
+def _norm(name: str) -> str:
+    return (name or "").strip().lower()
+
+def pick_channels(objective: str, budget_thb: float, constraints: Dict[str, Any]) -> List[str]:
+    """Mandatory channels first, then objective preferences; banned channels never appear."""
+    banned = {_norm(c) for c in (constraints.get("banned_channels") or [])}
+    n = 2 if budget_thb < 500_000 else 3 if budget_thb < 1_500_000 else 4
+    out = [c for c in dict.fromkeys(constraints.get("mandatory_channels") or []) if _norm(c) not in banned]
+    seen = {_norm(c) for c in out}
+    for c in OBJECTIVE_CHANNELS.get(_norm(objective), []) + CHANNEL_CATALOG:
+        if len(out) >= n:
+            break
+        if _norm(c) in banned or _norm(c) in seen:
+            continue
+        out.append(c); seen.add(_norm(c))
+    return out
+
+def _kpi_targets(objective: str, budget_thb: float) -> Dict[str, Any]:
+    # coarse planning numbers: ~80 THB CPM at 3x frequency, ~150 THB per lead
+    reach = int(budget_thb / 80 * 1000 / 3)
+    leads = int(budget_thb / 150)
+    table = {
+        "reach": reach,
+        "engagement": "4%",
+        "ctr": "1.5%",
+        "cpl": "150 THB",
+        "membership_signup": leads,
+        "redemption": int(leads * 0.3),
+        "retention": "+10% repeat rate",
+    }
+    return {k: table[k] for k in OBJECTIVE_KPIS.get(_norm(objective), ("reach", "engagement"))}
+
+def template_plan(brief: Dict[str, Any], timeline_weeks: int = 6) -> Dict[str, Any]:
+    """Build a schema-valid plan from CHANNEL_CATALOG + activation heuristics; no model call."""
+    cons = brief.get("constraints") or {}
+    objective = brief.get("objective", "awareness")
+    budget = float(brief.get("budget_thb") or 0)
+    industry = brief.get("industry", "Brand")
+    tone = cons.get("brand_tone") or "clear"
+
+    channels = pick_channels(objective, budget, cons)
+    mandatory = {_norm(c) for c in (cons.get("mandatory_channels") or [])}
+    # mandatory channels carry a larger share; the rest split evenly
+    pairs: List[Tuple[str, float]] = [(c, 1.5 if _norm(c) in mandatory else 1.0) for c in channels]
+    kpis = _kpi_targets(objective, budget)
+    return {
+        "concept_title": f"{industry} {objective.title()} Sprint",
+        "big_idea": f"A {tone} always-on {objective} push for {industry} anchored on {', '.join(channels[:2])}.",
+        "key_message": f"{industry} made for you — join now.",
+        "channels": [{"name": c, "activation": _default_activation_for(c), "kpis": {}} for c in channels],
+        "assets": ["15s vertical video", "Key visual (1:1, 9:16)", "Coupon / CTA copy"],
+        "timeline_weeks": timeline_weeks,
+        "budget_split": _renorm_pairs(pairs),
+        "kpis": kpis,
+    }
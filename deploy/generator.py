@@ -1,80 +1,155 @@
 from __future__ import annotations
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
 import time, json
-from typing import Dict, Any, Tuple, List
-import torch
+from typing import Dict, Any, Tuple, List, Optional
 
-from config import SYSTEM_PROMPT, DEFAULT_SCHEMA, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P
+from config import (SYSTEM_PROMPT, DEFAULT_SCHEMA, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P, ADAPTIVE_MAX_TOKENS,
+                    PLAN_SOLVER, SECTIONED_GENERATION, OUTPUT_FORMAT, MEMORY_META, CASCADE_FAST_BACKEND,
+                    COMPLIANCE_REPAIR)
 from prompts import build_user_prompt, as_chat_messages
 from utils import extract_first_json_block, normalize_budget_split
 from validators import validate_plan
-from model_loader import load_llama
+from backends import InferenceBackend, Completion, get_backend
+from length_model import get_predictor
+from planner import solve_plan
+from compact import decode_plan
+from compliance import check_and_repair
+from cancellation import CancelToken, GenerationCancelled
+from metrics import METRICS
+from memdiag import measured
 
-def generate_json_plan(tokenizer: AutoTokenizer,
-                       model: AutoModelForCausalLM,
+def _check_cancelled(cancel: Optional[CancelToken], new_tokens: int = 0) -> None:
+    if cancel is not None and cancel.cancelled:
+        METRICS.inc("generation_cancelled_total", reason=cancel.reason)
+        METRICS.inc("generation_cancelled_tokens_total", new_tokens)
+        cancel.raise_if_cancelled(new_tokens)
+
+def generate_json_plan(backend: InferenceBackend,
                        system_prompt: str,
                        user_prompt: str,
                        max_new_tokens: int = 1024,
                        temperature: float = 0.7,
                        top_p: float = 0.9) -> str:
-    """Return raw model output text."""
-    messages = as_chat_messages(system_prompt, user_prompt)
-    prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        out = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            do_sample=True,
-            temperature=temperature,
-            top_p=top_p,
-        )
-    return tokenizer.decode(out[0], skip_special_tokens=True)
+    """Return raw model output text (completion only)."""
+    prompt = backend.chat_prompt(as_chat_messages(system_prompt, user_prompt))
+    return backend.generate(prompt, max_new_tokens, temperature, top_p).text
+
+def parse_plan_text(text: str, fmt: str = OUTPUT_FORMAT) -> Optional[Any]:
+    """Plan from model output in the serving encoding (JSON or compact lines); None if it does not parse."""
+    if fmt == "compact":
+        try:
+            return decode_plan(text) or None
+        except ValueError:
+            return None
+    try:
+        return json.loads(extract_first_json_block(text) or text)
+    except Exception:
+        return None
+
+def token_budget(brief: Dict[str, Any], cap: int) -> int:
+    """Predicted max_new_tokens for the first pass (cap when no length model is fitted)."""
+    pred = get_predictor() if ADAPTIVE_MAX_TOKENS else None
+    return min(cap, pred.budget(brief)) if pred is not None else cap
+
+def generate_budgeted(backend: InferenceBackend, prompt: str, budget: int, cap: int,
+                      temperature: float, top_p: float,
+                      cancel: Optional[CancelToken] = None) -> Tuple[Completion, int]:
+    """
+    Decode with a tight `budget`; if that runs out, continue from the text so far (re-prefilled as an
+    assistant prefix) with the rest of `cap`. Returns the merged completion and the continuation count.
+    """
+    comp = backend.generate(prompt, budget, temperature, top_p, cancel)
+    first = comp
+    text, new, prefill_ms, decode_ms, conts = comp.text, comp.new_tokens, comp.prefill_ms, comp.decode_ms, 0
+    while comp.finish_reason == "length" and new < cap and comp.new_tokens > 0:
+        conts += 1
+        METRICS.inc("generation_overflow_total")
+        comp = backend.generate(prompt + text, cap - new, temperature, top_p, cancel)
+        text += comp.text
+        new += comp.new_tokens
+        prefill_ms += comp.prefill_ms
+        decode_ms += comp.decode_ms
+    return Completion(text, first.prompt_tokens, new, prefill_ms, decode_ms, comp.finish_reason), conts
 
 def generate_campaign_plan(brief: Dict[str, Any],
                            schema: Dict[str, Any] = DEFAULT_SCHEMA,
                            max_new_tokens: int = GEN_MAX_NEW_TOKENS,
                            temperature: float = GEN_TEMPERATURE,
-                           top_p: float = GEN_TOP_P) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+                           top_p: float = GEN_TOP_P,
+                           cancel: Optional[CancelToken] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Returns: (plan_dict, meta)
-      meta includes: elapsed_ms, attempts, warnings[]
+      meta includes: elapsed_ms, attempts, backend, prompt_tokens, new_tokens, compliance, warnings[],
+      budget (THB per channel and week, when PLAN_SOLVER is on), memory (MEMORY_META=1), cascade (CASCADE_FAST_BACKEND)
+    Raises GenerationCancelled if `cancel` fires before or during decoding.
     """
-    tok, mdl = load_llama()
-    messages = as_chat_messages(SYSTEM_PROMPT, build_user_prompt(brief))
-    prompt = tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    inputs = tok(prompt, return_tensors="pt").to(mdl.device)
+    _check_cancelled(cancel)
+    gen = generate_plan_with
+    if CASCADE_FAST_BACKEND:
+        from cascade import get_cascade  # cascade imports this module
+        gen = get_cascade().generate_plan_with
+    if MEMORY_META:
+        return measured(gen, get_backend(), brief, schema, max_new_tokens, temperature, top_p, cancel)
+    return gen(get_backend(), brief, schema, max_new_tokens, temperature, top_p, cancel)
+
+def generate_plan_with(backend: InferenceBackend,
+                       brief: Dict[str, Any],
+                       schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                       max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                       temperature: float = GEN_TEMPERATURE,
+                       top_p: float = GEN_TOP_P,
+                       cancel: Optional[CancelToken] = None,
+                       sectioned: bool = SECTIONED_GENERATION,
+                       repair: bool = COMPLIANCE_REPAIR) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    generate_campaign_plan on an explicit backend (e.g. a CPU replica). `repair=False` keeps the compliance check
+    but skips its repair pass (used when this runs as that repair, see refine.refine_plan_with).
+    """
+    if sectioned:
+        from sections import generate_sectioned  # sections imports this module
+        return generate_sectioned(backend, brief, schema, max_new_tokens, temperature, top_p, cancel, repair)
+    prompt = backend.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(brief)))
 
     t0 = time.time()
     warnings: List[str] = []
 
-    with torch.no_grad():
-        out = mdl.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            do_sample=True,
-            temperature=temperature,
-            top_p=top_p,
-        )
-    raw = tok.decode(out[0], skip_special_tokens=True)
-    cand = extract_first_json_block(raw) or raw
-
-    try:
-        plan = json.loads(cand)
-    except Exception as e:
-        warnings.append("JSON parse failed; returning raw text in 'plan_raw'.")
-        return {"plan_raw": raw}, {"elapsed_ms": int((time.time()-t0)*1000), "attempts": 1, "warnings": warnings}
-
-    # normalize + validate
-    normalize_budget_split(plan)
-    ok, err = validate_plan(plan, schema)
-    if not ok:
-        warnings.append(f"Schema validation failed: {err}")
+    budget = token_budget(brief, max_new_tokens)
+    comp, continuations = generate_budgeted(backend, prompt, budget, max_new_tokens, temperature, top_p, cancel)
+    _check_cancelled(cancel, comp.new_tokens)
+    raw = comp.text
 
     meta = {
-        "elapsed_ms": int((time.time()-t0)*1000),
+        "elapsed_ms": 0,
         "attempts": 1,
+        "backend": backend.name,
+        "prompt_tokens": comp.prompt_tokens,
+        "new_tokens": comp.new_tokens,
+        "finish_reason": comp.finish_reason,
+        "token_budget": budget,
+        "continuations": continuations,
         "warnings": warnings
     }
-    return plan, meta
\ No newline at end of file
+    plan = parse_plan_text(raw)
+    if plan is None:
+        warnings.append(("Compact decode" if OUTPUT_FORMAT == "compact" else "JSON parse") +
+                        " failed; returning raw text in 'plan_raw'.")
+        meta["elapsed_ms"] = int((time.time()-t0)*1000)
+        return {"plan_raw": raw}, meta
+
+    plan = finish_plan(backend, brief, plan, meta, schema, max_new_tokens, temperature, top_p, cancel, repair)
+    meta["elapsed_ms"] = int((time.time()-t0)*1000)
+    return plan, meta
+
+def finish_plan(backend: InferenceBackend, brief: Dict[str, Any], plan: Any, meta: Dict[str, Any],
+                schema: Dict[str, Any], max_new_tokens: int, temperature: float, top_p: float,
+                cancel: Optional[CancelToken] = None, repair: bool = COMPLIANCE_REPAIR) -> Any:
+    """Normalize (or solve) + validate + compliance check/repair of a parsed plan; fills meta."""
+    normalize_budget_split(plan)
+    if PLAN_SOLVER and isinstance(plan, dict):
+        meta["budget"] = solve_plan(plan, brief)
+    ok, err = validate_plan(plan, schema)
+    if not ok:
+        meta["warnings"].append(f"Schema validation failed: {err}")
+    if isinstance(plan, dict):
+        plan = check_and_repair(backend, brief, plan, meta, schema, max_new_tokens, temperature, top_p, cancel, repair)
+    return plan
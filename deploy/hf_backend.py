@@ -0,0 +1,188 @@
+# Hugging Face transformers backend (GPU NF4 + PEFT via load_llama, or CPU via load_llama_cpu).
+from __future__ import annotations
+import time, weakref
+from typing import Dict, Any, List, Optional, Union
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteria, StoppingCriteriaList
+
+from backends import InferenceBackend, Completion, StopFn, branch_stops
+from cancellation import CancelToken
+
+class CancelCriteria(StoppingCriteria):
+    """Stops decoding as soon as the request's CancelToken fires (disconnect or deadline)."""
+    def __init__(self, token: CancelToken):
+        self.token = token
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+def _stopping(cancel: Optional[CancelToken]) -> Optional[StoppingCriteriaList]:
+    return StoppingCriteriaList([CancelCriteria(cancel)]) if cancel is not None else None
+
+def sample_next(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    """Temperature + nucleus sampling over the last-position logits, shape (batch, vocab) -> (batch, 1)."""
+    if temperature <= 0:
+        return logits.argmax(dim=-1, keepdim=True)
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    sorted_p, sorted_i = probs.sort(dim=-1, descending=True)
+    drop = sorted_p.cumsum(dim=-1) - sorted_p > top_p
+    sorted_p = sorted_p.masked_fill(drop, 0.0)
+    pick = torch.multinomial(sorted_p / sorted_p.sum(dim=-1, keepdim=True), 1)
+    return sorted_i.gather(-1, pick)
+
+class HFBackend(InferenceBackend):
+    def __init__(self, tok: AutoTokenizer, mdl: AutoModelForCausalLM, name: str = "hf"):
+        self.tokenizer = tok
+        self.model = mdl
+        self.name = name
+        self.capabilities = {"device": str(mdl.device), "deterministic": False, "kv_cache": True,
+                             "batching": True, "weights": True}
+        eos = mdl.generation_config.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, list) else [eos] if eos is not None else [])
+        if tok.eos_token_id is not None:
+            self.eos_ids.add(tok.eos_token_id)
+        # every KV cache this backend created that is still referenced somewhere (in flight, or leaked)
+        self._caches: "weakref.WeakSet" = weakref.WeakSet()
+
+    def _track(self, cache):
+        self._caches.add(cache)
+        return cache
+
+    def memory_stats(self) -> Dict[str, Any]:
+        from memdiag import cache_nbytes, cache_tokens
+        caches = list(self._caches)
+        return {"weights_mb": round(self.model.get_memory_footprint() / 2**20, 1),
+                "kv_cache": {"live": len(caches), "tokens": sum(cache_tokens(c) for c in caches),
+                             "mb": round(sum(cache_nbytes(c) for c in caches) / 2**20, 2)}}
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _encode(self, prompt: str) -> Dict[str, torch.Tensor]:
+        # chat_prompt already carries <|begin_of_text|>; do not add a second BOS
+        return self.tokenizer(prompt, return_tensors="pt", add_special_tokens=False).to(self.model.device)
+
+    def prefill(self, prompt: str) -> Dict[str, Any]:
+        """Run the prompt once; the state carries the KV cache and last-position logits."""
+        t0 = time.perf_counter()
+        inputs = self._encode(prompt)
+        with torch.no_grad():
+            out = self.model(**inputs, use_cache=True)
+        return {"past": self._track(out.past_key_values), "logits": out.logits[:, -1, :],
+                "prompt_tokens": inputs["input_ids"].shape[1], "prefill_ms": int((time.perf_counter() - t0) * 1000)}
+
+    def decode(self, state: Dict[str, Any], max_new_tokens: int, temperature: float, top_p: float,
+               cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        """Token-by-token sampling loop on top of a prefill state."""
+        t0 = time.perf_counter()
+        past, logits = state["past"], state["logits"]
+        ids: List[int] = []
+        finish = "length"
+        with torch.no_grad():
+            for _ in range(max_new_tokens):
+                if cancel is not None and cancel.cancelled:
+                    finish = "cancelled"
+                    break
+                nxt = sample_next(logits, temperature, top_p)
+                if int(nxt) in self.eos_ids:
+                    finish = "stop"
+                    break
+                ids.append(int(nxt))
+                if stop is not None and stop(self.tokenizer.decode(ids, skip_special_tokens=True)):
+                    finish = "stop"
+                    break
+                out = self.model(input_ids=nxt, past_key_values=past, use_cache=True)
+                past, logits = out.past_key_values, out.logits[:, -1, :]
+        return Completion(self.tokenizer.decode(ids, skip_special_tokens=True), state["prompt_tokens"], len(ids),
+                          state["prefill_ms"], int((time.perf_counter() - t0) * 1000), finish)
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: float, top_p: float,
+                 cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        """Fused HF generate() path (the explicit loop when a stop test is given); completion text only."""
+        if stop is not None:
+            return self.decode(self.prefill(prompt), max_new_tokens, temperature, top_p, cancel, stop)
+        t0 = time.perf_counter()
+        inputs = self._encode(prompt)
+        n_prompt = inputs["input_ids"].shape[1]
+        with torch.no_grad():
+            out = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=temperature > 0,
+                temperature=temperature if temperature > 0 else None,
+                top_p=top_p if temperature > 0 else None,
+                stopping_criteria=_stopping(cancel),
+                past_key_values=self._track(DynamicCache()),
+                pad_token_id=self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id,
+            )
+        new = out[0, n_prompt:]
+        n_new = int(new.shape[0])
+        if cancel is not None and cancel.cancelled:
+            finish = "cancelled"
+        elif n_new and int(new[-1]) in self.eos_ids:
+            finish = "stop"
+        else:
+            finish = "length" if n_new >= max_new_tokens else "stop"
+        return Completion(self.tokenizer.decode(new, skip_special_tokens=True), n_prompt, n_new,
+                          0, int((time.perf_counter() - t0) * 1000), finish)
+
+    def generate_branches(self, prompt: str, suffixes: List[str], max_new_tokens: int, temperature: float,
+                          top_p: float, cancel: Optional[CancelToken] = None,
+                          stop: Union[StopFn, List[StopFn], None] = None) -> List[Completion]:
+        """
+        Prefill `prompt` once, copy its KV cache per branch and decode all branches as one batch.
+        Suffixes of different lengths are left-padded inside the suffix segment (masked, with explicit
+        position ids) so every row continues right after the shared prefix.
+        """
+        t0 = time.perf_counter()
+        dev = self.model.device
+        pre = self._encode(prompt)["input_ids"]
+        n, b = pre.shape[1], len(suffixes)
+        stops = branch_stops(stop, b)
+        suf = [self.tokenizer(s, add_special_tokens=False)["input_ids"] for s in suffixes]
+        width = max(len(s) for s in suf)
+        pad = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        ids = torch.tensor([[pad] * (width - len(s)) + s for s in suf], device=dev)
+        mask = torch.cat([torch.ones(b, n, dtype=torch.long, device=dev),
+                          torch.tensor([[0] * (width - len(s)) + [1] * len(s) for s in suf], device=dev)], dim=1)
+        pos = (mask.cumsum(-1) - 1).clamp(min=0)[:, n:]
+        with torch.no_grad():
+            past = self._track(self.model(input_ids=pre, use_cache=True).past_key_values)
+            prefill_ms = int((time.perf_counter() - t0) * 1000)
+            t1 = time.perf_counter()
+            past.batch_repeat_interleave(b)
+            out = self.model(input_ids=ids, attention_mask=mask, position_ids=pos, past_key_values=past, use_cache=True)
+            logits, pos = out.logits[:, -1, :], pos[:, -1:]
+            toks: List[List[int]] = [[] for _ in range(b)]
+            finish: List[Optional[str]] = [None] * b
+            for _ in range(max_new_tokens):
+                if cancel is not None and cancel.cancelled:
+                    finish = [f or "cancelled" for f in finish]
+                    break
+                nxt = sample_next(logits, temperature, top_p)
+                for i in range(b):
+                    if finish[i] is not None:
+                        continue
+                    t = int(nxt[i])
+                    if t in self.eos_ids:
+                        finish[i] = "stop"
+                        continue
+                    toks[i].append(t)
+                    if stops[i] is not None and stops[i](self.tokenizer.decode(toks[i], skip_special_tokens=True)):
+                        finish[i] = "stop"
+                if all(f is not None for f in finish):
+                    break
+                nxt = torch.where(torch.tensor([f is None for f in finish], device=dev)[:, None], nxt,
+                                  torch.full_like(nxt, pad))
+                mask = torch.cat([mask, torch.ones(b, 1, dtype=mask.dtype, device=dev)], dim=1)
+                pos = pos + 1
+                out = self.model(input_ids=nxt, attention_mask=mask, position_ids=pos, past_key_values=past,
+                                 use_cache=True)
+                logits = out.logits[:, -1, :]
+        decode_ms = int((time.perf_counter() - t1) * 1000)
+        return [Completion(self.tokenizer.decode(t, skip_special_tokens=True), n + len(s), len(t), prefill_ms,
+                           decode_ms, f or "length") for t, s, f in zip(toks, suf, finish)]
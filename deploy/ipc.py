@@ -0,0 +1,26 @@
+# Length-prefixed JSON frames over a local (Unix) stream socket.
+from __future__ import annotations
+import json, socket, struct
+from typing import Any
+
+_HDR = struct.Struct("!I")
+MAX_FRAME = 64 * 1024 * 1024
+
+def send_msg(sock: socket.socket, obj: Any) -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HDR.pack(len(data)) + data)
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("peer closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+def recv_msg(sock: socket.socket) -> Any:
+    (n,) = _HDR.unpack(_recv_exact(sock, _HDR.size))
+    if n > MAX_FRAME:
+        raise ValueError(f"frame too large: {n} bytes")
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
@@ -0,0 +1,83 @@
+# Output-length predictor fitted from historical plans (scripts/fit_length_model.py).
+# Buckets by (language, objective, #mandatory channels) with back-off to coarser buckets; gives a
+# tight per-request max_new_tokens budget and an expected length for shortest-job-first scheduling.
+from __future__ import annotations
+import json, os, re
+from functools import lru_cache
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from config import LENGTH_MODEL_PATH, GEN_MAX_NEW_TOKENS
+
+_THAI = re.compile("[฀-๿]")
+
+def language_of(brief: Dict[str, Any], output: Optional[Dict[str, Any]] = None) -> str:
+    """'th' | 'en' from the brief's language hint, else from the script of a known output."""
+    hint = (brief.get("language") or "").strip().lower()
+    if hint:
+        return "th" if hint.startswith("th") else "en"
+    if output is not None and _THAI.search(json.dumps(output, ensure_ascii=False)):
+        return "th"
+    return "en"
+
+def _mandatory(brief: Dict[str, Any]) -> int:
+    return min(3, len((brief.get("constraints") or {}).get("mandatory_channels") or []))
+
+def bucket_keys(brief: Dict[str, Any], lang: str) -> List[str]:
+    """Most to least specific."""
+    obj = (brief.get("objective") or "").strip().lower()
+    return [f"{lang}|{obj}|{_mandatory(brief)}", f"{lang}|{obj}", lang, "*"]
+
+def _quantile(xs: List[int], q: float) -> int:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+
+def fit(records: Iterable[Dict[str, Any]], count_tokens: Callable[[str], int],
+        quantile: float = 0.98, min_count: int = 20) -> Dict[str, Any]:
+    """records: {"input": brief, "output": plan}; token counts of the serialized plan per bucket."""
+    groups: Dict[str, List[int]] = {}
+    for rec in records:
+        n = count_tokens(json.dumps(rec["output"], ensure_ascii=False))
+        for k in bucket_keys(rec["input"], language_of(rec["input"], rec["output"])):
+            groups.setdefault(k, []).append(n)
+    buckets = {k: {"n": len(v), "p50": _quantile(v, 0.5), "q": _quantile(v, quantile), "max": max(v)}
+               for k, v in groups.items() if len(v) >= min_count or k == "*"}
+    return {"quantile": quantile, "buckets": buckets}
+
+class LengthPredictor:
+    def __init__(self, model: Dict[str, Any], margin: float = 0.1, floor: int = 64, cap: int = GEN_MAX_NEW_TOKENS):
+        self.buckets = model["buckets"]
+        self.margin = margin
+        self.floor = floor
+        self.cap = cap
+
+    def _bucket(self, brief: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        for k in bucket_keys(brief, language_of(brief)):
+            if k in self.buckets:
+                return k, self.buckets[k]
+        return "*", {"p50": self.cap, "q": self.cap}
+
+    def budget(self, brief: Dict[str, Any]) -> int:
+        """max_new_tokens for the first decode pass: high quantile of the bucket plus a margin."""
+        _, b = self._bucket(brief)
+        return max(self.floor, min(self.cap, int(b["q"] * (1 + self.margin))))
+
+    def expected(self, brief: Dict[str, Any]) -> int:
+        """Median length of the bucket; the scheduling cost of a request."""
+        return int(self._bucket(brief)[1]["p50"])
+
+def save(model: Dict[str, Any], path: str = LENGTH_MODEL_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=2)
+
+@lru_cache(maxsize=1)
+def get_predictor(path: str = LENGTH_MODEL_PATH) -> Optional[LengthPredictor]:
+    """None if no model has been fitted (callers then use the fixed GEN_MAX_NEW_TOKENS)."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return LengthPredictor(json.load(f))
+
+def expected_tokens(brief: Dict[str, Any]) -> float:
+    """Scheduling cost of a brief (0 = unknown, i.e. plain arrival order)."""
+    pred = get_predictor()
+    return float(pred.expected(brief)) if pred is not None else 0.0
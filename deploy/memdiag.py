@@ -0,0 +1,255 @@
+# Memory diagnostics for the serving processes (API, model server, replicas, Streamlit): process RSS, torch
+# allocator stats, KV-cache occupancy of the loaded backends, sizes of the in-process caches, an opt-in
+# tracemalloc top-N diff against a baseline snapshot, and per-request peak memory (MEMORY_META=1).
+# Served by api_app.py as GET /debug/memory (DEBUG_ENDPOINTS=1).
+from __future__ import annotations
+import gc, os, resource, sys, threading, time, tracemalloc, warnings
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+_MB = 1024 * 1024
+
+def _mb(n: float) -> float:
+    return round(n / _MB, 2)
+
+# ---------- process
+
+def rss(pid: Optional[int] = None) -> Dict[str, Any]:
+    """Current and peak (high-water mark) resident set size of this process (or of `pid`, e.g. a replica)."""
+    out: Dict[str, Any] = {"pid": pid or os.getpid()}
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        for key, name in (("VmRSS", "rss_mb"), ("VmHWM", "peak_rss_mb"), ("RssAnon", "anon_mb"), ("VmSwap", "swap_mb")):
+            if key in status:
+                out[name] = _mb(int(status[key].split()[0]) * 1024)
+    except OSError:
+        if pid is None:
+            # no procfs (macOS): ru_maxrss is the peak, in bytes there
+            out["peak_rss_mb"] = _mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return out
+
+def reset_peak_rss() -> bool:
+    """Restart VmHWM from the current RSS (Linux >= 4.0); False where the kernel does not allow it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# ---------- torch
+
+def _torch():
+    """torch if this process already imported it (the stand-in API never does; do not pull it in here)."""
+    return sys.modules.get("torch")
+
+def torch_stats(tensors: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    CUDA caching-allocator stats per device, and with `tensors` a census of live tensors by device and dtype
+    (walks every object; tensors held past the end of a request show up here). None if torch is not loaded.
+    """
+    torch = _torch()
+    if torch is None:
+        return None
+    out: Dict[str, Any] = {"num_threads": torch.get_num_threads()}
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        devices = []
+        for d in range(torch.cuda.device_count()):
+            s = torch.cuda.memory_stats(d)
+            devices.append({
+                "device": d,
+                "allocated_mb": _mb(s.get("allocated_bytes.all.current", 0)),
+                "reserved_mb": _mb(s.get("reserved_bytes.all.current", 0)),
+                "peak_allocated_mb": _mb(s.get("allocated_bytes.all.peak", 0)),
+                "inactive_split_mb": _mb(s.get("inactive_split_bytes.all.current", 0)),
+                "alloc_retries": s.get("num_alloc_retries", 0),
+                "ooms": s.get("num_ooms", 0),
+            })
+        out["cuda"] = devices
+    if tensors:
+        census: Dict[str, Dict[str, float]] = {}
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # isinstance() on some lazy/deprecated module objects warns
+            objs = [o for o in gc.get_objects() if isinstance(o, torch.Tensor)]
+        for obj in objs:
+            try:
+                key = f"{obj.device}/{str(obj.dtype).replace('torch.', '')}"
+                nbytes = obj.numel() * obj.element_size()
+            except Exception:
+                continue  # half-torn-down objects during gc
+            c = census.setdefault(key, {"count": 0, "mb": 0.0})
+            c["count"] += 1
+            c["mb"] += nbytes / _MB
+        out["live_tensors"] = {k: {"count": int(v["count"]), "mb": round(v["mb"], 2)} for k, v in sorted(census.items())}
+    return out
+
+def cache_nbytes(cache: Any) -> int:
+    """Bytes held by a transformers Cache (DynamicCache / StaticCache, old and new layouts)."""
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        tensors = [t for l in layers for t in (getattr(l, "keys", None), getattr(l, "values", None))]
+    else:
+        tensors = list(getattr(cache, "key_cache", [])) + list(getattr(cache, "value_cache", []))
+    return sum(t.numel() * t.element_size() for t in tensors if hasattr(t, "numel"))
+
+def cache_tokens(cache: Any) -> int:
+    """Filled positions of a transformers Cache, summed over its batch rows."""
+    layers = getattr(cache, "layers", None)
+    first = getattr(layers[0], "keys", None) if layers else next(iter(getattr(cache, "key_cache", [])), None)
+    rows = first.shape[0] if hasattr(first, "shape") and first.dim() == 4 else 1
+    return cache.get_seq_length() * rows
+
+# ---------- in-process caches
+
+# (module, attribute) of every functools.lru_cache the serving path keeps; only modules already imported count
+LRU_CACHES = [("backends", "get_backend"), ("model_loader", "load_llama"), ("model_loader", "load_llama_cpu"),
+              ("length_model", "get_predictor")]
+
+def cache_sizes() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for mod, attr in LRU_CACHES:
+        fn = getattr(sys.modules.get(mod), attr, None)
+        if fn is not None and hasattr(fn, "cache_info"):
+            info = fn.cache_info()
+            out[f"{mod}.{attr}"] = {"size": info.currsize, "maxsize": info.maxsize, "hits": info.hits,
+                                    "misses": info.misses}
+    return out
+
+def backend_stats() -> List[Dict[str, Any]]:
+    """memory_stats() (KV cache, pools, tokenizer/replay caches) of every backend loaded in this process."""
+    mod = sys.modules.get("backends")
+    return [{"backend": b.name, **b.memory_stats()} for b in list(getattr(mod, "LOADED_BACKENDS", []))]
+
+# ---------- tracemalloc
+
+class _Tracer:
+    """tracemalloc with a baseline snapshot; diff() reports the top-N allocation sites grown since the baseline."""
+
+    _FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>")]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at = 0.0
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._FILTERS)
+
+    def mark(self) -> None:
+        with self._lock:
+            self._baseline, self._baseline_at = self._snapshot(), time.time()
+
+    def diff(self, top: int = 20, reset: bool = False) -> Dict[str, Any]:
+        """Growth per allocation site (per call stack when tracing more than one frame); `reset` re-baselines."""
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        key = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        current, peak = tracemalloc.get_traced_memory()
+        out: Dict[str, Any] = {"tracing": True, "frames": tracemalloc.get_traceback_limit(),
+                               "traced_mb": _mb(current), "traced_peak_mb": _mb(peak)}
+        with self._lock:
+            snap = self._snapshot()
+            if self._baseline is None:
+                self._baseline, self._baseline_at = snap, time.time()
+                out["baseline"] = "set now; call again to see growth"
+                return out
+            stats = snap.compare_to(self._baseline, key)
+            out["baseline_age_s"] = int(time.time() - self._baseline_at)
+            out["top"] = [{"where": [f"{f.filename}:{f.lineno}" for f in s.traceback],
+                           "size_diff_kb": round(s.size_diff / 1024, 1), "count_diff": s.count_diff,
+                           "size_kb": round(s.size / 1024, 1), "count": s.count}
+                          for s in stats[:top]]
+            if reset:
+                self._baseline, self._baseline_at = snap, time.time()
+        return out
+
+TRACER = _Tracer()
+
+# ---------- full report
+
+def report(tensors: bool = False, top: int = 0, reset: bool = False) -> Dict[str, Any]:
+    """Everything above in one dict (GET /debug/memory). `top` > 0 also diffs tracemalloc, if it is tracing."""
+    process = dict(rss(), threads=threading.active_count(), gc_objects=len(gc.get_objects()),
+                   gc_counts=list(gc.get_count()))
+    out: Dict[str, Any] = {"process": process, "torch": torch_stats(tensors), "backends": backend_stats(),
+                           "caches": cache_sizes()}
+    if top:
+        out["tracemalloc"] = TRACER.diff(top, reset=reset)
+    return out
+
+def tracemalloc_control(action: str, frames: int = 1) -> Dict[str, Any]:
+    """start (and baseline) | mark (new baseline) | stop; tracing slows allocation-heavy code while on."""
+    if action == "start":
+        TRACER.start(frames)
+        TRACER.mark()
+    elif action == "mark":
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not tracing; start it first")
+        TRACER.mark()
+    elif action == "stop":
+        TRACER.stop()
+    else:
+        raise ValueError(f"unknown tracemalloc action {action!r}; expected start | mark | stop")
+    return {"tracing": tracemalloc.is_tracing(), "frames": tracemalloc.get_traceback_limit()}
+
+# ---------- per-request peak
+
+_inflight = 0
+_started = 0
+_lock = threading.Lock()
+
+@contextmanager
+def track_request() -> Iterator[Dict[str, Any]]:
+    """
+    Fills the yielded dict on exit with the request's memory: rss_mb, rss_delta_mb, peak_rss_mb (and
+    cuda_peak_mb / traced_peak_mb when available). Peaks are process-wide counters reset at the start, so
+    they belong to this request only if no other request overlapped it: `exclusive` says whether that held
+    (always true with ADMISSION_MAX_CONCURRENT=1).
+    """
+    global _inflight, _started
+    torch = _torch()
+    cuda = torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized()
+    with _lock:
+        alone = _inflight == 0
+        _inflight += 1
+        _started += 1
+        mine = _started
+        if alone:
+            reset_peak_rss()
+            if cuda:
+                torch.cuda.reset_peak_memory_stats()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+    before = rss().get("rss_mb", 0.0)
+    mem: Dict[str, Any] = {}
+    try:
+        yield mem
+    finally:
+        now = rss()
+        with _lock:
+            _inflight -= 1
+            exclusive = alone and _started == mine
+        mem.update(rss_mb=now.get("rss_mb"), rss_delta_mb=round(now.get("rss_mb", 0.0) - before, 2),
+                   peak_rss_mb=now.get("peak_rss_mb"), exclusive=exclusive)
+        if cuda:
+            mem["cuda_peak_mb"] = _mb(torch.cuda.max_memory_allocated())
+        if tracemalloc.is_tracing():
+            mem["traced_peak_mb"] = _mb(tracemalloc.get_traced_memory()[1])
+
+def measured(fn: Callable[..., Tuple[Any, Dict[str, Any]]], *args, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """Run a (plan, meta) generation call under track_request; the result lands in meta["memory"]."""
+    with track_request() as mem:
+        plan, meta = fn(*args, **kwargs)
+    meta["memory"] = mem
+    return plan, meta
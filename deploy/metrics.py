@@ -0,0 +1,45 @@
+# In-process counters/gauges for the serving layer, exposed as JSON on /metrics.
+from __future__ import annotations
+import threading, time
+from collections import defaultdict
+from typing import Dict, Any
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={labels[k]}" for k in sorted(labels)) + "}"
+
+class Metrics:
+    """Thread-safe counters, gauges and simple summaries (count/sum/max)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._started = time.time()
+
+    def inc(self, name: str, n: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[_key(name, labels)] += n
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        k = _key(name, labels)
+        with self._lock:
+            s = self._summaries.setdefault(k, {"count": 0, "sum": 0.0, "max": 0.0})
+            s["count"] += 1; s["sum"] += value; s["max"] = max(s["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uptime_s": int(time.time() - self._started),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {k: dict(v) for k, v in self._summaries.items()},
+            }
+
+METRICS = Metrics()
@@ -0,0 +1,73 @@
+# Client side of model_server.py, used by HTTP workers instead of loading the model themselves.
+from __future__ import annotations
+import select, socket
+from typing import Dict, Any, List, Tuple, Optional
+
+from config import DEFAULT_SCHEMA
+from ipc import send_msg, recv_msg
+from admission import AdmissionRejected
+from cancellation import CancelToken, GenerationCancelled
+
+class ModelServerClient:
+    def __init__(self, path: str, connect_timeout_s: float = 5.0, poll_s: float = 0.25):
+        self.path = path
+        self.connect_timeout_s = connect_timeout_s
+        self.poll_s = poll_s
+
+    def _call(self, msg: Dict[str, Any], cancel: Optional[CancelToken] = None) -> Any:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout_s)
+        try:
+            sock.connect(self.path)
+            sock.settimeout(None)
+            send_msg(sock, msg)
+            cancel_sent = False
+            while True:
+                ready, _, _ = select.select([sock], [], [], self.poll_s)
+                if ready:
+                    resp = recv_msg(sock)
+                    break
+                # forward cancellation; the server answers with GenerationCancelled right after
+                if cancel is not None and not cancel_sent and cancel.cancelled:
+                    send_msg(sock, {"op": "cancel", "reason": cancel.reason})
+                    cancel_sent = True
+        finally:
+            sock.close()
+        if resp.get("ok"):
+            return resp.get("result")
+        err = resp.get("error")
+        if err == "AdmissionRejected":
+            raise AdmissionRejected(resp.get("reason", "busy"), int(resp.get("retry_after", 1)))
+        if err == "GenerationCancelled":
+            raise GenerationCancelled(resp.get("reason", "cancelled"), int(resp.get("new_tokens", 0)))
+        raise RuntimeError(f"model server error ({err}): {resp.get('detail', '')}")
+
+    def health(self) -> Dict[str, Any]:
+        return self._call({"op": "health"})
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._call({"op": "metrics"})
+
+    def memory(self, **kwargs) -> Dict[str, Any]:
+        """memdiag.report of the model server (kwargs: tensors, top, reset, tracemalloc, frames)."""
+        return self._call({"op": "memory", **kwargs})
+
+    def generate_campaign_plan(self, brief: Dict[str, Any],
+                               schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                               cancel: Optional[CancelToken] = None,
+                               client: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Same contract as generator.generate_campaign_plan, executed in the model server (queued as `client`)."""
+        msg = {"op": "generate", "brief": brief, "schema": schema, "client": client,
+               "timeout_s": cancel.remaining() if cancel is not None else None}
+        plan, meta = self._call(msg, cancel)
+        return plan, meta
+
+    def refine_plan(self, brief: Dict[str, Any], plan: Dict[str, Any], fields: List[str],
+                    schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                    cancel: Optional[CancelToken] = None,
+                    client: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Same contract as refine.refine_plan, executed in the model server (queued as `client`)."""
+        msg = {"op": "refine", "brief": brief, "plan": plan, "fields": fields, "schema": schema, "client": client,
+               "timeout_s": cancel.remaining() if cancel is not None else None}
+        plan, meta = self._call(msg, cancel)
+        return plan, meta
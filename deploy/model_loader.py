@@ -1,12 +1,11 @@
 # Strictly load Meta-Llama-3.1-8B-Instruct only (gated on Hugging Face).
 import os
+from functools import lru_cache
 from typing import Tuple
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 import torch
 from peft import PeftModel
-from config import MODEL_ID
-
-ADAPTER_DIR = os.getenv("ADAPTER_DIR","outputs/lora-llama31-8b")
+from config import MODEL_ID, ADAPTER_DIR
 
 def _resolve_model_source(model_dir: str | None) -> str:
     """
@@ -21,12 +20,14 @@ def _resolve_model_source(model_dir: str | None) -> str:
     # default to HF repo id
     return MODEL_ID
 
+@lru_cache(maxsize=2)
 def load_llama(model_dir: str | None = None,
                local_files_only: bool = False,
                hf_token: str | None = None) -> Tuple[AutoTokenizer, AutoModelForCausalLM]:
     """
     Load tokenizer and model for Meta-Llama-3.1-8B-Instruct.
     If using the HF repo (not local), you MUST have accepted the license and provide a token with gated access.
+    Cached per (model_dir, local_files_only, hf_token): the weights are loaded once per process.
     """
     src = _resolve_model_source(model_dir)
 
@@ -58,4 +59,29 @@ def load_llama(model_dir: str | None = None,
     mdl = AutoModelForCausalLM.from_pretrained(src, torch_dtype=dtype,quantization_config=bnb,device_map="auto", low_cpu_mem_usage=True,**kwargs)
     mdl = PeftModel.from_pretrained(mdl, ADAPTER_DIR)
     mdl.eval()
-    return tok, mdl
\ No newline at end of file
+    return tok, mdl
+
+def load_llama_cpu(model_dir: str | None = None,
+                   local_files_only: bool = False,
+                   hf_token: str | None = None,
+                   adapter_dir: str | None = ADAPTER_DIR,
+                   num_threads: int | None = None,
+                   dtype: torch.dtype = torch.bfloat16) -> Tuple[AutoTokenizer, AutoModelForCausalLM]:
+    """
+    CPU load (bitsandbytes NF4 is CUDA-only): plain weights with the LoRA adapter merged in,
+    so decode runs without PEFT indirection. Pass adapter_dir=None to serve the base model.
+    """
+    src = _resolve_model_source(model_dir)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    kwargs = dict(local_files_only=local_files_only)
+    if hf_token:
+        kwargs["token"] = hf_token
+
+    tok = AutoTokenizer.from_pretrained(src, use_fast=True, **kwargs)
+    mdl = AutoModelForCausalLM.from_pretrained(src, torch_dtype=dtype, low_cpu_mem_usage=True, **kwargs)
+    if adapter_dir:
+        mdl = PeftModel.from_pretrained(mdl, adapter_dir).merge_and_unload()
+    mdl.eval()
+    return tok, mdl
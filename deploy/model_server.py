@@ -0,0 +1,138 @@
+# One long-lived process that owns the model weights and the admission queue.
+# HTTP workers (api_app.py with MODEL_SERVER_SOCKET set) forward briefs here over a Unix socket.
+#
+#   python deploy/model_server.py                       # listens on MODEL_SERVER_SOCKET
+#   MODEL_SERVER_SOCKET=/tmp/campaign-model.sock API_WORKERS=4 python deploy/api_app.py
+from __future__ import annotations
+import os, socketserver, threading
+
+from config import (MODEL_ID, DEFAULT_SCHEMA, MODEL_SERVER_SOCKET, ADMISSION_MAX_CONCURRENT,
+                    ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S, CPU_REPLICAS, MODEL_DIR, HF_TOKEN,
+                    LOCAL_FILES_ONLY, INFERENCE_BACKEND, SCHED_POLICY, SCHED_AGING_TOKENS_PER_S,
+                    DEBUG_TRACEMALLOC_FRAMES, CLIENTS_PATH, CASCADE_FAST_BACKEND)
+from ipc import send_msg, recv_msg
+from admission import AdmissionController, AdmissionRejected
+from quotas import ClientRegistry, ANONYMOUS
+from cancellation import CancelToken, GenerationCancelled
+from metrics import METRICS
+import memdiag
+from length_model import expected_tokens
+from generator import generate_campaign_plan
+from refine import refine_plan, PLAN_FIELDS
+from backends import get_backend
+
+# API workers resolve X-API-Key and send the client name; quotas and fair order are enforced here
+CLIENTS = ClientRegistry.load(CLIENTS_PATH) if CLIENTS_PATH else ClientRegistry.single()
+ADMISSION = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S,
+                                SCHED_POLICY, SCHED_AGING_TOKENS_PER_S, CLIENTS)
+POOL = None  # ReplicaPool when CPU_REPLICAS > 0
+
+def _health() -> dict:
+    if POOL is not None:
+        alive = POOL.alive()
+        if not all(alive):
+            raise RuntimeError(f"replicas down: {[i for i, a in enumerate(alive) if not a]}")
+        return {"model": MODEL_ID, "pid": os.getpid(), "replicas": len(alive)}
+    return {"model": MODEL_ID, "pid": os.getpid(), "backend": get_backend().name}
+
+def _memory(msg: dict) -> dict:
+    if msg.get("tracemalloc"):
+        memdiag.tracemalloc_control(msg["tracemalloc"], int(msg.get("frames") or 1))
+    out = memdiag.report(bool(msg.get("tensors")), int(msg.get("top") or 0), bool(msg.get("reset")))
+    if POOL is not None:
+        # replicas are separate processes: RSS from the outside (their own report needs a job slot)
+        out["replicas"] = [memdiag.rss(pid) for pid in POOL.pids() if pid]
+    return out
+
+def _watch_peer(sock, cancel: CancelToken) -> None:
+    """The only thing a worker sends mid-request is a cancel frame; EOF means it went away."""
+    try:
+        msg = recv_msg(sock)
+        cancel.cancel(msg.get("reason") or "disconnect")
+    except (OSError, ValueError):
+        cancel.cancel("disconnect")
+
+def _generate(sock, msg: dict) -> dict:
+    cancel = CancelToken(timeout_s=msg.get("timeout_s"))
+    threading.Thread(target=_watch_peer, args=(sock, cancel), daemon=True).start()
+    try:
+        cost = expected_tokens(msg["brief"])
+        if msg["op"] == "refine":
+            cost *= len(msg["fields"]) / len(PLAN_FIELDS)  # only that share of the plan is decoded
+        with ADMISSION.slot(cancel, cost, msg.get("client") or ANONYMOUS) as ticket:
+            schema = msg.get("schema") or DEFAULT_SCHEMA
+            if msg["op"] == "refine":
+                ref = POOL.refine_plan if POOL is not None else refine_plan
+                plan, meta = ref(msg["brief"], msg["plan"], msg["fields"], schema, cancel=cancel)
+            else:
+                gen = POOL.generate_campaign_plan if POOL is not None else generate_campaign_plan
+                plan, meta = gen(msg["brief"], schema, cancel=cancel)
+            ticket.tokens = meta.get("new_tokens")
+        return {"ok": True, "result": [plan, meta]}
+    except AdmissionRejected as e:
+        return {"ok": False, "error": "AdmissionRejected", "reason": e.reason, "retry_after": e.retry_after}
+    except GenerationCancelled as e:
+        return {"ok": False, "error": "GenerationCancelled", "reason": e.reason, "new_tokens": e.new_tokens}
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One request per connection: health | metrics | memory | generate | refine."""
+
+    def handle(self):
+        sock = self.request
+        try:
+            msg = recv_msg(sock)
+        except (OSError, ValueError):
+            return
+        op = msg.get("op")
+        try:
+            if op == "health":
+                resp = {"ok": True, "result": _health()}
+            elif op == "metrics":
+                CLIENTS.publish()
+                resp = {"ok": True, "result": METRICS.snapshot()}
+            elif op == "memory":
+                resp = {"ok": True, "result": _memory(msg)}
+            elif op in ("generate", "refine"):
+                resp = _generate(sock, msg)
+            else:
+                resp = {"ok": False, "error": "ValueError", "detail": f"unknown op: {op!r}"}
+        except Exception as e:
+            resp = {"ok": False, "error": type(e).__name__, "detail": str(e)}
+        try:
+            send_msg(sock, resp)
+        except OSError:
+            pass  # worker is gone; nothing to deliver
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve(path: str) -> None:
+    global ADMISSION, POOL
+    if DEBUG_TRACEMALLOC_FRAMES > 0:
+        memdiag.tracemalloc_control("start", DEBUG_TRACEMALLOC_FRAMES)
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from a previous run
+    # pay the load once, before accepting traffic
+    if CPU_REPLICAS > 0:
+        from replica_pool import ReplicaPool
+        # replicas are CPU processes; keep the stand-in if that is what is configured
+        POOL = ReplicaPool(CPU_REPLICAS, backend="standin" if INFERENCE_BACKEND == "standin" else "hf-cpu",
+                           load_kwargs=dict(model_dir=MODEL_DIR, local_files_only=LOCAL_FILES_ONLY, hf_token=HF_TOKEN))
+        ADMISSION = AdmissionController(max(ADMISSION_MAX_CONCURRENT, CPU_REPLICAS), ADMISSION_MAX_QUEUE,
+                                        ADMISSION_MAX_WAIT_S, SCHED_POLICY, SCHED_AGING_TOKENS_PER_S, CLIENTS)
+        print(f"CPU replica pool: {[len(c) for c in POOL.core_sets]} cores per replica")
+    else:
+        get_backend()
+        if CASCADE_FAST_BACKEND:
+            from cascade import get_cascade
+            get_cascade()
+    with ModelServer(path, _Handler) as srv:
+        os.chmod(path, 0o600)
+        print(f"Model server ({MODEL_ID}) listening on {path}")
+        try:
+            srv.serve_forever()
+        finally:
+            os.unlink(path)
+
+if __name__ == "__main__":
+    serve(MODEL_SERVER_SOCKET or "/tmp/campaign-model.sock")
@@ -0,0 +1,124 @@
+# ONNX Runtime backend (CPU) over the graph written by scripts/export_onnx.py:
+# one session, explicit KV cache threaded through past_key_values.* / present.*.
+from __future__ import annotations
+import json, os, time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+from backends import InferenceBackend, Completion, StopFn
+from cancellation import CancelToken
+
+def sample_next(logits: np.ndarray, temperature: float, top_p: float, rng: np.random.Generator) -> int:
+    """Temperature + nucleus sampling over one row of logits (numpy twin of hf_backend.sample_next)."""
+    if temperature <= 0:
+        return int(logits.argmax())
+    z = logits.astype(np.float64) / temperature
+    p = np.exp(z - z.max())
+    p /= p.sum()
+    order = np.argsort(-p)
+    sp = p[order]
+    keep = np.cumsum(sp) - sp <= top_p
+    sp = sp[keep] / sp[keep].sum()
+    return int(order[:len(sp)][rng.choice(len(sp), p=sp)])
+
+_NP_DTYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16}
+
+class OnnxBackend(InferenceBackend):
+    def __init__(self, onnx_dir: str, quant: str = "", num_threads: int | None = None, seed: int | None = None):
+        fname = "model.int8.onnx" if quant == "int8" else "model.onnx"
+        path = os.path.join(onnx_dir, fname)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run scripts/export_onnx.py{' --int8' if quant else ''} first")
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            so.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, so, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir, use_fast=True)
+        self.name = "onnx"
+        self.capabilities = {"device": "cpu", "deterministic": False, "kv_cache": True, "batching": False,
+                             "weights": True, "quant": quant or "fp32"}
+        self.rng = np.random.default_rng(seed)
+        self._active: Dict[int, int] = {}  # id(state) -> KV positions, for decodes in flight
+
+        ins = {i.name: i for i in self.session.get_inputs()}
+        self.input_names = set(ins)
+        self.past_names = [n for n in ins if n.startswith("past_key_values.")]
+        self.present_names = ["present." + n[len("past_key_values."):] for n in self.past_names]
+        self.output_names = ["logits"] + self.present_names
+        first = ins[self.past_names[0]] if self.past_names else None
+        # (batch, kv_heads, past_len, head_dim); only past_len is dynamic for a given export
+        self.kv_heads, self.head_dim = (first.shape[1], first.shape[3]) if first is not None else (0, 0)
+        self.kv_dtype = _NP_DTYPES.get(first.type, np.float32) if first is not None else np.float32
+
+        eos = []
+        try:
+            with open(os.path.join(onnx_dir, "generation_config.json"), "r", encoding="utf-8") as f:
+                e = json.load(f).get("eos_token_id")
+            eos = e if isinstance(e, list) else [e] if e is not None else []
+        except (OSError, ValueError):
+            pass
+        self.eos_ids = set(eos)
+        if self.tokenizer.eos_token_id is not None:
+            self.eos_ids.add(self.tokenizer.eos_token_id)
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def memory_stats(self) -> Dict[str, Any]:
+        per_token = len(self.past_names) * self.kv_heads * self.head_dim * np.dtype(self.kv_dtype).itemsize
+        active = list(self._active.values())
+        return {"kv_cache": {"live": len(active), "tokens": sum(active),
+                             "mb": round(sum(active) * per_token / 2**20, 2)}}
+
+    def _run(self, ids: np.ndarray, past: Dict[str, np.ndarray], past_len: int):
+        n = ids.shape[1]
+        feed = {"input_ids": ids, "attention_mask": np.ones((1, past_len + n), dtype=np.int64)}
+        if "position_ids" in self.input_names:
+            feed["position_ids"] = np.arange(past_len, past_len + n, dtype=np.int64)[None, :]
+        feed.update(past)
+        out = self.session.run(self.output_names, feed)
+        present = {p: v for p, v in zip(self.past_names, out[1:])}
+        return out[0][0, -1, :], present
+
+    def prefill(self, prompt: str) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        ids = np.asarray([self.tokenizer(prompt, add_special_tokens=False)["input_ids"]], dtype=np.int64)
+        empty = np.zeros((1, self.kv_heads, 0, self.head_dim), dtype=self.kv_dtype)
+        logits, past = self._run(ids, {n: empty for n in self.past_names}, 0)
+        return {"past": past, "logits": logits, "prompt_tokens": ids.shape[1],
+                "prefill_ms": int((time.perf_counter() - t0) * 1000)}
+
+    def decode(self, state: Dict[str, Any], max_new_tokens: int, temperature: float, top_p: float,
+               cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        t0 = time.perf_counter()
+        past, logits, pos = state["past"], state["logits"], state["prompt_tokens"]
+        ids: List[int] = []
+        finish = "length"
+        key = id(state)
+        try:
+            for _ in range(max_new_tokens):
+                self._active[key] = pos
+                if cancel is not None and cancel.cancelled:
+                    finish = "cancelled"
+                    break
+                nxt = sample_next(logits, temperature, top_p, self.rng)
+                if nxt in self.eos_ids:
+                    finish = "stop"
+                    break
+                ids.append(nxt)
+                if stop is not None and stop(self.tokenizer.decode(ids, skip_special_tokens=True)):
+                    finish = "stop"
+                    break
+                logits, past = self._run(np.asarray([[nxt]], dtype=np.int64), past, pos)
+                pos += 1
+        finally:
+            self._active.pop(key, None)
+        return Completion(self.tokenizer.decode(ids, skip_special_tokens=True), state["prompt_tokens"], len(ids),
+                          state["prefill_ms"], int((time.perf_counter() - t0) * 1000), finish)
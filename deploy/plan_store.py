@@ -0,0 +1,286 @@
+# Local plan store (PLAN_STORE_PATH): SQLite table of briefs + plans, B-tree indexes on the brief fields and an
+# FTS5 index over concept_title / big_idea / key_message (external content: the text is stored once, in `plans`).
+# The API saves every generated plan here and serves GET /plans/search; scripts/ingest_plans.py bulk-loads JSONL.
+#
+# Searches walk one index in id order (newest first, `cursor` = last id seen) and stop at the page limit, so a
+# page costs about the same on the millionth plan as on the first. order=relevance ranks full-text hits by bm25
+# instead (pages with `offset`); that scores every match, so it slows down with common words on large stores.
+from __future__ import annotations
+import hashlib, json, re, sqlite3, threading, time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans(
+    id            INTEGER PRIMARY KEY,
+    created       REAL NOT NULL,
+    source        TEXT,
+    content_hash  TEXT NOT NULL UNIQUE,
+    industry      TEXT COLLATE NOCASE,
+    objective     TEXT COLLATE NOCASE,
+    age           TEXT,
+    geo           TEXT COLLATE NOCASE,
+    budget_thb    REAL,
+    tone          TEXT COLLATE NOCASE,
+    language      TEXT COLLATE NOCASE,
+    concept_title TEXT,
+    big_idea      TEXT,
+    key_message   TEXT,
+    brief         TEXT NOT NULL,
+    plan          TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plans_industry  ON plans(industry, id);
+CREATE INDEX IF NOT EXISTS plans_objective ON plans(objective, id);
+CREATE INDEX IF NOT EXISTS plans_age       ON plans(age, id);
+CREATE INDEX IF NOT EXISTS plans_tone      ON plans(tone, id);
+CREATE TABLE IF NOT EXISTS plan_channels(
+    channel TEXT NOT NULL COLLATE NOCASE,
+    plan_id INTEGER NOT NULL,
+    PRIMARY KEY(channel, plan_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS plans_fts USING fts5(
+    concept_title, big_idea, key_message, content='plans', content_rowid='id', tokenize='{tokenizer}'
+);
+"""
+
+FILTERS = ("industry", "objective", "age", "geo", "tone", "language")
+TEXT_FIELDS = ("concept_title", "big_idea", "key_message")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def content_hash(brief_json: str, plan_json: str) -> str:
+    """Identity of a stored (brief, plan): the brief is serialized with sorted keys, the plan as decoded."""
+    return hashlib.sha1(f"{brief_json}\x00{plan_json}".encode("utf-8")).hexdigest()
+
+def fts_query(q: str) -> Optional[str]:
+    """User text -> FTS5 MATCH expression: every word must occur (last one as a prefix); no FTS syntax exposed."""
+    words = _WORD.findall(q or "")
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words[:-1]) + (" " if len(words) > 1 else "") + f'"{words[-1]}"*'
+
+def _row(brief: Dict[str, Any], plan: Dict[str, Any], source: Optional[str], created: float,
+         h: Optional[str] = None) -> Tuple:
+    aud = brief.get("audience") or {}
+    cons = brief.get("constraints") or {}
+    text = [plan.get(k) if isinstance(plan.get(k), str) else None for k in TEXT_FIELDS]
+    budget = brief.get("budget_thb")
+    bj, pj = json.dumps(brief, ensure_ascii=False, sort_keys=True), json.dumps(plan, ensure_ascii=False)
+    return (created, source, h or content_hash(bj, pj), brief.get("industry"), brief.get("objective"),
+            aud.get("age"), aud.get("geo"), float(budget) if isinstance(budget, (int, float)) else None,
+            cons.get("brand_tone"), brief.get("language"), *text, bj, pj)
+
+def _channels(plan: Dict[str, Any]) -> List[str]:
+    out = []
+    for c in plan.get("channels") or []:
+        name = c.get("name") if isinstance(c, dict) else c if isinstance(c, str) else None
+        if name and name not in out:
+            out.append(name)
+    return out
+
+_COLS = ("created, source, content_hash, industry, objective, age, geo, budget_thb, tone, language, concept_title, "
+         "big_idea, key_message, brief, plan")
+_INSERT = f"INSERT OR IGNORE INTO plans({_COLS}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+_INSERT_ID = f"INSERT INTO plans(id, {_COLS}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+_INSERT_FTS = "INSERT INTO plans_fts(rowid, concept_title, big_idea, key_message) VALUES (?,?,?,?)"
+_INSERT_CH = "INSERT OR IGNORE INTO plan_channels(channel, plan_id) VALUES (?,?)"
+
+class PlanStore:
+    """One writer (serialized by a lock), any number of readers; each thread gets its own connection (WAL)."""
+
+    def __init__(self, path: str, tokenizer: str = "unicode61 remove_diacritics 2"):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        con = self._con()
+        con.executescript(SCHEMA.replace("{tokenizer}", tokenizer))
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA temp_store=MEMORY")
+            con.execute("PRAGMA mmap_size=268435456")
+            con.row_factory = sqlite3.Row
+            self._local.con = con
+        return con
+
+    # ---------- writes
+
+    def _insert(self, con: sqlite3.Connection, brief: Dict[str, Any], plan: Dict[str, Any], source: Optional[str],
+                created: float, h: Optional[str] = None) -> Optional[int]:
+        row = _row(brief, plan, source, created, h)
+        cur = con.execute(_INSERT, row)
+        if cur.rowcount == 0:
+            return None  # same brief + plan already stored
+        pid = cur.lastrowid
+        con.execute(_INSERT_FTS, (pid, *row[10:13]))
+        con.executemany(_INSERT_CH, [(c, pid) for c in _channels(plan)])
+        return pid
+
+    def _insert_batch(self, con: sqlite3.Connection, batch: List[Tuple[Dict[str, Any], Dict[str, Any], Optional[str]]],
+                      source: Optional[str], created: float) -> int:
+        """executemany version of _insert for bulk loads: ids are assigned here (the write lock is held)."""
+        rows = {}
+        for brief, plan, h in batch:
+            row = _row(brief, plan, source, created, h)
+            rows.setdefault(row[2], (row, plan))
+        hashes = list(rows)
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            for (h,) in con.execute(f"SELECT content_hash FROM plans WHERE content_hash IN ({','.join('?' * len(chunk))})",
+                                    chunk):
+                rows.pop(h, None)
+        next_id = (con.execute("SELECT max(id) FROM plans").fetchone()[0] or 0) + 1
+        plans, fts, chans = [], [], []
+        for pid, (row, plan) in enumerate(rows.values(), next_id):
+            plans.append((pid, *row))
+            fts.append((pid, *row[10:13]))
+            chans.extend((c, pid) for c in _channels(plan))
+        con.executemany(_INSERT_ID, plans)
+        con.executemany(_INSERT_FTS, fts)
+        con.executemany(_INSERT_CH, chans)
+        return len(plans)
+
+    def add(self, brief: Dict[str, Any], plan: Dict[str, Any], source: Optional[str] = "api") -> Optional[int]:
+        """Store one plan; returns its id, or None if this exact brief + plan is already stored."""
+        con = self._con()
+        with self._write_lock:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                pid = self._insert(con, brief, plan, source, time.time())
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        return pid
+
+    def ingest(self, rows: Iterable[Dict[str, Any]], source: Optional[str] = None, batch_size: int = 5000,
+               fast: bool = False) -> Dict[str, int]:
+        """
+        Bulk-load {"input": brief, "output": plan} rows, one transaction per `batch_size` rows; rows already
+        stored (same brief + plan, or the same "_hash" if a row carries one) are skipped. `fast` turns off fsync
+        for the load (a crash mid-load can lose the database; use for rebuildable stores).
+        """
+        con = self._con()
+        stats = {"rows": 0, "added": 0, "duplicates": 0, "skipped": 0}
+        now = time.time()
+        with self._write_lock:
+            if fast:
+                con.execute("PRAGMA synchronous=OFF")
+            try:
+                batch: List[Tuple[Dict[str, Any], Dict[str, Any], Optional[str]]] = []
+                for r in rows:
+                    stats["rows"] += 1
+                    brief, plan = r.get("input"), r.get("output")
+                    if not isinstance(brief, dict) or not isinstance(plan, dict):
+                        stats["skipped"] += 1
+                        continue
+                    batch.append((brief, plan, r.get("_hash")))
+                    if len(batch) >= batch_size:
+                        con.execute("BEGIN IMMEDIATE")
+                        stats["added"] += self._insert_batch(con, batch, source, now)
+                        con.execute("COMMIT")
+                        batch = []
+                if batch:
+                    con.execute("BEGIN IMMEDIATE")
+                    stats["added"] += self._insert_batch(con, batch, source, now)
+                    con.execute("COMMIT")
+                stats["duplicates"] = stats["rows"] - stats["skipped"] - stats["added"]
+            except BaseException:
+                if con.in_transaction:
+                    con.execute("ROLLBACK")
+                raise
+            finally:
+                if fast:
+                    con.execute("PRAGMA synchronous=NORMAL")
+        return stats
+
+    def optimize(self) -> None:
+        """Merge FTS segments and refresh planner statistics (after a bulk load)."""
+        con = self._con()
+        with self._write_lock:
+            con.execute("INSERT INTO plans_fts(plans_fts) VALUES('optimize')")
+            con.execute("ANALYZE")
+
+    # ---------- reads
+
+    def get(self, plan_id: int) -> Optional[Dict[str, Any]]:
+        r = self._con().execute("SELECT id, created, source, brief, plan FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        if r is None:
+            return None
+        return {"id": r["id"], "created": r["created"], "source": r["source"], "brief": json.loads(r["brief"]),
+                "plan": json.loads(r["plan"])}
+
+    def count(self) -> int:
+        return self._con().execute("SELECT max(id) FROM plans").fetchone()[0] or 0
+
+    def search(self, q: Optional[str] = None, channels: Optional[List[str]] = None,
+               min_budget: Optional[float] = None, max_budget: Optional[float] = None,
+               limit: int = 20, cursor: Optional[int] = None, offset: int = 0, full: bool = False,
+               order: str = "recent", **filters: Optional[str]) -> Dict[str, Any]:
+        """
+        Filters: industry, objective, age, geo, tone, language (exact, case-insensitive), channels (all of them),
+        budget range, q (full text over title / big idea / key message). Newest first, continue with
+        `cursor` = next_cursor; with q and order="relevance": best match first (bm25), continue with `offset`.
+        """
+        if order not in ("recent", "relevance"):
+            raise ValueError(f"order must be recent or relevance, not {order!r}")
+        t0 = time.perf_counter()
+        match = fts_query(q) if q else None
+        if q and match is None:
+            return {"results": [], "next_cursor": None, "next_offset": None, "took_ms": 0.0}
+        ranked = bool(match) and order == "relevance"
+        channels = [c for c in channels or [] if c]
+        # the driving table is walked in id order and stops at the page limit; everything else is a point lookup
+        if match:
+            src, key, where, args = "plans_fts JOIN plans p ON p.id = plans_fts.rowid", "plans_fts.rowid", \
+                ["plans_fts MATCH ?"], [match]
+        elif channels:
+            src, key, where, args = "plan_channels c0 JOIN plans p ON p.id = c0.plan_id", "c0.plan_id", \
+                ["c0.channel = ?"], [channels.pop(0)]
+        else:
+            src, key, where, args = "plans p", "p.id", [], []
+        for k in FILTERS:
+            if filters.get(k):
+                where.append(f"p.{k} = ?")
+                args.append(filters[k])
+        # budget is checked per row on purpose (unary +, no index): a range scan would mean sorting most of the table
+        if min_budget is not None:
+            where.append("+p.budget_thb >= ?")
+            args.append(min_budget)
+        if max_budget is not None:
+            where.append("+p.budget_thb <= ?")
+            args.append(max_budget)
+        for ch in channels:
+            where.append("EXISTS (SELECT 1 FROM plan_channels c WHERE c.channel = ? AND c.plan_id = p.id)")
+            args.append(ch)
+        cols = "p.id, p.created, p.industry, p.objective, p.age, p.budget_thb, p.tone, p.concept_title, p.big_idea, " \
+               "p.key_message" + (", bm25(plans_fts) AS score" if match else "") + (", p.brief, p.plan" if full else "")
+        if ranked:
+            sql = f"SELECT {cols} FROM {src} WHERE {' AND '.join(where)} ORDER BY score LIMIT ? OFFSET ?"
+            args += [limit + 1, max(0, offset)]
+        else:
+            if cursor is not None:
+                where.append(f"{key} < ?")
+                args.append(cursor)
+            sql = f"SELECT {cols} FROM {src}{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {key} DESC LIMIT ?"
+            args.append(limit + 1)
+        rows = self._con().execute(sql, args).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        results = []
+        for r in rows:
+            hit = {k: r[k] for k in ("id", "created", "industry", "objective", "age", "budget_thb", "tone",
+                                     "concept_title", "big_idea", "key_message")}
+            if match:
+                hit["score"] = round(-r["score"], 4)  # bm25 is lower-is-better; flip for readers
+            if full:
+                hit["brief"], hit["plan"] = json.loads(r["brief"]), json.loads(r["plan"])
+            results.append(hit)
+        return {
+            "results": results,
+            "next_cursor": results[-1]["id"] if more and not ranked else None,
+            "next_offset": max(0, offset) + limit if more and ranked else None,
+            "took_ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
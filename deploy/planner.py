@@ -0,0 +1,110 @@
+# Deterministic budget and timeline solver. The model picks the channels and writes the creative
+# fields; budget_split and timeline_weeks are computed here from the channels, objective, budget and
+# constraints, together with absolute THB per channel and per week (flighting).
+from __future__ import annotations
+import re
+from typing import Dict, Any, List, Tuple
+
+from config import TIMELINE_MIN_WEEKS, TIMELINE_MAX_WEEKS, PLANNER_MIN_WEEKLY_THB
+from utils import _renorm_pairs
+
+# plan fields the solver owns; with PLAN_SOLVER on they are neither requested from nor decoded by the model
+SOLVED_FIELDS = ["timeline_weeks", "budget_split"]
+
+# channel role by a word in its name, first match wins; unknown channels count as reach
+_ROLE_WORDS = [
+    ("crm", {"line", "email", "newsletter", "crm", "loyalty", "app", "notifications", "sms"}),
+    ("retail", {"retail", "store", "pos", "shop", "events", "event", "experiential", "sampling"}),
+    ("reach", {"tiktok", "youtube", "video", "tv", "outdoor", "ooh", "print", "influencer", "social",
+               "facebook", "instagram", "twitter", "snapchat", "linkedin", "content"}),
+    ("performance", {"search", "google", "sem", "seo", "ads", "advertising", "native", "affiliate", "marketplace"}),
+]
+
+# relative weight of each role per objective
+OBJECTIVE_ROLE_WEIGHTS = {
+    "awareness":   {"reach": 1.0, "performance": 0.6, "retail": 0.4, "crm": 0.3},
+    "acquisition": {"reach": 0.7, "performance": 1.0, "retail": 0.5, "crm": 0.6},
+    "retention":   {"reach": 0.4, "performance": 0.5, "retail": 0.7, "crm": 1.0},
+    "loyalty":     {"reach": 0.5, "performance": 0.4, "retail": 0.8, "crm": 1.0},
+    "upsell":      {"reach": 0.4, "performance": 0.8, "retail": 0.8, "crm": 1.0},
+}
+MANDATORY_BOOST = 1.5
+
+# default flight length per objective; shortened when the weekly spend would fall below PLANNER_MIN_WEEKLY_THB
+OBJECTIVE_WEEKS = {"awareness": 8, "acquisition": 12, "retention": 16, "loyalty": 16, "upsell": 8}
+
+def _norm(name: Any) -> str:
+    return str(name or "").strip().lower()
+
+def channel_role(name: str) -> str:
+    words = set(re.findall(r"[a-z0-9]+", _norm(name)))
+    for role, keys in _ROLE_WORDS:
+        if words & keys:
+            return role
+    return "reach"
+
+def solve_split(channels: List[str], brief: Dict[str, Any]) -> List[List[Any]]:
+    """[[channel, fraction]] summing to 1.0; banned channels get nothing."""
+    cons = brief.get("constraints") or {}
+    banned = {_norm(c) for c in cons.get("banned_channels") or []}
+    mandatory = {_norm(c) for c in cons.get("mandatory_channels") or []}
+    weights = OBJECTIVE_ROLE_WEIGHTS.get(_norm(brief.get("objective")), OBJECTIVE_ROLE_WEIGHTS["awareness"])
+    pairs: List[Tuple[str, float]] = []
+    for c in dict.fromkeys(channels):
+        if _norm(c) in banned:
+            continue
+        w = weights[channel_role(c)]
+        pairs.append((c, w * MANDATORY_BOOST if _norm(c) in mandatory else w))
+    return _renorm_pairs(pairs)
+
+def solve_weeks(brief: Dict[str, Any]) -> int:
+    budget = float(brief.get("budget_thb") or 0)
+    weeks = OBJECTIVE_WEEKS.get(_norm(brief.get("objective")), 12)
+    if PLANNER_MIN_WEEKLY_THB > 0:
+        weeks = min(weeks, int(budget // PLANNER_MIN_WEEKLY_THB))
+    return max(TIMELINE_MIN_WEEKS, min(TIMELINE_MAX_WEEKS, weeks))
+
+def _split_int(total: int, weights: List[float]) -> List[int]:
+    """Integer parts of `total` proportional to `weights`; rounding drift goes to the largest part."""
+    s = sum(weights)
+    if not weights or s <= 0:
+        return [0] * len(weights)
+    parts = [int(round(total * w / s)) for w in weights]
+    parts[max(range(len(parts)), key=lambda i: parts[i])] += total - sum(parts)
+    return parts
+
+def flight_shape(objective: str, weeks: int) -> List[float]:
+    """Relative weekly weight: awareness bursts at launch, acquisition ramps up, the rest run even."""
+    obj = _norm(objective)
+    if obj == "awareness":
+        launch = max(1, weeks // 4)
+        return [1.5 if i < launch else 1.0 for i in range(weeks)]
+    if obj == "acquisition" and weeks > 1:
+        return [0.8 + 0.4 * i / (weeks - 1) for i in range(weeks)]
+    return [1.0] * weeks
+
+def solve_budget(split: List[List[Any]], weeks: int, brief: Dict[str, Any]) -> Dict[str, Any]:
+    """Absolute THB per channel and per week for a solved split; all amounts sum to budget_thb."""
+    total = int(round(float(brief.get("budget_thb") or 0)))
+    per_channel = _split_int(total, [f for _, f in split])
+    shape = flight_shape(brief.get("objective"), weeks)
+    grid = {c: _split_int(thb, shape) for (c, _), thb in zip(split, per_channel)}
+    return {
+        "total_thb": total,
+        "currency": "THB",
+        "channels": [{"channel": c, "share": f, "thb": thb} for (c, f), thb in zip(split, per_channel)],
+        "weekly": [{"week": i + 1, "thb": sum(g[i] for g in grid.values()),
+                    "channels": {c: g[i] for c, g in grid.items()}} for i in range(weeks)],
+    }
+
+def solve_plan(plan: Dict[str, Any], brief: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Overwrite plan["timeline_weeks"] / plan["budget_split"] (in place) from the plan's channels and the
+    brief; returns the THB breakdown {total_thb, currency, channels[], weekly[]}.
+    """
+    names = [c.get("name") if isinstance(c, dict) else c for c in plan.get("channels") or []]
+    split = solve_split([str(n) for n in names if n], brief)
+    weeks = solve_weeks(brief)
+    plan["timeline_weeks"] = weeks
+    plan["budget_split"] = split
+    return solve_budget(split, weeks, brief)
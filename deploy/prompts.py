@@ -2,7 +2,14 @@
 import json
 from typing import Dict, Any, List
 
-def build_user_prompt(inp: Dict[str, Any]) -> str:
+from config import PLAN_SOLVER, OUTPUT_FORMAT
+
+PROMPT_FIELDS = ["concept_title", "big_idea", "key_message", "channels[]", "assets[]", "timeline_weeks",
+                 "budget_split[]", "kpis{}"]
+SOLVED_PROMPT_FIELDS = ("timeline_weeks", "budget_split[]")  # computed by planner.py when PLAN_SOLVER is on
+
+def build_user_prompt(inp: Dict[str, Any], solver: bool = PLAN_SOLVER, compact: bool = OUTPUT_FORMAT == "compact") -> str:
+    fields = [f for f in PROMPT_FIELDS if not (solver and f in SOLVED_PROMPT_FIELDS)]
     return (
         "Brief:\n"
         f"- Industry: {inp['industry']}\n"
@@ -10,8 +17,7 @@ def build_user_prompt(inp: Dict[str, Any]) -> str:
         f"- Budget (THB): {inp['budget_thb']}\n"
         f"- Objective: {inp['objective']}\n"
         f"- Constraints: {json.dumps(inp.get('constraints', {}), ensure_ascii=False)}\n\n"
-        "JSON fields to produce: concept_title, big_idea, key_message, channels[], assets[], "
-        "timeline_weeks, budget_split[], kpis{}"
+        + ("Compact plan lines to produce: " if compact else "JSON fields to produce: ") + ", ".join(fields)
     )
 
 def as_chat_messages(system_prompt: str, user_prompt: str) -> list[dict]:
@@ -0,0 +1,155 @@
+# Per-client accounting and quotas (CLIENTS_PATH). API keys map to named clients; each client has a scheduling
+# weight, a token-bucket quota in *generated* tokens per minute, and caps on queued / running requests. The
+# admission queue (admission.py, SCHED_POLICY=wfq) serves clients in weighted-fair order by those tokens, so an
+# interactive client with weight 8 waits behind at most one bulk generation while a weight-1 bulk job soaks up
+# whatever capacity is left.
+#
+# CLIENTS_PATH is JSON:
+#   {"clients": {
+#       "ui":       {"keys": ["<key>"], "weight": 8},
+#       "crm-bulk": {"keys": ["<key>"], "weight": 1, "tokens_per_min": 30000, "burst": 60000,
+#                    "max_queued": 2, "max_in_flight": 1}},
+#    "anonymous": "ui"}          # requests without X-API-Key run as this client (omit: they get 401)
+# tokens_per_min 0 / absent = no quota; burst defaults to one minute of tokens.
+from __future__ import annotations
+import json, threading, time
+from collections import deque
+from typing import Dict, Any, Deque, Optional, Tuple
+
+from metrics import METRICS
+
+ANONYMOUS = "anonymous"
+
+class UnknownClient(Exception):
+    """An API key that is not in CLIENTS_PATH (or no key, when there is no anonymous client)."""
+
+class ClientPolicy:
+    __slots__ = ("name", "weight", "tokens_per_min", "burst", "max_queued", "max_in_flight")
+
+    def __init__(self, name: str, weight: float = 1.0, tokens_per_min: float = 0.0, burst: Optional[float] = None,
+                 max_queued: Optional[int] = None, max_in_flight: Optional[int] = None):
+        if weight <= 0:
+            raise ValueError(f"client {name!r}: weight must be > 0")
+        self.name = name
+        self.weight = float(weight)
+        self.tokens_per_min = float(tokens_per_min or 0)
+        self.burst = float(burst if burst is not None else self.tokens_per_min)
+        self.max_queued = max_queued
+        self.max_in_flight = max_in_flight
+
+class TokenBucket:
+    """
+    Refills at `rate_per_s` up to `capacity`. Generations are charged what they actually produced, so the level
+    can go negative (a long plan overdraws); the client is admitted again once it is back at >= 0.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._level = capacity
+        self._t = time.monotonic()
+
+    def level(self) -> float:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._t) * self.rate_per_s)
+        self._t = now
+        return self._level
+
+    def take(self, n: float) -> None:
+        self._level = self.level() - n
+
+    def wait_s(self) -> float:
+        """Seconds until the level is back at 0 (0 if it already is)."""
+        level = self.level()
+        return 0.0 if level >= 0 else -level / self.rate_per_s
+
+class ClientRegistry:
+    """Key -> client resolution, per-client buckets and throughput counters. Thread-safe."""
+
+    def __init__(self, policies: Dict[str, ClientPolicy], keys: Dict[str, str], anonymous: Optional[str] = None,
+                 default_cost: float = 512.0):
+        self.policies = policies
+        self.keys = keys
+        self.anonymous = anonymous
+        self.default_cost = default_cost  # scheduling cost when the length model has no estimate
+        self._lock = threading.Lock()
+        self._buckets = {n: TokenBucket(p.tokens_per_min / 60.0, p.burst)
+                         for n, p in policies.items() if p.tokens_per_min > 0}
+        self._recent: Dict[str, Deque[Tuple[float, int]]] = {n: deque() for n in policies}
+
+    @classmethod
+    def load(cls, path: str, default_cost: float = 512.0) -> "ClientRegistry":
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        policies, keys = {}, {}
+        for name, spec in (cfg.get("clients") or {}).items():
+            spec = dict(spec)
+            for key in spec.pop("keys", []):
+                if key in keys:
+                    raise ValueError(f"{path}: key listed for both {keys[key]!r} and {name!r}")
+                keys[key] = name
+            policies[name] = ClientPolicy(name, **spec)
+        anonymous = cfg.get("anonymous")
+        if anonymous is not None and anonymous not in policies:
+            raise ValueError(f"{path}: anonymous client {anonymous!r} is not defined under clients")
+        return cls(policies, keys, anonymous, default_cost)
+
+    @classmethod
+    def single(cls, default_cost: float = 512.0) -> "ClientRegistry":
+        """No CLIENTS_PATH: everyone is one unlimited client (per-client metrics still work)."""
+        return cls({ANONYMOUS: ClientPolicy(ANONYMOUS)}, {}, ANONYMOUS, default_cost)
+
+    def resolve(self, api_key: Optional[str]) -> str:
+        """Client name for an X-API-Key header value; UnknownClient if it is not allowed in."""
+        if api_key:
+            name = self.keys.get(api_key)
+            if name is None:
+                raise UnknownClient("Unknown API key")
+            return name
+        if self.anonymous is None:
+            raise UnknownClient("X-API-Key required")
+        return self.anonymous
+
+    def policy(self, name: str) -> ClientPolicy:
+        # names arrive from API workers over the model-server socket; fall back rather than fail there
+        return self.policies.get(name) or self.policies.get(self.anonymous or "") or ClientPolicy(name)
+
+    # ---------- quota
+
+    def quota_wait_s(self, name: str) -> float:
+        """0 if `name` may start a generation now, else seconds until its bucket is back above zero."""
+        b = self._buckets.get(name)
+        if b is None:
+            return 0.0
+        with self._lock:
+            return b.wait_s()
+
+    def charge(self, name: str, tokens: float) -> None:
+        b = self._buckets.get(name)
+        if b is not None:
+            with self._lock:
+                b.take(tokens)
+
+    # ---------- accounting
+
+    def record(self, name: str, tokens: int) -> None:
+        """Generated tokens of a finished (or cancelled) generation."""
+        METRICS.inc("client_generated_tokens_total", tokens, client=name)
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.setdefault(name, deque())
+            recent.append((now, tokens))
+            while recent and recent[0][0] < now - 60.0:
+                recent.popleft()
+
+    def publish(self) -> None:
+        """Refresh the per-client gauges: quota level and generated tokens over the last minute."""
+        now = time.monotonic()
+        with self._lock:
+            for name, b in self._buckets.items():
+                METRICS.set("client_quota_tokens", round(b.level(), 1), client=name)
+                METRICS.set("client_quota_capacity", b.capacity, client=name)
+            for name, recent in self._recent.items():
+                while recent and recent[0][0] < now - 60.0:
+                    recent.popleft()
+                METRICS.set("client_tokens_per_min", sum(n for _, n in recent), client=name)
@@ -0,0 +1,184 @@
+# Field-level refinement: re-decode only the plan fields an edit to the brief affects.
+# Untouched fields are written into the assistant turn as a fixed JSON prefix (prefilled, not decoded);
+# the model continues the object with the affected fields only.
+from __future__ import annotations
+import json, time
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (SYSTEM_PROMPT, DEFAULT_SCHEMA, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P, PLAN_SOLVER, OUTPUT_FORMAT,
+                    MEMORY_META)
+from prompts import build_user_prompt, as_chat_messages
+from utils import extract_balanced_json, normalize_budget_split
+from validators import validate_plan
+from backends import InferenceBackend, get_backend
+from cancellation import CancelToken
+from generator import generate_plan_with, _check_cancelled
+from compliance import check_and_repair
+from planner import SOLVED_FIELDS, solve_plan
+from compact import encode_plan, decode_plan
+from metrics import METRICS
+from memdiag import measured
+
+PLAN_FIELDS = ["concept_title", "big_idea", "key_message", "channels", "assets", "timeline_weeks",
+               "budget_split", "kpis"]
+
+# brief field -> plan fields that depend on it; None = everything (the concept itself changes)
+EDIT_IMPACT: Dict[str, Optional[List[str]]] = {
+    "industry": None,
+    "audience": None,
+    "objective": ["key_message", "channels", "budget_split", "kpis"],
+    "budget_thb": ["channels", "budget_split", "kpis"],
+    "mandatory_channels": ["channels", "budget_split", "kpis"],
+    "banned_channels": ["channels", "budget_split", "kpis"],
+    "brand_tone": ["concept_title", "big_idea", "key_message", "assets"],
+    "language": ["concept_title", "big_idea", "key_message", "assets"],
+}
+
+def apply_edit(brief: Dict[str, Any], edit: Dict[str, Any]) -> Dict[str, Any]:
+    """New brief = brief with the non-null edit fields replaced (constraints merged key by key)."""
+    out = json.loads(json.dumps(brief))
+    for k, v in edit.items():
+        if v is None:
+            continue
+        if k == "constraints":
+            cons = dict(out.get("constraints") or {})
+            cons.update({ck: cv for ck, cv in v.items() if cv is not None})
+            out["constraints"] = cons
+        else:
+            out[k] = v
+    return out
+
+def affected_fields(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Plan fields to regenerate for old -> new brief, in schema order."""
+    hit = set()
+    oc, nc = old.get("constraints") or {}, new.get("constraints") or {}
+    changed = [k for k in ("industry", "audience", "objective", "budget_thb", "language") if old.get(k) != new.get(k)]
+    changed += [k for k in ("mandatory_channels", "banned_channels", "brand_tone")
+                if (oc.get(k) or None) != (nc.get(k) or None)]
+    for k in changed:
+        fields = EDIT_IMPACT[k]
+        if fields is None:
+            return list(PLAN_FIELDS)
+        hit.update(fields)
+    return [f for f in PLAN_FIELDS if f in hit]
+
+def fixed_prefix(plan: Dict[str, Any], keep: List[str], fmt: str = OUTPUT_FORMAT) -> str:
+    """'{"concept_title": ..., "assets": [...], ' -- the model continues with the next key.
+    Compact format: the kept fields' lines, the model continues with the next line."""
+    if fmt == "compact":
+        return encode_plan({k: plan[k] for k in keep}) + "\n" if keep else ""
+    body = ", ".join(f"{json.dumps(k)}: {json.dumps(plan[k], ensure_ascii=False)}" for k in keep)
+    return "{" + (body + ", " if body else "")
+
+def _decoded(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of `plan` a from-scratch generation decodes (solved fields are computed, not decoded)."""
+    return {k: v for k, v in plan.items() if not (PLAN_SOLVER and k in SOLVED_FIELDS)}
+
+def refine_plan(brief: Dict[str, Any], plan: Dict[str, Any], fields: List[str],
+                schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                temperature: float = GEN_TEMPERATURE,
+                top_p: float = GEN_TOP_P,
+                cancel: Optional[CancelToken] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    _check_cancelled(cancel)
+    if MEMORY_META:
+        return measured(refine_plan_with, get_backend(), brief, plan, fields, schema, max_new_tokens, temperature,
+                        top_p, cancel)
+    return refine_plan_with(get_backend(), brief, plan, fields, schema, max_new_tokens, temperature, top_p, cancel)
+
+def refine_plan_with(backend: InferenceBackend,
+                     brief: Dict[str, Any],
+                     plan: Dict[str, Any],
+                     fields: List[str],
+                     schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                     max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                     temperature: float = GEN_TEMPERATURE,
+                     top_p: float = GEN_TOP_P,
+                     cancel: Optional[CancelToken] = None,
+                     repair: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Regenerate `fields` of `plan` for the (edited) `brief`; everything else is kept verbatim.
+    meta adds: refined_fields, full_regen_tokens (tokens a from-scratch decode of the result
+    would emit) and tokens_saved. `repair=False` skips the compliance repair pass (used by it).
+    With PLAN_SOLVER on, solved fields are recomputed instead of decoded (meta adds budget).
+    """
+    requested = bool(fields)
+    solved = SOLVED_FIELDS if PLAN_SOLVER else []
+    # missing fields get generated too
+    fields = [k for k in PLAN_FIELDS if (k in fields or k not in plan) and k not in solved]
+    keep = [k for k in PLAN_FIELDS if k not in fields and k not in solved] + [k for k in plan if k not in PLAN_FIELDS]
+    if not fields:
+        out = dict(plan)
+        meta = {"elapsed_ms": 0, "attempts": 0, "backend": backend.name, "prompt_tokens": 0,
+                "new_tokens": 0, "finish_reason": "stop", "refined_fields": [],
+                "full_regen_tokens": backend.count_tokens(json.dumps(_decoded(out), ensure_ascii=False)),
+                "tokens_saved": None, "warnings": [] if requested else ["Edit does not affect any plan field."]}
+        if solved:
+            meta["budget"] = solve_plan(out, brief)
+        return out, meta
+    if not keep:
+        # nothing to anchor on: plain generation (without another repair pass when this is one)
+        out, meta = generate_plan_with(backend, brief, schema, max_new_tokens, temperature, top_p, cancel,
+                                       repair=repair)
+        meta.update(refined_fields=list(PLAN_FIELDS), full_regen_tokens=meta["new_tokens"], tokens_saved=0)
+        return out, meta
+
+    t0 = time.time()
+    warnings: List[str] = []
+    prefix = fixed_prefix(plan, keep)
+    prompt = backend.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(brief))) + prefix
+    comp = backend.generate(prompt, max_new_tokens, temperature, top_p, cancel)
+    _check_cancelled(cancel, comp.new_tokens)
+
+    meta = {
+        "elapsed_ms": 0,
+        "attempts": 1,
+        "backend": backend.name,
+        "prompt_tokens": comp.prompt_tokens,
+        "new_tokens": comp.new_tokens,
+        "finish_reason": comp.finish_reason,
+        "refined_fields": list(fields),
+        "warnings": warnings,
+    }
+    try:
+        if OUTPUT_FORMAT == "compact":
+            cont = decode_plan(comp.text)
+        else:
+            block = extract_balanced_json(prefix + comp.text)
+            cont = json.loads(block) if block else None
+    except Exception:
+        cont = None
+    if not isinstance(cont, dict):
+        warnings.append(("Compact decode" if OUTPUT_FORMAT == "compact" else "JSON parse") +
+                        " failed; returning raw continuation in 'plan_raw'.")
+        meta.update(elapsed_ms=int((time.time() - t0) * 1000), full_regen_tokens=None, tokens_saved=None)
+        return {"plan_raw": prefix + comp.text}, meta
+
+    out: Dict[str, Any] = {}
+    for k in PLAN_FIELDS + [k for k in plan if k not in PLAN_FIELDS]:
+        if k not in fields:
+            if k in plan:
+                out[k] = plan[k]  # the model may echo kept keys; the prefix wins
+        elif k in cont:
+            out[k] = cont[k]
+        elif k in plan:
+            out[k] = plan[k]
+            warnings.append(f"'{k}' was not regenerated; kept the previous value.")
+
+    normalize_budget_split(out)
+    if solved:
+        meta["budget"] = solve_plan(out, brief)
+    ok, err = validate_plan(out, schema)
+    if not ok:
+        warnings.append(f"Schema validation failed: {err}")
+    if repair:
+        out = check_and_repair(backend, brief, out, meta, schema, max_new_tokens, temperature, top_p, cancel)
+
+    full = backend.count_tokens(json.dumps(_decoded(out), ensure_ascii=False))
+    meta.update(full_regen_tokens=full, tokens_saved=max(0, full - meta["new_tokens"]),
+                elapsed_ms=int((time.time() - t0) * 1000))
+    if repair:  # user-facing refine, not a compliance repair pass
+        METRICS.inc("refine_requests_total")
+        METRICS.inc("refine_tokens_decoded_total", meta["new_tokens"])
+        METRICS.inc("refine_tokens_full_regen_total", full)
+    return out, meta
@@ -0,0 +1,303 @@
+# K CPU model replicas, each pinned to its own core set (one NUMA node where possible)
+# with its own torch thread pool, behind a least-loaded dispatcher.
+from __future__ import annotations
+import glob, itertools, os, sys, threading, time
+import multiprocessing as mp
+from multiprocessing.connection import wait as wait_any
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import DEFAULT_SCHEMA, MEMORY_META
+from cancellation import CancelToken, GenerationCancelled
+from metrics import METRICS
+
+def _parse_cpulist(s: str) -> List[int]:
+    """'0-3,8-11' -> [0, 1, 2, 3, 8, 9, 10, 11]"""
+    out: List[int] = []
+    for part in s.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-")
+            out.extend(range(int(a), int(b) + 1))
+        else:
+            out.append(int(part))
+    return out
+
+def numa_nodes() -> List[List[int]]:
+    """Usable CPUs grouped by NUMA node (a single group if the host exposes no topology)."""
+    allowed = os.sched_getaffinity(0)
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path) as f:
+            cpus = [c for c in _parse_cpulist(f.read()) if c in allowed]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(allowed)]
+
+def numa_core_sets(k: int) -> List[List[int]]:
+    """
+    Split usable CPUs into k disjoint core sets. Replicas are spread round-robin over NUMA
+    nodes (weighted by their core counts) and a node's cores are divided evenly among its
+    replicas, so no replica straddles a socket unless k < number of nodes (then each replica
+    gets whole nodes). Raises ValueError if there are fewer usable CPUs than replicas.
+    """
+    nodes = numa_nodes()
+    n_cpus = sum(len(node) for node in nodes)
+    if k > n_cpus:
+        raise ValueError(f"{k} replicas need at least {k} usable CPUs, found {n_cpus}")
+    if k <= len(nodes):
+        sets: List[List[int]] = [[] for _ in range(k)]
+        for i, node in enumerate(nodes):
+            sets[i % k].extend(node)
+        return sets
+    per_node: List[int] = [0] * len(nodes)
+    for _ in range(k):  # next replica goes where it gets the most cores (never more replicas than cores)
+        j = max(range(len(nodes)), key=lambda j: len(nodes[j]) / (per_node[j] + 1))
+        per_node[j] += 1
+    sets = []
+    for node, n in zip(nodes, per_node):
+        if not n:
+            continue
+        step = len(node) / n
+        for j in range(n):
+            sets.append(node[int(j * step):int((j + 1) * step)])
+    return sets
+
+def _replica_main(idx: int, cores: List[int], backend_name: str, load_kwargs: Dict[str, Any],
+                  jobs, results, cancel_id) -> None:
+    """Replica process: pin, load once, then serve jobs from its own queue one at a time."""
+    try:
+        if cores:
+            os.sched_setaffinity(0, cores)
+        from backends import get_backend
+        from generator import generate_plan_with
+        from refine import refine_plan_with
+        from memdiag import measured
+        backend = get_backend(backend_name, num_threads=max(1, len(cores)), **load_kwargs)
+    except Exception as e:
+        results.send(("failed", idx, f"{type(e).__name__}: {e}"))
+        return
+    results.send(("ready", idx, None))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, op, payload, gen_kwargs, timeout_s = job
+        cancel = CancelToken(timeout_s=timeout_s)
+        done = threading.Event()
+
+        def _watch():
+            while not done.wait(0.05):
+                if cancel_id.value == job_id:
+                    cancel.cancel("disconnect")
+                    return
+        threading.Thread(target=_watch, daemon=True).start()
+        try:
+            fn = refine_plan_with if op == "refine" else generate_plan_with
+            if MEMORY_META:
+                plan, meta = measured(fn, backend, *payload, cancel=cancel, **gen_kwargs)
+            else:
+                plan, meta = fn(backend, *payload, cancel=cancel, **gen_kwargs)
+            meta["replica"] = idx
+            results.send((job_id, True, (plan, meta)))
+        except GenerationCancelled as e:
+            results.send((job_id, False, ("GenerationCancelled", e.reason, e.new_tokens)))
+        except Exception as e:
+            results.send((job_id, False, (type(e).__name__, str(e), 0)))
+        finally:
+            done.set()
+
+class _Replica:
+    def __init__(self, idx: int, cores: List[int], proc, jobs, results, cancel_id):
+        self.idx = idx
+        self.cores = cores
+        self.proc = proc
+        self.jobs = jobs
+        self.results = results
+        self.cancel_id = cancel_id
+        self.outstanding = 0
+        self.served = 0
+        self.dead = False
+
+class ReplicaPool:
+    """
+    Least-loaded dispatch over K pinned CPU replicas. Each replica holds at most
+    `max_outstanding` jobs; further submissions wait in the parent (admission bounds them).
+    A replica process that dies fails its pending jobs and gets no new ones.
+    """
+
+    def __init__(self, k: int, backend: str = "hf-cpu", load_kwargs: Optional[Dict[str, Any]] = None,
+                 core_sets: Optional[List[List[int]]] = None, max_outstanding: int = 1,
+                 start_timeout_s: float = 1800.0):
+        ctx = mp.get_context("spawn")  # fork + an initialized torch runtime is not safe
+        self.core_sets = core_sets or numa_core_sets(k)
+        self.max_outstanding = max(1, max_outstanding)
+        self._cv = threading.Condition()
+        self._closed = threading.Event()
+        self._pending: Dict[int, Tuple[Future, _Replica]] = {}
+        self._ids = itertools.count()
+        self.replicas: List[_Replica] = []
+        for i, cores in enumerate(self.core_sets):
+            # a pipe per replica and a lock-free cancel slot: a replica killed mid-write must not hold a lock the
+            # parent or the other replicas need
+            jobs = ctx.Queue()
+            results, sink = ctx.Pipe(duplex=False)
+            cancel_id = ctx.Value("q", -1, lock=False)
+            proc = ctx.Process(target=_replica_main, args=(i, cores, backend, load_kwargs or {}, jobs, sink, cancel_id),
+                               daemon=True, name=f"replica-{i}")
+            proc.start()
+            sink.close()  # the replica now holds the only write end: EOF on `results` means it exited
+            self.replicas.append(_Replica(i, cores, proc, jobs, results, cancel_id))
+
+        deadline = time.monotonic() + start_timeout_s
+        for rep in self.replicas:
+            try:
+                if not rep.results.poll(max(1.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"not ready after {start_timeout_s:.0f}s")
+                kind, _, err = rep.results.recv()
+            except TimeoutError as e:
+                kind, err = "failed", str(e)
+            except EOFError:
+                rep.proc.join(timeout=1)
+                kind, err = "failed", f"exited with code {rep.proc.exitcode}"
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"replica {rep.idx} failed to start: {err}")
+        self._collector = threading.Thread(target=self._collect, daemon=True, name="replica-results")
+        self._collector.start()
+
+    def _collect(self) -> None:
+        while not self._closed.is_set():
+            live = {r.results: r for r in self.replicas if not r.dead}
+            if not live:
+                return
+            for conn in wait_any(list(live), timeout=0.5):
+                try:
+                    job_id, ok, payload = conn.recv()
+                except (EOFError, OSError):
+                    if self._closed.is_set():
+                        return  # close() shut it down
+                    self._fail(live[conn])
+                else:
+                    self._deliver(job_id, ok, payload)
+
+    def _deliver(self, job_id: int, ok: bool, payload) -> None:
+        with self._cv:
+            fut, rep = self._pending.pop(job_id, (None, None))
+            if rep is not None:
+                rep.outstanding -= 1
+                rep.served += 1
+                METRICS.set("replica_outstanding", rep.outstanding, replica=rep.idx)
+            self._cv.notify_all()
+        if fut is None:
+            return
+        if ok:
+            plan, meta = payload
+            METRICS.inc("replica_jobs_total", replica=rep.idx)
+            METRICS.inc("replica_new_tokens_total", meta.get("new_tokens", 0), replica=rep.idx)
+            fut.set_result((plan, meta))
+        elif payload[0] == "GenerationCancelled":
+            METRICS.inc("generation_cancelled_total", reason=payload[1])
+            fut.set_exception(GenerationCancelled(payload[1], payload[2]))
+        else:
+            fut.set_exception(RuntimeError(f"replica {rep.idx} error ({payload[0]}): {payload[1]}"))
+
+    def _fail(self, rep: _Replica) -> None:
+        """Take a dead replica out of dispatch and fail the jobs it will never answer."""
+        rep.proc.join(timeout=1)  # reap it (and learn its exit code)
+        with self._cv:
+            rep.dead = True
+            lost = [job_id for job_id, (_, r) in self._pending.items() if r is rep]
+            futs = [self._pending.pop(job_id)[0] for job_id in lost]
+            rep.outstanding = 0
+            METRICS.set("replica_outstanding", 0, replica=rep.idx)
+            METRICS.inc("replica_deaths_total", replica=rep.idx)
+            self._cv.notify_all()
+        print(f"[WARN] replica {rep.idx} (pid {rep.proc.pid}) exited with code {rep.proc.exitcode}; "
+              f"{len(futs)} job(s) failed, {sum(not r.dead for r in self.replicas)} replica(s) left", file=sys.stderr)
+        for fut in futs:
+            fut.set_exception(RuntimeError(f"replica {rep.idx} died (exit code {rep.proc.exitcode})"))
+
+    def _pick(self) -> _Replica:
+        """Fewest outstanding jobs wins; ties go to the replica that has served least. Dead replicas are skipped."""
+        live = [r for r in self.replicas if not r.dead]
+        if not live:
+            raise RuntimeError("no live replicas")
+        return min(live, key=lambda r: (r.outstanding, r.served, r.idx))
+
+    def submit(self, brief: Dict[str, Any], schema: Dict[str, Any] = DEFAULT_SCHEMA,
+               timeout_s: Optional[float] = None, **gen_kwargs) -> Tuple[int, Future]:
+        return self._submit("generate", (brief, schema), timeout_s, gen_kwargs)
+
+    def _submit(self, op: str, payload: tuple, timeout_s: Optional[float],
+                gen_kwargs: Dict[str, Any]) -> Tuple[int, Future]:
+        fut: Future = Future()
+        with self._cv:
+            while self._pick().outstanding >= self.max_outstanding:
+                self._cv.wait()
+            rep = self._pick()
+            job_id = next(self._ids)
+            rep.outstanding += 1
+            self._pending[job_id] = (fut, rep)
+            METRICS.set("replica_outstanding", rep.outstanding, replica=rep.idx)
+        rep.jobs.put((job_id, op, payload, gen_kwargs, timeout_s))
+        return job_id, fut
+
+    def cancel(self, job_id: int) -> None:
+        with self._cv:
+            entry = self._pending.get(job_id)
+        if entry is not None:
+            entry[1].cancel_id.value = job_id
+
+    def generate_campaign_plan(self, brief: Dict[str, Any],
+                               schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                               cancel: Optional[CancelToken] = None,
+                               **gen_kwargs) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Same contract as generator.generate_campaign_plan, run on the least-loaded replica."""
+        return self._wait(*self._submit("generate", (brief, schema), self._timeout(cancel), gen_kwargs), cancel)
+
+    def refine_plan(self, brief: Dict[str, Any], plan: Dict[str, Any], fields: List[str],
+                    schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                    cancel: Optional[CancelToken] = None,
+                    **gen_kwargs) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Same contract as refine.refine_plan, run on the least-loaded replica."""
+        return self._wait(*self._submit("refine", (brief, plan, fields, schema), self._timeout(cancel), gen_kwargs),
+                          cancel)
+
+    @staticmethod
+    def _timeout(cancel: Optional[CancelToken]) -> Optional[float]:
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+            return cancel.remaining()
+        return None
+
+    def _wait(self, job_id: int, fut: Future, cancel: Optional[CancelToken]):
+        while True:
+            try:
+                return fut.result(timeout=0.25)
+            except FutureTimeout:
+                if cancel is not None and cancel.cancelled:
+                    self.cancel(job_id)
+
+    def pids(self) -> List[Optional[int]]:
+        return [r.proc.pid for r in self.replicas]
+
+    def alive(self) -> List[bool]:
+        return [r.proc.is_alive() for r in self.replicas]
+
+    def close(self) -> None:
+        self._closed.set()
+        for r in self.replicas:
+            if r.proc.is_alive():
+                r.jobs.put(None)
+        for r in self.replicas:
+            r.proc.join(timeout=10)
+            if r.proc.is_alive():
+                r.proc.terminate()
+        collector = getattr(self, "_collector", None)
+        if collector is not None:
+            collector.join(timeout=5)
+        for r in self.replicas:
+            r.results.close()
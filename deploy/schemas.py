@@ -18,6 +18,7 @@ class CampaignRequest(BaseModel):
     objective: str = Field(..., example="awareness")
     constraints: Optional[Constraints] = None
     language: Optional[str] = Field(None, description="Optional hint for output copy language, e.g., 'TH' or 'EN'")
+    timeout_s: Optional[float] = Field(None, gt=0, description="Optional deadline in seconds; generation stops once it passes (header X-Request-Timeout also accepted)")
 
 class CampaignResponse(BaseModel):
     status: str
@@ -25,4 +26,58 @@ class CampaignResponse(BaseModel):
     model: str
     elapsed_ms: int
     warnings: Optional[List[str]] = None
-    brief_echo: CampaignRequest
\ No newline at end of file
+    degraded: bool = False
+    budget: Optional[Dict[str, Any]] = Field(None, description="Solved THB breakdown: total_thb, channels[{channel, share, thb}], weekly[{week, thb, channels}]")
+    memory: Optional[Dict[str, Any]] = Field(None, description="Request memory (MEMORY_META=1): rss_mb, rss_delta_mb, peak_rss_mb, cuda_peak_mb, exclusive")
+    cascade: Optional[Dict[str, Any]] = Field(None, description="Cascade serving (CASCADE_FAST_BACKEND): tier, hardness, features, escalation, fast_ms, fast_tokens")
+    brief_echo: CampaignRequest
+
+class BriefEdit(BaseModel):
+    """Brief fields to change; unset fields keep their value, constraints merge key by key."""
+    industry: Optional[str] = None
+    audience: Optional[Audience] = None
+    budget_thb: Optional[float] = Field(None, gt=50000)
+    objective: Optional[str] = None
+    constraints: Optional[Constraints] = None
+    language: Optional[str] = None
+
+class RefineRequest(BaseModel):
+    brief: CampaignRequest
+    plan: Dict[str, Any]
+    edit: BriefEdit = Field(default_factory=BriefEdit)
+    fields: Optional[List[str]] = Field(None, description="Plan fields to regenerate; default: derived from the edit")
+    timeout_s: Optional[float] = Field(None, gt=0)
+
+class RefineResponse(BaseModel):
+    status: str
+    plan: Dict[str, Any]
+    model: str
+    elapsed_ms: int
+    refined_fields: List[str]
+    new_tokens: int
+    full_regen_tokens: Optional[int] = None
+    warnings: Optional[List[str]] = None
+    budget: Optional[Dict[str, Any]] = None
+    memory: Optional[Dict[str, Any]] = None
+    brief_echo: CampaignRequest
+
+class PlanHit(BaseModel):
+    id: int
+    created: float
+    industry: Optional[str] = None
+    objective: Optional[str] = None
+    age: Optional[str] = None
+    budget_thb: Optional[float] = None
+    tone: Optional[str] = None
+    concept_title: Optional[str] = None
+    big_idea: Optional[str] = None
+    key_message: Optional[str] = None
+    score: Optional[float] = Field(None, description="Full-text relevance (higher is better); only with q")
+    brief: Optional[Dict[str, Any]] = None
+    plan: Optional[Dict[str, Any]] = None
+
+class PlanSearchResponse(BaseModel):
+    results: List[PlanHit]
+    next_cursor: Optional[int] = Field(None, description="Pass as cursor for the next page (searches without q)")
+    next_offset: Optional[int] = Field(None, description="Pass as offset for the next page (searches with q)")
+    took_ms: float
@@ -0,0 +1,172 @@
+# Sectioned generation (SECTIONED_GENERATION=1): decode the concept core -- concept_title, big_idea,
+# key_message, channels -- first, then every remaining field (assets, kpis; plus timeline_weeks and
+# budget_split when PLAN_SOLVER is off) as its own branch. The branches share the core as a prefix and
+# decode together in one batch (InferenceBackend.generate_branches), so the plan's wall-clock is the
+# core plus the longest branch instead of the sum of all sections. Works for both OUTPUT_FORMATs: in the
+# compact encoding the core is the T/I/M/C lines and each branch opens its field's tag ("A:", "K:").
+from __future__ import annotations
+import json, re, time
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (SYSTEM_PROMPT, GEN_MAX_NEW_TOKENS, GEN_TEMPERATURE, GEN_TOP_P, DEFAULT_SCHEMA, PLAN_SOLVER,
+                    OUTPUT_FORMAT, COMPLIANCE_REPAIR)
+from prompts import build_user_prompt, as_chat_messages
+from utils import extract_balanced_json
+from backends import InferenceBackend
+from cancellation import CancelToken
+from generator import generate_plan_with, finish_plan, token_budget, _check_cancelled
+from planner import SOLVED_FIELDS
+from refine import PLAN_FIELDS, fixed_prefix
+from compact import TAGS, FIELDS, decode_plan
+from metrics import METRICS
+
+CORE_FIELDS = ["concept_title", "big_idea", "key_message", "channels"]
+
+def branch_fields(solver: bool = PLAN_SOLVER) -> List[str]:
+    return [k for k in PLAN_FIELDS if k not in CORE_FIELDS and not (solver and k in SOLVED_FIELDS)]
+
+_KEY = re.compile(r'\s*"([^"\\]+)"\s*:')
+_DECODER = json.JSONDecoder()
+
+def next_key_at(text: str) -> int:
+    """Index of the comma before the first top-level key outside CORE_FIELDS, or -1."""
+    depth, in_str, esc = 0, False, False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+        elif ch == "," and depth == 1:
+            m = _KEY.match(text, i + 1)
+            if m and m.group(1) not in CORE_FIELDS:
+                return i
+    return -1
+
+_LINE = re.compile(r"(?m)^(?:([A-Z])[:=]|@(\w+)=)")
+
+def next_line_at(text: str, fields: List[str]) -> int:
+    """Compact format: start of the first line whose field is not in `fields`, or -1."""
+    for m in _LINE.finditer(text):
+        if (FIELDS.get(m.group(1)) if m.group(1) else m.group(2)) not in fields:
+            return m.start()
+    return -1
+
+def core_done(text: str) -> bool:
+    """The model has moved past the core: it opened the first non-core key (or line)."""
+    if OUTPUT_FORMAT == "compact":
+        return next_line_at(text, CORE_FIELDS) != -1
+    return next_key_at(text) != -1
+
+def compact_field_done(field: str):
+    """Compact branch stop: a line of another field has started."""
+    return lambda text: next_line_at(text, [field]) != -1
+
+def value_done(text: str) -> bool:
+    """A complete JSON value followed by something (so 12 is not cut off as 1)."""
+    s = text.lstrip()
+    try:
+        _, end = _DECODER.raw_decode(s)
+    except ValueError:
+        return False
+    return s[end:].strip() != ""
+
+def parse_core(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        if OUTPUT_FORMAT == "compact":
+            cut = next_line_at(text, CORE_FIELDS)
+            head = decode_plan(text[:cut] if cut != -1 else text)
+        else:
+            cut = next_key_at(text)
+            block = extract_balanced_json(text[:cut] + "}" if cut != -1 else text)
+            head = json.loads(block) if block else None
+    except ValueError:
+        return None
+    if not isinstance(head, dict) or any(k not in head for k in CORE_FIELDS):
+        return None
+    return head
+
+def generate_sectioned(backend: InferenceBackend,
+                       brief: Dict[str, Any],
+                       schema: Dict[str, Any] = DEFAULT_SCHEMA,
+                       max_new_tokens: int = GEN_MAX_NEW_TOKENS,
+                       temperature: float = GEN_TEMPERATURE,
+                       top_p: float = GEN_TOP_P,
+                       cancel: Optional[CancelToken] = None,
+                       repair: bool = COMPLIANCE_REPAIR) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Same contract as generator.generate_plan_with; meta adds sections = {core_tokens, branch_tokens{field},
+    critical_path_tokens, core_ms, branches_ms}. Falls back to one sequential decode if the core does not parse.
+    """
+    prompt = backend.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(brief)))
+    t0 = time.time()
+    warnings: List[str] = []
+
+    budget = token_budget(brief, max_new_tokens)
+    core = backend.generate(prompt, budget, temperature, top_p, cancel, stop=core_done)
+    _check_cancelled(cancel, core.new_tokens)
+    head = parse_core(core.text)
+    if head is None:
+        METRICS.inc("sectioned_fallback_total")
+        plan, meta = generate_plan_with(backend, brief, schema, max_new_tokens, temperature, top_p, cancel,
+                                        sectioned=False, repair=repair)
+        meta["warnings"].append("Sectioned core did not parse; fell back to sequential generation.")
+        return plan, meta
+
+    # a core that ran on to a full plan already carries its later fields
+    todo = [k for k in branch_fields() if k not in head]
+    if OUTPUT_FORMAT == "compact":
+        # core lines, then each branch opens its field's tag
+        prefix = prompt + fixed_prefix(head, CORE_FIELDS)
+        suffixes, stop = [f"{TAGS[k]}:" for k in todo], [compact_field_done(k) for k in todo]
+    else:
+        # the shared prefix ends at the comma; each branch opens its own key
+        prefix = prompt + fixed_prefix(head, CORE_FIELDS).rstrip()
+        suffixes, stop = [f' "{k}":' for k in todo], value_done
+    t1 = time.time()
+    branches = backend.generate_branches(prefix, suffixes, max(64, max_new_tokens - core.new_tokens),
+                                         temperature, top_p, cancel, stop=stop) if todo else []
+    branches_ms = int((time.time() - t1) * 1000)
+    _check_cancelled(cancel, core.new_tokens + sum(b.new_tokens for b in branches))
+
+    plan = dict(head)
+    for k, s, comp in zip(todo, suffixes, branches):
+        try:
+            if OUTPUT_FORMAT == "compact":
+                cut = next_line_at(comp.text, [k])
+                plan[k] = decode_plan(s + (comp.text[:cut] if cut != -1 else comp.text))[k]
+            else:
+                plan[k] = _DECODER.raw_decode(comp.text.lstrip())[0]
+        except (ValueError, KeyError):
+            METRICS.inc("sectioned_branch_failed_total", field=k)
+            warnings.append(f"Section '{k}' did not parse; left out.")
+    plan = {k: plan[k] for k in PLAN_FIELDS + [k for k in plan if k not in PLAN_FIELDS] if k in plan}
+
+    branch_tokens = {k: b.new_tokens for k, b in zip(todo, branches)}
+    meta = {
+        "elapsed_ms": 0,
+        "attempts": 1,
+        "backend": backend.name,
+        "prompt_tokens": core.prompt_tokens,
+        "new_tokens": core.new_tokens + sum(branch_tokens.values()),
+        "finish_reason": "length" if any(b.finish_reason == "length" for b in branches) else core.finish_reason,
+        "token_budget": budget,
+        "continuations": 0,
+        "sections": {"core_tokens": core.new_tokens, "branch_tokens": branch_tokens,
+                     "critical_path_tokens": core.new_tokens + max(branch_tokens.values(), default=0),
+                     "core_ms": core.prefill_ms + core.decode_ms, "branches_ms": branches_ms},
+        "warnings": warnings,
+    }
+    METRICS.inc("generation_sectioned_total")
+    METRICS.inc("sectioned_tokens_parallel_total", meta["new_tokens"] - meta["sections"]["critical_path_tokens"])
+    plan = finish_plan(backend, brief, plan, meta, schema, max_new_tokens, temperature, top_p, cancel, repair)
+    meta["elapsed_ms"] = int((time.time() - t0) * 1000)
+    return plan, meta
@@ -0,0 +1,124 @@
+# Opt-in HF fast path (HF_STATIC_CACHE=1): a preallocated StaticCache sized from the request's token
+# budget and a torch.compile'd single-token decode step. Cache lengths are bucketed so a handful of
+# compiled graphs cover all requests; warmup() compiles them at startup instead of on the first request.
+from __future__ import annotations
+import threading, time
+from typing import Dict, Any, List, Optional, Tuple
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, StaticCache
+
+from config import GEN_MAX_NEW_TOKENS, STATIC_CACHE_BUCKET
+from backends import Completion, StopFn
+from cancellation import CancelToken
+from hf_backend import HFBackend, sample_next
+from metrics import METRICS
+
+class StaticCacheBackend(HFBackend):
+    def __init__(self, tok: AutoTokenizer, mdl: AutoModelForCausalLM, name: str = "hf-cpu",
+                 bucket: int = STATIC_CACHE_BUCKET, pool_per_shape: int = 2):
+        super().__init__(tok, mdl, name)
+        self.capabilities = dict(self.capabilities, batching=False, static_cache=True, compiled=True)
+        self.bucket = bucket
+        self.pool_per_shape = pool_per_shape
+        self._free: Dict[Tuple[int, int], List[StaticCache]] = {}
+        self._lock = threading.Lock()
+        # CUDA graphs on GPU; plain inductor kernels on CPU. Shapes are static per cache bucket.
+        mode = "reduce-overhead" if mdl.device.type == "cuda" else None
+        self._step = torch.compile(self._decode_step, mode=mode, dynamic=False)
+        self.warm: List[Tuple[int, int]] = []
+
+    def _decode_step(self, ids: torch.Tensor, pos: torch.Tensor, cache: StaticCache) -> torch.Tensor:
+        return self.model(input_ids=ids, past_key_values=cache, cache_position=pos, use_cache=True).logits[:, -1, :]
+
+    def cache_len(self, prompt_tokens: int, max_new_tokens: int) -> int:
+        need = prompt_tokens + max_new_tokens
+        return -(-need // self.bucket) * self.bucket
+
+    def _take(self, batch: int, length: int) -> StaticCache:
+        with self._lock:
+            free = self._free.get((batch, length))
+            if free:
+                cache = free.pop()
+                cache.reset()
+                return cache
+        METRICS.inc("static_cache_alloc_total", len=length)
+        return self._track(StaticCache(config=self.model.config, max_cache_len=length))
+
+    def _give(self, batch: int, cache: StaticCache) -> None:
+        with self._lock:
+            free = self._free.setdefault((batch, cache.max_cache_len), [])
+            if len(free) < self.pool_per_shape:
+                free.append(cache)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """KV as in HFBackend (static caches are allocated at full length), plus the idle pool."""
+        from memdiag import cache_nbytes
+        out = super().memory_stats()
+        with self._lock:
+            pooled = [c for free in self._free.values() for c in free]
+        out["static_pool"] = {"caches": len(pooled), "mb": round(sum(cache_nbytes(c) for c in pooled) / 2**20, 2),
+                              "shapes": len(self._free), "compiled": len(self.warm)}
+        return out
+
+    def prefill(self, prompt: str, max_new_tokens: int = GEN_MAX_NEW_TOKENS) -> Dict[str, Any]:
+        """Eager prompt pass into a fresh static cache sized for prompt + max_new_tokens."""
+        t0 = time.perf_counter()
+        ids = self._encode(prompt)["input_ids"]
+        n = ids.shape[1]
+        cache = self._take(1, self.cache_len(n, max_new_tokens))
+        with torch.no_grad():
+            out = self.model(input_ids=ids, past_key_values=cache, use_cache=True,
+                             cache_position=torch.arange(n, device=ids.device))
+        return {"cache": cache, "logits": out.logits[:, -1, :], "prompt_tokens": n,
+                "prefill_ms": int((time.perf_counter() - t0) * 1000)}
+
+    def decode(self, state: Dict[str, Any], max_new_tokens: int, temperature: float, top_p: float,
+               cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        t0 = time.perf_counter()
+        cache, logits, pos = state["cache"], state["logits"], state["prompt_tokens"]
+        max_new_tokens = min(max_new_tokens, cache.max_cache_len - pos)
+        ids: List[int] = []
+        finish = "length"
+        try:
+            with torch.no_grad():
+                for _ in range(max_new_tokens):
+                    if cancel is not None and cancel.cancelled:
+                        finish = "cancelled"
+                        break
+                    nxt = sample_next(logits, temperature, top_p)
+                    if int(nxt) in self.eos_ids:
+                        finish = "stop"
+                        break
+                    ids.append(int(nxt))
+                    if stop is not None and stop(self.tokenizer.decode(ids, skip_special_tokens=True)):
+                        finish = "stop"
+                        break
+                    logits = self._step(nxt, torch.tensor([pos], device=nxt.device), cache)
+                    pos += 1
+        finally:
+            self._give(1, cache)
+        return Completion(self.tokenizer.decode(ids, skip_special_tokens=True), state["prompt_tokens"], len(ids),
+                          state["prefill_ms"], int((time.perf_counter() - t0) * 1000), finish)
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: float, top_p: float,
+                 cancel: Optional[CancelToken] = None, stop: Optional[StopFn] = None) -> Completion:
+        return self.decode(self.prefill(prompt, max_new_tokens), max_new_tokens, temperature, top_p, cancel, stop)
+
+    def warmup(self, batch_sizes: List[int], cache_lens: List[int], steps: int = 2) -> List[Dict[str, Any]]:
+        """Compile (and pool a cache for) every (batch, cache_len) pair; returns per-graph timings."""
+        report = []
+        for b in batch_sizes:
+            for length in sorted({self.cache_len(0, l) for l in cache_lens}):
+                t0 = time.perf_counter()
+                cache = self._take(b, length)
+                ids = torch.full((b, 1), self.tokenizer.bos_token_id or 0, dtype=torch.long, device=self.model.device)
+                with torch.no_grad():
+                    self.model(input_ids=ids, past_key_values=cache, use_cache=True,
+                               cache_position=torch.arange(1, device=ids.device))
+                    for i in range(steps):
+                        self._step(ids, torch.tensor([1 + i], device=ids.device), cache)
+                self._give(b, cache)
+                self.warm.append((b, length))
+                report.append({"batch": b, "cache_len": length, "compile_s": round(time.perf_counter() - t0, 1)})
+        return report
@@ -53,7 +53,8 @@ def http_get(url: str, timeout: float = 120.0):
     return r
 
 def http_post(url: str, payload: Dict[str, Any], timeout: float = 300.0):
-    r = requests.post(url, json=payload, timeout=timeout)
+    # tell the server our own timeout so it stops decoding once we have given up
+    r = requests.post(url, json=payload, timeout=timeout, headers={"X-Request-Timeout": str(timeout)})
     r.raise_for_status()
     return r
 
@@ -0,0 +1,78 @@
+# Offline regression checks for the compliance check / repair pass (no model, no server):
+#   python deploy/test_compliance.py        (or: pytest deploy/test_compliance.py)
+import json, os, sys
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from backends import InferenceBackend, Completion  # noqa: E402
+from compliance import check_compliance  # noqa: E402
+from generator import generate_plan_with  # noqa: E402
+
+BRIEF: Dict[str, Any] = {
+    "industry": "FMCG snacks",
+    "audience": {"geo": "TH", "age": "18-24"},
+    "budget_thb": 1000000,
+    "objective": "awareness",
+    "constraints": {"brand_tone": "playful", "mandatory_channels": ["LINE OA"], "banned_channels": []},
+    "language": "EN",
+}
+
+class FixedBackend(InferenceBackend):
+    """Answers every prompt with the same text and counts the decodes."""
+    name = "fixed"
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    def chat_prompt(self, messages: List[Dict[str, str]]) -> str:
+        return "\n".join(m["content"] for m in messages) + "\n"
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def generate(self, prompt, max_new_tokens, temperature, top_p, cancel=None, stop=None) -> Completion:
+        self.calls += 1
+        return Completion(self.text, self.count_tokens(prompt), self.count_tokens(self.text), 0, 0, "stop")
+
+def _unanchored_violation(sectioned: bool) -> None:
+    # no creative fields to keep as a prefix, so the repair falls back to plain generation; that generation
+    # must not start another repair (it used to recurse until RecursionError)
+    backend = FixedBackend(json.dumps({"channels": ["TV"], "budget_split": [["TV", 1.0]], "timeline_weeks": 99}))
+    plan, meta = generate_plan_with(backend, BRIEF, sectioned=sectioned, repair=True)
+    assert backend.calls <= 3, f"{backend.calls} decodes"  # sectioned: core + sequential fallback + one repair
+    assert meta["compliance"]["repaired_fields"], meta["compliance"]
+    assert not meta["compliance"]["ok"]
+
+def test_repair_without_anchor_runs_once():
+    _unanchored_violation(sectioned=False)
+
+def test_repair_without_anchor_runs_once_sectioned():
+    _unanchored_violation(sectioned=True)
+
+def test_no_repair_pass():
+    backend = FixedBackend(json.dumps({"channels": ["TV"], "budget_split": [["TV", 1.0]], "timeline_weeks": 99}))
+    _, meta = generate_plan_with(backend, BRIEF, sectioned=False, repair=False)
+    assert backend.calls == 1 and not meta["compliance"]["ok"]
+
+def test_budget_split_labels_tolerate_formatting():
+    plan = {"channels": [{"name": "LINE OA"}, {"name": "Twitter / X"}],
+            "budget_split": [["line-oa ", 0.5], ["Twitter/X", 0.5]], "timeline_weeks": 6}
+    assert not check_compliance(plan, BRIEF)
+
+def main():
+    tests = [(k, v) for k, v in globals().items() if k.startswith("test_") and callable(v)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"[OK] {name}")
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    if failed:
+        sys.exit(1)
+    print(f"\nAll {len(tests)} checks passed ✔")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
-import os, json
+import os, json, time
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch, jsonschema, tqdm
+from pipeline import Pipeline
 
 BASE_MODEL=os.getenv("BASE_MODEL","meta-llama/Meta-Llama-3.1-8B-Instruct")
 IN_PATH="data/train_synth_clean.jsonl"
 OUT_PATH="data/train_synth_bilingual.jsonl"
 SCHEMA_PATH="schema/campaign.schema.json"
+# Decoding, parsing and validation run in POSTPROC_WORKERS processes while the next plan translates (pipeline.py);
+# at most PIPELINE_DEPTH plans wait for them (0 = 2 per worker). 0 workers = on the writer thread.
+POSTPROC_WORKERS=int(os.getenv("POSTPROC_WORKERS","2"))
+PIPELINE_DEPTH=int(os.getenv("PIPELINE_DEPTH","0"))
 
 SYS=("You are a bilingual Thai/English marketing editor. "
      "Given a JSON plan, output the SAME JSON with fields rewritten in the TARGET language. "
@@ -14,10 +19,33 @@ SYS=("You are a bilingual Thai/English marketing editor. "
 PROMPT=("TARGET={target}\n\nJSON:\n{js}\n\n"
         "Return JSON only, same keys & schema.")
 
+_WORKER = {}
+
+def init_worker(model_name):
+    _WORKER["tok"] = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    _WORKER["schema"] = json.load(open(SCHEMA_PATH))
+
+def postprocess(job):
+    """Output lines for one source record: the original, then its translation if that parses and validates."""
+    rec, new_ids = job
+    lines = [json.dumps(rec, ensure_ascii=False)+"\n"]                # keep original
+    # completion only: the prompt itself carries the source JSON
+    txt = _WORKER["tok"].decode(new_ids, skip_special_tokens=True)
+    s,e = txt.find("{"), txt.rfind("}")
+    if s==-1 or e==-1: return lines
+    try:
+        js2 = json.loads(txt[s:e+1])
+        jsonschema.validate(js2, _WORKER["schema"])
+    except Exception:
+        return lines
+    lines.append(json.dumps({"input": rec["input"], "output": js2}, ensure_ascii=False)+"\n")
+    return lines
+
 def main():
+    # start the post-processing processes before the model takes the memory
+    pipe = Pipeline(postprocess, POSTPROC_WORKERS, PIPELINE_DEPTH, init_worker, (BASE_MODEL,))
     tok = AutoTokenizer.from_pretrained(BASE_MODEL, use_fast=True)
     model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.bfloat16, device_map="auto")
-    schema = json.load(open(SCHEMA_PATH))
     out = open(OUT_PATH,"w",encoding="utf-8")
 
     def trans(target, rec):
@@ -28,19 +56,28 @@ def main():
         ids = tok(msg, return_tensors="pt").to(model.device)
         with torch.no_grad():
             gen = model.generate(**ids, max_new_tokens=1024, do_sample=True, temperature=0.4, top_p=0.9)
-        txt = tok.decode(gen[0], skip_special_tokens=True)
-        s,e = txt.find("{"), txt.rfind("}")
-        if s==-1 or e==-1: return None
-        js2 = json.loads(txt[s:e+1])
-        jsonschema.validate(js2, schema)
-        return {"input": rec["input"], "output": js2}
+        return gen[0, ids["input_ids"].shape[1]:].cpu().tolist()
+
+    counts = {"records": 0, "translated": 0}
+    def write(lines):  # writer thread, in input order
+        out.write("".join(lines))
+        counts["records"] += 1
+        counts["translated"] += len(lines) - 1
 
+    gen_s, t0 = 0.0, time.perf_counter()
     for line in tqdm.tqdm(open(IN_PATH,"r",encoding="utf-8")):
         rec = json.loads(line)
-        out.write(json.dumps(rec, ensure_ascii=False)+"\n")          # keep original
-        tr = trans("TH", rec)                                        # Thai version
-        if tr: out.write(json.dumps(tr, ensure_ascii=False)+"\n")
-    out.close(); print("Done ->", OUT_PATH)
+        g0 = time.perf_counter()
+        new_ids = trans("TH", rec)                                   # Thai version
+        gen_s += time.perf_counter() - g0
+        pipe.submit((rec, new_ids), write)
+    stages = pipe.close()
+    out.close()
+    wall = time.perf_counter() - t0
+    print(f"{counts['translated']}/{counts['records']} translated; generate {gen_s:.1f}s ({gen_s / wall:.0%} of wall), "
+          f"post-process {stages['post_cpu_s']:.1f} CPU-s on {POSTPROC_WORKERS} workers, write {stages['write_s']:.1f}s, "
+          f"generation blocked on a full queue {stages['backpressure_s']:.1f}s")
+    print("Done ->", OUT_PATH)
 
 if __name__ == "__main__":
     main()
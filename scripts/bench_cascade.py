@@ -0,0 +1,99 @@
+# scripts/bench_cascade.py
+# Cascade serving vs the full model alone on data/val.jsonl: per-tier hit rate and latency, escalation reasons,
+# and the schema / constraint pass rate of what would be served (deploy/cascade.py). The full tier is
+# INFERENCE_BACKEND as configured for serving; the fast tier is usually a distilled student.
+#
+#   python scripts/bench_cascade.py --fast-backend hf-cpu --fast-model-dir outputs/student-360m --limit 50
+#   INFERENCE_BACKEND=standin STANDIN_DECODE_MS=2 python scripts/bench_cascade.py --fast-backend standin --hard-score 0.5
+from __future__ import annotations
+import argparse, json, os, sys, time
+from collections import Counter
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import (DEFAULT_SCHEMA, CASCADE_FAST_BACKEND, CASCADE_FAST_MODEL_DIR, CASCADE_HARD_SCORE,  # noqa: E402
+                    LOCAL_FILES_ONLY)
+from backends import get_backend  # noqa: E402
+from generator import generate_plan_with  # noqa: E402
+from validators import validate_plan  # noqa: E402
+from cascade import Cascade, TIERS  # noqa: E402
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))] if xs else 0.0
+
+def served_ok(plan, meta):
+    return "plan_raw" not in plan and validate_plan(plan, DEFAULT_SCHEMA)[0] and \
+        (meta.get("compliance") or {}).get("ok", True)
+
+def run(gen, briefs, args):
+    rows = []
+    for brief in briefs:
+        t0 = time.perf_counter()
+        plan, meta = gen(brief, DEFAULT_SCHEMA, args.max_new_tokens, args.temperature, args.top_p)
+        rows.append({"ms": (time.perf_counter() - t0) * 1000, "ok": served_ok(plan, meta),
+                     "new_tokens": meta.get("new_tokens", 0), "cascade": meta.get("cascade")})
+    return rows
+
+def summary(name, rows):
+    ms = [r["ms"] for r in rows]
+    return {"run": name, "n": len(rows), "pass_rate": round(sum(r["ok"] for r in rows) / max(1, len(rows)), 4),
+            "p50_ms": round(pct(ms, 0.5), 1), "p95_ms": round(pct(ms, 0.95), 1), "mean_ms": round(sum(ms) / max(1, len(ms)), 1),
+            "new_tokens": sum(r["new_tokens"] for r in rows)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Cascade (fast tier + escalation) vs the full model alone")
+    ap.add_argument("--data", default="data/val.jsonl")
+    ap.add_argument("--limit", type=int, default=0, help="First N briefs only (0 = all)")
+    ap.add_argument("--fast-backend", default=CASCADE_FAST_BACKEND or "hf-cpu")
+    ap.add_argument("--fast-model-dir", default=CASCADE_FAST_MODEL_DIR)
+    ap.add_argument("--hard-score", type=float, default=CASCADE_HARD_SCORE)
+    ap.add_argument("--no-baseline", action="store_true", help="Skip the full-model-only run")
+    ap.add_argument("--max-new-tokens", type=int, default=1024)
+    ap.add_argument("--temperature", type=float, default=0.7)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        briefs = [json.loads(l)["input"] for l in f if l.strip()]
+    if args.limit > 0:
+        briefs = briefs[:args.limit]
+    full = get_backend()
+    fast = get_backend(args.fast_backend, model_dir=args.fast_model_dir, local_files_only=LOCAL_FILES_ONLY,
+                       adapter_dir=None)
+    cascade = Cascade(fast, args.hard_score)
+    print(f"{len(briefs)} briefs; fast tier {args.fast_backend} {args.fast_model_dir or ''}, full tier {full.name}, "
+          f"hard score >= {args.hard_score}")
+
+    report = {"runs": []}
+    if not args.no_baseline:
+        rows = run(lambda *a: generate_plan_with(full, *a), briefs, args)
+        report["runs"].append(summary("full only", rows))
+    rows = run(lambda *a: cascade.generate_plan_with(full, *a), briefs, args)
+    report["runs"].append(summary("cascade", rows))
+    tiers = {}
+    for t in TIERS:
+        sel = [r for r in rows if r["cascade"]["tier"] == t]
+        tiers[t] = dict(summary(t, sel), hit_rate=round(len(sel) / max(1, len(rows)), 4))
+    report["tiers"] = tiers
+    report["escalations"] = dict(Counter(r["cascade"]["escalation"] for r in rows if r["cascade"]["escalation"]))
+    report["fast_tokens_wasted"] = sum(r["cascade"]["fast_tokens"] for r in rows if r["cascade"]["escalation"])
+
+    print(f"\n{'run':<11}{'n':>5}{'share':>8}{'pass':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'tokens':>9}")
+    for r in report["runs"]:
+        print(f"{r['run']:<11}{r['n']:>5}{'':>8}{r['pass_rate']:>8.1%}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['mean_ms']:>10}{r['new_tokens']:>9}")
+    for t, r in tiers.items():
+        print(f"  {t + ' tier':<9}{r['n']:>5}{r['hit_rate']:>8.1%}{r['pass_rate']:>8.1%}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['mean_ms']:>10}{r['new_tokens']:>9}")
+    reasons = ", ".join(f"{k} {v}" for k, v in sorted(report["escalations"].items(), key=lambda kv: -kv[1]))
+    print(f"escalations: {reasons or 'none'}; fast-tier tokens spent on escalated briefs: {report['fast_tokens_wasted']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# scripts/bench_decode.py
+# Decode tokens/sec of generate_campaign_plan's HF path (model.generate, dynamic cache, eager forward)
+# vs the static-cache + torch.compile path (deploy/static_cache.py), same weights, same briefs.
+#
+#   MODEL_DIR=/models/llama31-8b python scripts/bench_decode.py --n 8
+#   python scripts/bench_decode.py --model-dir /tmp/tiny-llama --adapter-dir "" --n 8
+from __future__ import annotations
+import argparse, json, os, sys, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+import torch  # noqa: E402
+from config import MODEL_DIR, HF_TOKEN, LOCAL_FILES_ONLY, ADAPTER_DIR, STATIC_WARMUP_BATCH_SIZES, SYSTEM_PROMPT  # noqa: E402
+from prompts import build_user_prompt, as_chat_messages  # noqa: E402
+from model_loader import load_llama_cpu  # noqa: E402
+from hf_backend import HFBackend  # noqa: E402
+from static_cache import StaticCacheBackend  # noqa: E402
+from generator import generate_plan_with  # noqa: E402
+
+def load_briefs(path: str, n: int):
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(l)["input"] for l in f if l.strip()]
+    return rows[:n]
+
+def run(backend, briefs, max_new_tokens: int, temperature: float):
+    tokens, t0 = 0, time.perf_counter()
+    for b in briefs:
+        _, meta = generate_plan_with(backend, b, max_new_tokens=max_new_tokens, temperature=temperature, top_p=0.9)
+        tokens += meta["new_tokens"]
+    wall = time.perf_counter() - t0
+    return {"backend": type(backend).__name__, "briefs": len(briefs), "new_tokens": tokens,
+            "wall_s": round(wall, 2), "tokens_per_sec": round(tokens / wall, 1) if wall > 0 else None}
+
+def main():
+    ap = argparse.ArgumentParser(description="Eager dynamic-cache decode vs static cache + torch.compile")
+    ap.add_argument("--briefs", default="data/briefs_val.jsonl")
+    ap.add_argument("--n", type=int, default=8)
+    ap.add_argument("--model-dir", default=MODEL_DIR)
+    ap.add_argument("--adapter-dir", default=ADAPTER_DIR, help='LoRA adapter to merge ("" = base model only)')
+    ap.add_argument("--dtype", default="bfloat16", choices=["bfloat16", "float32"])
+    ap.add_argument("--max-new-tokens", type=int, default=512)
+    ap.add_argument("--temperature", type=float, default=0.0, help="0 = greedy, so both paths decode the same tokens")
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    tok, mdl = load_llama_cpu(model_dir=args.model_dir, local_files_only=LOCAL_FILES_ONLY, hf_token=HF_TOKEN,
+                              adapter_dir=args.adapter_dir or None, num_threads=args.threads,
+                              dtype=getattr(torch, args.dtype))
+    briefs = load_briefs(args.briefs, args.n)
+
+    eager = HFBackend(tok, mdl, "hf-cpu")
+    static = StaticCacheBackend(tok, mdl, "hf-cpu")
+    t0 = time.perf_counter()
+    # prompt + decode budget decides each request's cache bucket; warm every bucket these briefs hit
+    prompts = [static.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(b))) for b in briefs]
+    warm = static.warmup(STATIC_WARMUP_BATCH_SIZES, [static.count_tokens(p) + args.max_new_tokens for p in prompts])
+    print(f"warm-up: {warm} ({time.perf_counter() - t0:.1f}s)")
+
+    run(eager, briefs[:1], args.max_new_tokens, args.temperature)  # allocator / thread-pool warm-up
+    rows = [run(eager, briefs, args.max_new_tokens, args.temperature),
+            run(static, briefs, args.max_new_tokens, args.temperature)]
+    base = rows[0]["tokens_per_sec"] or 1
+    print(f"\n{'path':<22}{'tokens':>8}{'wall s':>9}{'tok/s':>9}{'speedup':>9}")
+    for r in rows:
+        print(f"{r['backend']:<22}{r['new_tokens']:>8}{r['wall_s']:>9}{r['tokens_per_sec']:>9}"
+              f"{(r['tokens_per_sec'] or 0) / base:>8.2f}x")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"warmup": warm, "results": rows}, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# scripts/bench_fairness.py
+# Interactive latency next to a bulk caller: a few interactive requests arrive at random while a bulk client keeps
+# the queue full from several threads. Compares the admission policies (fifo, sjf, wfq with client weights) and a
+# generated-token quota on the bulk client (quotas.py). Runs on the stand-in backend, so the numbers reflect
+# queueing, not model speed.
+#
+#   python scripts/bench_fairness.py
+#   python scripts/bench_fairness.py --concurrency 2 --bulk-threads 8 --bulk-quota 60000
+from __future__ import annotations
+import argparse, json, os, random, sys, threading, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import GEN_MAX_NEW_TOKENS, SCHED_AGING_TOKENS_PER_S, SYSTEM_PROMPT  # noqa: E402
+from prompts import build_user_prompt, as_chat_messages  # noqa: E402
+from admission import AdmissionController, AdmissionRejected  # noqa: E402
+from backends import StandInBackend  # noqa: E402
+from quotas import ClientRegistry, ClientPolicy  # noqa: E402
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))] if xs else 0.0
+
+def run(name, policy, registry, prompts, arrivals, backend, args):
+    adm = AdmissionController(args.concurrency, 10_000, 1e9, policy, SCHED_AGING_TOKENS_PER_S, registry)
+    lat, bulk_tokens, bulk_done, shed, all_tokens = [], [0], [0], [0], [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+    busy = [0.0]
+    t_start = time.monotonic()
+
+    def generate(prompt, client):
+        with adm.slot(client=client) as ticket:
+            t0 = time.monotonic()
+            comp = backend.generate(prompt, GEN_MAX_NEW_TOKENS, 0.0, 1.0)
+            ticket.tokens = comp.new_tokens
+        with lock:
+            busy[0] += time.monotonic() - t0
+            all_tokens[0] += comp.new_tokens
+        return comp.new_tokens
+
+    def interactive(i):
+        time.sleep(max(0.0, t_start + arrivals[i] - time.monotonic()))
+        t0 = time.monotonic()
+        generate(prompts[i % len(prompts)], "ui")
+        with lock:
+            lat.append(time.monotonic() - t0)
+
+    def bulk(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            try:
+                n = generate(rng.choice(prompts), "bulk")
+            except AdmissionRejected as e:
+                with lock:
+                    shed[0] += 1
+                stop.wait(min(e.retry_after, 1.0))  # a well-behaved caller honours Retry-After
+                continue
+            with lock:
+                bulk_tokens[0] += n
+                bulk_done[0] += 1
+
+    bulk_threads = [threading.Thread(target=bulk, args=(s,)) for s in range(args.bulk_threads)]
+    ui_threads = [threading.Thread(target=interactive, args=(i,)) for i in range(len(arrivals))]
+    for t in bulk_threads + ui_threads:
+        t.start()
+    for t in ui_threads:
+        t.join()
+    wall = time.monotonic() - t_start
+    stop.set()
+    for t in bulk_threads:
+        t.join()
+    return {"run": name, "ui_p50_s": pct(lat, 0.5), "ui_p95_s": pct(lat, 0.95), "ui_max_s": max(lat),
+            "bulk_tok_s": bulk_tokens[0] / wall, "total_tok_s": all_tokens[0] / wall, "bulk_done": bulk_done[0], "bulk_shed": shed[0],
+            "busy": min(1.0, busy[0] / (wall * args.concurrency))}
+
+def main():
+    ap = argparse.ArgumentParser(description="Interactive latency under a bulk caller: fifo / sjf / wfq / quota")
+    ap.add_argument("--data", default="data/val.jsonl")
+    ap.add_argument("--n", type=int, default=40, help="Interactive requests per run")
+    ap.add_argument("--ui-load", type=float, default=0.2, help="Interactive share of capacity")
+    ap.add_argument("--bulk-threads", type=int, default=6, help="Concurrent bulk submitters (closed loop)")
+    ap.add_argument("--concurrency", type=int, default=1, help="ADMISSION_MAX_CONCURRENT")
+    ap.add_argument("--ui-weight", type=float, default=8.0)
+    ap.add_argument("--bulk-quota", type=float, default=0.0,
+                    help="Bulk tokens/min for the quota run (default: half the throughput measured under fifo)")
+    ap.add_argument("--decode-ms", type=float, default=0.5, help="Stand-in time per generated token")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        pool = [json.loads(l) for l in f if l.strip()]
+    backend = StandInBackend(args.data, prefill_ms_per_token=0.0, decode_ms_per_token=args.decode_ms)
+    prompts = [backend.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(r["input"]))) for r in pool]
+    lens = [backend.count_tokens(backend.respond(p)) for p in prompts]
+    mean_service = sum(lens) / len(lens) * args.decode_ms / 1000
+    rng = random.Random(args.seed)
+    t, arrivals = 0.0, []
+    for _ in range(args.n):
+        t += rng.expovariate(args.ui_load * args.concurrency / mean_service)
+        arrivals.append(t)
+    print(f"{args.n} interactive requests at {args.ui_load:.0%} of capacity, {args.bulk_threads} bulk threads, "
+          f"mean service {mean_service:.2f}s, concurrency {args.concurrency}")
+
+    def registry(bulk_tpm=0.0):
+        return ClientRegistry({"ui": ClientPolicy("ui", args.ui_weight),
+                               "bulk": ClientPolicy("bulk", 1.0, bulk_tpm, burst=bulk_tpm / 6,  # 10 s of tokens
+                                                    max_queued=args.bulk_threads)}, {})
+
+    rows = []
+    for name, policy in (("fifo", "fifo"), ("sjf", "sjf"), ("wfq", "wfq"), ("wfq+quota", "wfq")):
+        quota = 0.0
+        if name == "wfq+quota":
+            quota = args.bulk_quota or rows[0]["total_tok_s"] * 60 / 2
+            print(f"quota run: bulk limited to {quota:,.0f} tokens/min")
+        r = run(name, policy, registry(quota), prompts, arrivals, backend, args)
+        rows.append({k: round(v, 3) if isinstance(v, float) else v for k, v in r.items()})
+
+    print(f"\n{'run':<11}{'ui p50 s':>9}{'ui p95 s':>9}{'ui max s':>9}{'bulk tok/s':>11}{'bulk done':>10}"
+          f"{'shed':>6}{'busy':>6}")
+    for r in rows:
+        print(f"{r['run']:<11}{r['ui_p50_s']:>9}{r['ui_p95_s']:>9}{r['ui_max_s']:>9}{r['bulk_tok_s']:>11,.0f}"
+              f"{r['bulk_done']:>10}{r['bulk_shed']:>6}{r['busy']:>6.0%}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
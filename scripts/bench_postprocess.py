@@ -0,0 +1,178 @@
+# scripts/bench_postprocess.py
+# Micro-benchmarks for the CPU-side post-processing path in deploy/utils.py + deploy/validators.py.
+#
+#   python scripts/bench_postprocess.py                    # run and print a table
+#   python scripts/bench_postprocess.py --save-baseline    # write data/bench_postprocess_baseline.json
+#   python scripts/bench_postprocess.py --check            # fail (exit 1) on regression vs the baseline
+from __future__ import annotations
+import argparse, json, os, platform, sys, time, tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import DEFAULT_SCHEMA, SYSTEM_PROMPT  # noqa: E402
+from prompts import build_user_prompt  # noqa: E402
+from utils import (  # noqa: E402
+    extract_first_json_block, text_after_assistant, extract_balanced_json, json_after_assistant,
+    align_plan_to_schema, _renorm_pairs, normalize_budget_split,
+)
+from validators import validate_plan  # noqa: E402
+
+DATA_PATHS = ["data/train_synth_clean.jsonl", "data/val.jsonl"]
+BASELINE_PATH = "data/bench_postprocess_baseline.json"
+
+def load_records(paths: List[str], limit: int) -> List[Dict[str, Any]]:
+    rows = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rows.append(json.loads(line))
+    return rows[:limit] if limit > 0 else rows
+
+def as_transcript(rec: Dict[str, Any], body: str) -> str:
+    """What `tok.decode(out[0], skip_special_tokens=True)` returns for a Llama 3.1 chat turn."""
+    return f"system\n\n{SYSTEM_PROMPT}user\n\n{build_user_prompt(rec['input'])}assistant\n\n{body}"
+
+def malformed_bodies(plan: Dict[str, Any]) -> List[str]:
+    js = json.dumps(plan, ensure_ascii=False)
+    return [
+        "Here is the plan:\n```json\n" + js + "\n```\nLet me know if you need changes.",  # prose + fence
+        js[: int(len(js) * 0.8)],                                                      # truncated decode
+        js + "\n\n{\"note\": \"second object\"}",                                       # trailing object
+    ]
+
+def raw_style_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """The shapes align_plan_to_schema has to repair: string channels, dict assets, % budget splits."""
+    p = json.loads(json.dumps(plan))
+    chans = p.get("channels", [])
+    p["channels"] = [c["name"] if i % 2 else c for i, c in enumerate(chans)]
+    p["assets"] = [{"type": "Asset", "description": a} for a in p.get("assets", [])]
+    p["budget_split"] = [{"channel": k, "percentage": f"{round(v * 100)}%"} for k, v in p.get("budget_split", [])]
+    p["timeline_weeks"] = str(p.get("timeline_weeks", 4))
+    return p
+
+def build_cases(recs: List[Dict[str, Any]]) -> Dict[str, Tuple[Callable[[Any], Any], List[Any], bool]]:
+    """name -> (fn, inputs, mutates). Inputs of mutating functions are re-copied before every round."""
+    plans = [r["output"] for r in recs]
+    clean = [as_transcript(r, json.dumps(r["output"], ensure_ascii=False)) for r in recs]
+    broken = [as_transcript(r, b) for r in recs for b in malformed_bodies(r["output"])]
+    transcripts = clean + broken
+    tails = [text_after_assistant(t) for t in transcripts]
+    raw_plans = [raw_style_plan(p) for p in plans]
+    pairs = [[(k, v * 100) for k, v in p.get("budget_split", [])] for p in plans]
+    aligned = [align_plan_to_schema(p) for p in raw_plans]
+    return {
+        "extract_first_json_block": (extract_first_json_block, transcripts, False),
+        "text_after_assistant": (text_after_assistant, transcripts, False),
+        "extract_balanced_json": (extract_balanced_json, tails, False),
+        "json_after_assistant": (json_after_assistant, transcripts, False),
+        "align_plan_to_schema": (align_plan_to_schema, raw_plans, True),
+        "_renorm_pairs": (_renorm_pairs, pairs, False),
+        "normalize_budget_split": (normalize_budget_split, plans, True),
+        "validate_plan": (lambda p: validate_plan(p, DEFAULT_SCHEMA), aligned, False),
+    }
+
+def _copy(xs: List[Any]) -> List[Any]:
+    return json.loads(json.dumps(xs))
+
+def bench(fn: Callable[[Any], Any], inputs: List[Any], mutates: bool, rounds: int) -> Dict[str, Any]:
+    # timing: best of N full passes over the corpus (timeit-style, GC left on as in serving)
+    best = float("inf")
+    for _ in range(rounds):
+        xs = _copy(inputs) if mutates else inputs
+        t0 = time.perf_counter()
+        for x in xs:
+            fn(x)
+        best = min(best, time.perf_counter() - t0)
+    # allocations: one traced pass; peak bytes per call and bytes still held after the call
+    xs = _copy(inputs) if mutates else inputs
+    peaks, held = [], []
+    tracemalloc.start()
+    for x in xs:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        r = fn(x)
+        cur, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before); held.append(cur - before)
+        del r
+    tracemalloc.stop()
+    n = len(inputs)
+    return {
+        "n": n,
+        "ops_per_sec": round(n / best, 1) if best > 0 else None,
+        "us_per_op": round(best / n * 1e6, 2),
+        "alloc_peak_bytes_avg": int(sum(peaks) / n),
+        "alloc_peak_bytes_max": max(peaks),
+        "alloc_held_bytes_avg": int(sum(held) / n),
+    }
+
+def check(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return regressions: slower than (1 - tolerance) x baseline ops/sec or allocating > (1 + tolerance) x."""
+    bad = []
+    for name, cur in results.items():
+        ref = baseline.get("results", {}).get(name)
+        if not ref:
+            continue
+        if cur["ops_per_sec"] < ref["ops_per_sec"] * (1 - tolerance):
+            bad.append(f"{name}: ops/sec {cur['ops_per_sec']} < baseline {ref['ops_per_sec']} (-{tolerance:.0%})")
+        if cur["alloc_peak_bytes_avg"] > ref["alloc_peak_bytes_avg"] * (1 + tolerance):
+            bad.append(f"{name}: peak alloc {cur['alloc_peak_bytes_avg']}B > baseline {ref['alloc_peak_bytes_avg']}B (+{tolerance:.0%})")
+    return bad
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the post-processing hot path")
+    ap.add_argument("--data", nargs="+", default=DATA_PATHS, help="JSONL files with {input, output} records")
+    ap.add_argument("--limit", type=int, default=0, help="Use only the first N records (0 = all)")
+    ap.add_argument("--rounds", type=int, default=3, help="Timed passes per function; best is reported")
+    ap.add_argument("--only", nargs="*", default=None, help="Benchmark only these functions")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="Write results to --baseline")
+    ap.add_argument("--check", action="store_true", help="Compare against --baseline and exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (default: %(default)s)")
+    ap.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = ap.parse_args()
+
+    recs = load_records(args.data, args.limit)
+    cases = build_cases(recs)
+    if args.only:
+        cases = {k: v for k, v in cases.items() if k in args.only}
+
+    results = {name: bench(fn, xs, mut, args.rounds) for name, (fn, xs, mut) in cases.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'function':<26}{'n':>7}{'ops/sec':>12}{'us/op':>10}{'peak B avg':>12}{'peak B max':>12}{'held B':>9}")
+        for name, r in results.items():
+            print(f"{name:<26}{r['n']:>7}{r['ops_per_sec']:>12}{r['us_per_op']:>10}"
+                  f"{r['alloc_peak_bytes_avg']:>12}{r['alloc_peak_bytes_max']:>12}{r['alloc_held_bytes_avg']:>9}")
+
+    if args.save_baseline:
+        payload = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "records": len(recs),
+            "rounds": args.rounds,
+            "results": results,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        print(f"[OK] Baseline -> {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"[ERR] No baseline at {args.baseline}; run with --save-baseline first.", file=sys.stderr)
+            sys.exit(2)
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        bad = check(results, baseline, args.tolerance)
+        if bad:
+            print("[FAIL] Regressions:\n  " + "\n  ".join(bad), file=sys.stderr)
+            sys.exit(1)
+        print("[OK] No regressions vs baseline.")
+
+if __name__ == "__main__":
+    main()
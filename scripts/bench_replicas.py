@@ -0,0 +1,84 @@
+# scripts/bench_replicas.py
+# Aggregate CPU decode throughput (tokens/sec) of the replica pool vs number of replicas K.
+#
+#   MODEL_DIR=/models/llama31-8b python scripts/bench_replicas.py --replicas 1 2 4 --n 16
+#   python scripts/bench_replicas.py --model-dir /tmp/tiny-llama --adapter-dir "" --replicas 1 2 4
+from __future__ import annotations
+import argparse, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import MODEL_DIR, HF_TOKEN, LOCAL_FILES_ONLY, ADAPTER_DIR  # noqa: E402
+from replica_pool import ReplicaPool, numa_core_sets, numa_nodes  # noqa: E402
+
+def load_briefs(path: str, n: int):
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                out.append(json.loads(line)["input"])
+            if len(out) >= n:
+                break
+    return out
+
+def run(k: int, backend: str, briefs, load_kwargs, gen_kwargs):
+    t_load = time.perf_counter()
+    pool = ReplicaPool(k, backend=backend, load_kwargs=load_kwargs)
+    t_load = time.perf_counter() - t_load
+    try:
+        pool.generate_campaign_plan(briefs[0], **gen_kwargs)  # warm-up on one replica
+        t0 = time.perf_counter()
+        # submit() blocks while every replica is busy, so feed from threads to keep all K saturated
+        with ThreadPoolExecutor(max_workers=k * 2) as ex:
+            results = list(ex.map(lambda b: pool.generate_campaign_plan(b, **gen_kwargs), briefs))
+        wall = time.perf_counter() - t0
+    finally:
+        pool.close()
+    tokens = sum(m.get("new_tokens", 0) for _, m in results)
+    return {
+        "replicas": k,
+        "cores_per_replica": [len(c) for c in pool.core_sets],
+        "briefs": len(briefs),
+        "new_tokens": tokens,
+        "wall_s": round(wall, 2),
+        "tokens_per_sec": round(tokens / wall, 1) if wall > 0 else None,
+        "plans_per_min": round(len(briefs) / wall * 60, 2) if wall > 0 else None,
+        "load_s": round(t_load, 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Replica-pool throughput vs K")
+    ap.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--backend", default="hf-cpu", help="hf-cpu, or standin to exercise the pool without weights")
+    ap.add_argument("--briefs", default="data/briefs_val.jsonl")
+    ap.add_argument("--n", type=int, default=16, help="Briefs per K")
+    ap.add_argument("--model-dir", default=MODEL_DIR)
+    ap.add_argument("--adapter-dir", default=ADAPTER_DIR, help='LoRA adapter to merge ("" = base model only)')
+    ap.add_argument("--max-new-tokens", type=int, default=256)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    print(f"NUMA nodes: {[len(n) for n in numa_nodes()]} usable cores")
+    for k in args.replicas:
+        print(f"  K={k}: core sets {[len(c) for c in numa_core_sets(k)]}")
+
+    briefs = load_briefs(args.briefs, args.n)
+    load_kwargs = dict(model_dir=args.model_dir, local_files_only=LOCAL_FILES_ONLY, hf_token=HF_TOKEN,
+                       adapter_dir=args.adapter_dir or None) if args.backend != "standin" else {}
+    gen_kwargs = dict(max_new_tokens=args.max_new_tokens)
+
+    rows = [run(k, args.backend, briefs, load_kwargs, gen_kwargs) for k in args.replicas]
+    base = rows[0]["tokens_per_sec"] or 1
+    print(f"\n{'K':>3}{'cores/replica':>16}{'tokens':>9}{'wall s':>9}{'tok/s':>9}{'speedup':>9}")
+    for r in rows:
+        print(f"{r['replicas']:>3}{str(r['cores_per_replica']):>16}{r['new_tokens']:>9}{r['wall_s']:>9}"
+              f"{r['tokens_per_sec']:>9}{(r['tokens_per_sec'] or 0) / base:>8.2f}x")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# scripts/bench_scheduling.py
+# Tail latency of the admission queue under load: FIFO vs shortest-predicted-job-first (with aging),
+# and the fixed GEN_MAX_NEW_TOKENS reservation vs the length model's per-brief budgets. The workload mixes
+# full generations with /campaign/refine jobs (channels + budget_split + kpis only). Runs on the stand-in
+# backend, so the numbers reflect queueing, not model speed.
+#
+#   python scripts/fit_length_model.py --tokenizer approx --out /tmp/length_approx.json
+#   python scripts/bench_scheduling.py --length-model /tmp/length_approx.json
+from __future__ import annotations
+import argparse, json, os, random, sys, threading, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import GEN_MAX_NEW_TOKENS, SCHED_AGING_TOKENS_PER_S, SYSTEM_PROMPT  # noqa: E402
+from prompts import build_user_prompt, as_chat_messages  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from backends import StandInBackend  # noqa: E402
+from length_model import LengthPredictor  # noqa: E402
+from refine import PLAN_FIELDS, fixed_prefix  # noqa: E402
+
+REFINE_FIELDS = ["channels", "budget_split", "kpis"]
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+
+def run(policy: str, prompts, arrivals, backend, cost, aging: float, refine):
+    adm = AdmissionController(1, len(prompts), 1e9, "fifo" if policy == "fifo" else "sjf", aging)
+    lat = [0.0] * len(prompts)
+    t_start = time.monotonic()
+
+    def job(i):
+        time.sleep(max(0.0, t_start + arrivals[i] - time.monotonic()))
+        t0 = time.monotonic()
+        with adm.slot(cost=cost[i]):
+            backend.generate(prompts[i], GEN_MAX_NEW_TOKENS, 0.0, 1.0)
+        lat[i] = time.monotonic() - t0
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(len(prompts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ref = [l for l, r in zip(lat, refine) if r] or [0.0]
+    gen = [l for l, r in zip(lat, refine) if not r] or [0.0]
+    return {"policy": policy, "mean_s": sum(lat) / len(lat), "p50_s": pct(lat, 0.5),
+            "p95_s": pct(lat, 0.95), "p99_s": pct(lat, 0.99), "max_s": max(lat),
+            "refine_p95_s": pct(ref, 0.95), "generate_p95_s": pct(gen, 0.95)}
+
+def workload(pool, backend, pred, n, refine_share, rng):
+    """-> prompts, true decode lengths, predicted costs, first-pass budgets, is-refine flags"""
+    prompts, lens, costs, budgets, refine = [], [], [], [], []
+    for _ in range(n):
+        rec = rng.choice(pool)
+        prompt = backend.chat_prompt(as_chat_messages(SYSTEM_PROMPT, build_user_prompt(rec["input"])))
+        share = 1.0
+        refine.append(rng.random() < refine_share)
+        if refine[-1]:
+            prompt += fixed_prefix(rec["output"], [k for k in PLAN_FIELDS if k not in REFINE_FIELDS])
+            share = len(REFINE_FIELDS) / len(PLAN_FIELDS)
+        prompts.append(prompt)
+        # the replayed plan is what gets decoded, so its length is the true service time
+        lens.append(backend.count_tokens(backend.respond(prompt)))
+        costs.append(pred.expected(rec["input"]) * share)
+        budgets.append(pred.budget(rec["input"]))
+    return prompts, lens, costs, budgets, refine
+
+def main():
+    ap = argparse.ArgumentParser(description="Queueing tail latency: FIFO vs SJF+aging on the stand-in backend")
+    ap.add_argument("--data", default="data/val.jsonl")
+    ap.add_argument("--length-model", default="/tmp/length_approx.json", help="Fitted with --tokenizer approx")
+    ap.add_argument("--n", type=int, default=100, help="Requests per policy and repeat")
+    ap.add_argument("--refine-share", type=float, default=0.3, help="Fraction of requests that are refines")
+    ap.add_argument("--load", type=float, default=0.9, help="Offered load (arrival rate x mean service time)")
+    ap.add_argument("--decode-ms", type=float, default=0.5, help="Stand-in time per generated token")
+    ap.add_argument("--aging", type=float, default=SCHED_AGING_TOKENS_PER_S, help="Tokens of priority gained per second waited")
+    ap.add_argument("--repeats", type=int, default=3, help="Independent arrival sequences; metrics are averaged")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    with open(args.length_model, "r", encoding="utf-8") as f:
+        pred = LengthPredictor(json.load(f))
+    with open(args.data, "r", encoding="utf-8") as f:
+        pool = [json.loads(l) for l in f if l.strip()]
+    backend = StandInBackend(args.data, prefill_ms_per_token=0.0, decode_ms_per_token=args.decode_ms)
+
+    per_policy = {}
+    for rep in range(args.repeats):
+        rng = random.Random(args.seed + rep)
+        prompts, lens, costs, budgets, refine = workload(pool, backend, pred, args.n, args.refine_share, rng)
+        mean_service = sum(lens) / len(lens) * args.decode_ms / 1000
+        t, arrivals = 0.0, []
+        for _ in prompts:
+            t += rng.expovariate(args.load / mean_service)
+            arrivals.append(t)
+        if rep == 0:
+            print(f"{args.n} requests x {args.repeats} repeats, {args.refine_share:.0%} refines, "
+                  f"mean service {mean_service:.2f}s, offered load {args.load}")
+            print(f"KV reservation per request: fixed {GEN_MAX_NEW_TOKENS} tokens, "
+                  f"predicted avg {sum(budgets) / len(budgets):.0f} (max {max(budgets)}); "
+                  f"{sum(n > b for n, b in zip(lens, budgets))} would overflow into a continuation")
+        # sjf-oracle orders by the true length: the ceiling for what a better predictor could buy
+        for policy, cost in (("fifo", [0] * len(prompts)), ("sjf", costs), ("sjf-oracle", lens)):
+            r = run(policy, prompts, arrivals, backend, cost, args.aging, refine)
+            acc = per_policy.setdefault(policy, {k: 0.0 for k in r if k != "policy"})
+            for k in acc:
+                acc[k] += r[k] / args.repeats
+
+    rows = [{"policy": p, **{k: round(v, 2) for k, v in m.items()}} for p, m in per_policy.items()]
+    print(f"\n{'policy':<12}{'mean s':>8}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}{'refine p95':>12}{'gen p95':>9}")
+    for r in rows:
+        print(f"{r['policy']:<12}{r['mean_s']:>8}{r['p50_s']:>8}{r['p95_s']:>8}{r['p99_s']:>8}{r['max_s']:>8}"
+              f"{r['refine_p95_s']:>12}{r['generate_p95_s']:>9}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# scripts/bench_sections.py
+# Wall-clock per plan: one sequential decode vs sectioned generation (deploy/sections.py: concept core
+# first, then the remaining fields as parallel branches sharing the core's KV cache), same briefs.
+#
+#   python scripts/bench_sections.py --backend standin --n 40
+#   INFERENCE_BACKEND=hf MODEL_DIR=/models/llama31-8b python scripts/bench_sections.py --backend hf --n 10
+from __future__ import annotations
+import argparse, json, os, sys, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from backends import get_backend, BACKENDS  # noqa: E402
+from generator import generate_plan_with  # noqa: E402
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+
+def run(backend, briefs, sectioned: bool, max_new_tokens: int, temperature: float):
+    lat, tokens, critical, fallbacks = [], 0, 0, 0
+    for b in briefs:
+        t0 = time.perf_counter()
+        _, meta = generate_plan_with(backend, b, max_new_tokens=max_new_tokens, temperature=temperature,
+                                     top_p=0.9, sectioned=sectioned)
+        lat.append(time.perf_counter() - t0)
+        tokens += meta["new_tokens"]
+        sec = meta.get("sections")
+        critical += sec["critical_path_tokens"] if sec else meta["new_tokens"]
+        fallbacks += sectioned and sec is None
+    n = len(briefs)
+    return {"mode": "sectioned" if sectioned else "sequential", "plans": n, "mean_s": round(sum(lat) / n, 3),
+            "p95_s": round(pct(lat, 0.95), 3), "tokens_per_plan": round(tokens / n, 1),
+            "critical_path_tokens": round(critical / n, 1), "fallbacks": int(fallbacks)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequential vs sectioned (parallel-branch) plan generation latency")
+    ap.add_argument("--backend", default="standin", choices=BACKENDS)
+    ap.add_argument("--briefs", default="data/val.jsonl")
+    ap.add_argument("--n", type=int, default=40)
+    ap.add_argument("--max-new-tokens", type=int, default=1024)
+    ap.add_argument("--temperature", type=float, default=0.0)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    with open(args.briefs, "r", encoding="utf-8") as f:
+        briefs = [json.loads(l)["input"] for l in f if l.strip()][:args.n]
+    backend = get_backend(args.backend)
+    run(backend, briefs[:1], False, args.max_new_tokens, args.temperature)  # warm-up
+    rows = [run(backend, briefs, s, args.max_new_tokens, args.temperature) for s in (False, True)]
+
+    print(f"{'mode':<12}{'mean s':>8}{'p95 s':>8}{'tokens':>8}{'critical':>10}{'fallbacks':>11}")
+    for r in rows:
+        print(f"{r['mode']:<12}{r['mean_s']:>8}{r['p95_s']:>8}{r['tokens_per_plan']:>8}"
+              f"{r['critical_path_tokens']:>10}{r['fallbacks']:>11}")
+    print(f"speedup: {rows[0]['mean_s'] / rows[1]['mean_s']:.2f}x")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
+
+if __name__ == "__main__":
+    main()
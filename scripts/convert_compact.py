@@ -0,0 +1,74 @@
+# scripts/convert_compact.py
+# Convert plan JSONL between the JSON output encoding and the compact line encoding (deploy/compact.py),
+# verify the round trip, and report the output tokens the compact encoding saves.
+#
+#   python scripts/convert_compact.py --in data/train_synth_clean.jsonl --out data/train_synth_compact.jsonl
+#   python scripts/convert_compact.py --in data/train_synth_compact.jsonl --out /tmp/back.jsonl --to json
+#   python scripts/convert_compact.py --in data/train_synth_clean.jsonl --report-only --tokenizer approx
+#
+# train_lora.py can also encode on the fly (OUTPUT_FORMAT=compact), so converted files are optional.
+from __future__ import annotations
+import argparse, json, os, sys
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import HF_TOKEN, LOCAL_FILES_ONLY  # noqa: E402
+from compact import encode_plan, decode_plan  # noqa: E402
+from planner import SOLVED_FIELDS  # noqa: E402
+
+def token_counter(name: str):
+    if name == "approx":
+        from backends import ApproxTokenizer
+        tk = ApproxTokenizer()
+        return lambda s: len(tk.pieces(s))
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(name, use_fast=True, token=HF_TOKEN, local_files_only=LOCAL_FILES_ONLY)
+    return lambda s: len(tok(s, add_special_tokens=False)["input_ids"])
+
+def main():
+    ap = argparse.ArgumentParser(description="JSON <-> compact plan encoding for training data, with a token report")
+    ap.add_argument("--in", dest="inp", default="data/train_synth_clean.jsonl")
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--to", default="compact", choices=["compact", "json"])
+    ap.add_argument("--report-only", action="store_true", help="Round-trip check + token report, no output file")
+    ap.add_argument("--tokenizer", default=os.getenv("MODEL_DIR") or "meta-llama/Meta-Llama-3.1-8B-Instruct",
+                    help='HF tokenizer (dir or id), "approx" for the stand-in tokenizer, "" to skip the report')
+    args = ap.parse_args()
+
+    with open(args.inp, "r", encoding="utf-8") as f:
+        rows = [json.loads(l) for l in f if l.strip()]
+
+    out_rows, mismatches, plans = [], 0, []
+    for r in rows:
+        out = r["output"]
+        plan = decode_plan(out) if isinstance(out, str) else out
+        text = encode_plan(plan)
+        # lossless: compact -> plan must re-serialize byte for byte as the original JSON
+        if json.dumps(decode_plan(text), ensure_ascii=False) != json.dumps(plan, ensure_ascii=False):
+            mismatches += 1
+        plans.append(plan)
+        out_rows.append({**r, "output": text if args.to == "compact" else plan})
+    print(f"{len(rows)} plans, round-trip mismatches: {mismatches}")
+
+    if args.out and not args.report_only:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for r in out_rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        print(f"[OK] {args.to} -> {args.out}")
+
+    if args.tokenizer:
+        count = token_counter(args.tokenizer)
+        print(f"\noutput tokens per plan ({args.tokenizer})")
+        print(f"{'target':<26}{'json':>8}{'compact':>9}{'saved':>8}{'saved %':>9}")
+        for label, drop in (("full plan", ()), ("PLAN_SOLVER targets", SOLVED_FIELDS)):
+            j = c = 0
+            for p in plans:
+                p = {k: v for k, v in p.items() if k not in drop}
+                j += count(json.dumps(p, ensure_ascii=False))
+                c += count(encode_plan(p))
+            j, c = j / len(plans), c / len(plans)
+            print(f"{label:<26}{j:>8.1f}{c:>9.1f}{j - c:>8.1f}{(j - c) / j:>9.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# scripts/distill_student.py
+# Distil the 8B teacher into a small causal LM: full fine-tune of a student on teacher plans ({"input", "output"}
+# JSONL: data/train_synth_clean.jsonl plus any fresh scripts/generate_synthetic_plans.py runs) on the prompt it is
+# served with: the student's own chat template (saved with the checkpoint) around config.SYSTEM_PROMPT +
+# prompts.build_user_prompt, with targets encoded as scripts/train_lora.py does (PLAN_SOLVER, OUTPUT_FORMAT; train and
+# serve with the same settings). The student and --compare backends are then scored through
+# generator.generate_plan_with, a pass being a plan that parses, validates and complies with its brief, with speed
+# next to quality.
+# Briefs that are also in data/val.jsonl are left out of training so the pass rate is on unseen briefs.
+#
+#   BRIEFS_PATH=data/briefs_train.jsonl OUT_PATH=data/train_synth_more.jsonl python scripts/generate_synthetic_plans.py
+#   python scripts/distill_student.py --data data/train_synth_clean.jsonl data/train_synth_more.jsonl \
+#       --student HuggingFaceTB/SmolLM2-360M-Instruct --out outputs/student-360m --compare hf
+#   python scripts/distill_student.py --tiny --max-steps 200 --eval-limit 10 --compare standin   # CPU smoke test
+#
+# Serve the result like any checkpoint: INFERENCE_BACKEND=hf-cpu MODEL_DIR=outputs/student-360m ADAPTER_DIR=
+import argparse, json, math, os, random, sys, time
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, LlamaConfig, LlamaForCausalLM
+from transformers import get_cosine_schedule_with_warmup
+from tqdm import tqdm
+
+from make_tiny_llama import CHAT_TEMPLATE, SPECIALS, build_tokenizer
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import DEFAULT_SCHEMA, OUTPUT_FORMAT, PLAN_SOLVER, SYSTEM_PROMPT  # noqa: E402
+from backends import get_backend  # noqa: E402
+from audit_log import read_lines  # noqa: E402
+from compact import training_target as target  # noqa: E402
+from generator import generate_plan_with  # noqa: E402
+from prompts import as_chat_messages, build_user_prompt  # noqa: E402
+from validators import validate_plan  # noqa: E402
+
+STUDENT_MODEL = os.getenv("STUDENT_MODEL", "HuggingFaceTB/SmolLM2-360M-Instruct")
+VAL_PATH = "data/val.jsonl"
+
+def load_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))] if xs else 0.0
+
+def brief_key(inp) -> str:
+    return json.dumps(inp, ensure_ascii=False, sort_keys=True)
+
+def teacher_records(paths, exclude):
+    """Teacher plans from plain or gzip'd JSONL; skips failed outputs and held-out briefs. Compact-string outputs
+    (scripts/convert_compact.py) are kept only with OUTPUT_FORMAT=compact."""
+    for path in paths:
+        for line in read_lines(path):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(rec.get("input"), dict):
+                continue
+            if not (isinstance(rec.get("output"), dict) or OUTPUT_FORMAT == "compact" and isinstance(rec.get("output"), str)):
+                continue
+            if brief_key(rec["input"]) in exclude:
+                continue
+            yield rec
+
+def end_of_turn(tok) -> str:
+    """First special token the chat template puts after an assistant message (<|eot_id|>, <|im_end|>, ...)."""
+    mark = "\u2063plan\u2063"
+    text = tok.apply_chat_template([{"role": "user", "content": "brief"}, {"role": "assistant", "content": mark}],
+                                   tokenize=False)
+    tail = tok(text[text.index(mark) + len(mark):], add_special_tokens=False)["input_ids"]
+    special = set(tok.all_special_ids) | {i for i, t in tok.added_tokens_decoder.items() if t.special}
+    return next((tok.convert_ids_to_tokens(i) for i in tail if i in special), tok.eos_token)
+
+def use_chat_template(tok, model):
+    """HFBackend.chat_prompt renders the tokenizer's chat template: keep the student's own and stop on its
+    end-of-turn token. A base model without one gets the Llama-3 layout of scripts/make_tiny_llama.py."""
+    if not tok.chat_template:
+        missing = [s for s in SPECIALS if s not in tok.get_vocab()]
+        if missing:
+            tok.add_special_tokens({"additional_special_tokens": missing})
+            model.resize_token_embeddings(len(tok))
+        tok.chat_template = CHAT_TEMPLATE
+        tok.bos_token = tok.bos_token or "<|begin_of_text|>"
+    tok.eos_token = end_of_turn(tok)
+    if tok.pad_token is None:
+        tok.pad_token = "<|end_of_text|>" if "<|end_of_text|>" in tok.get_vocab() else tok.eos_token
+    model.config.eos_token_id = tok.eos_token_id
+    model.config.pad_token_id = tok.pad_token_id
+
+def encode(tok, rec, max_length):
+    """(input_ids, labels) with the loss on the plan + end-of-turn only; None if it does not fit."""
+    messages = as_chat_messages(SYSTEM_PROMPT, build_user_prompt(rec["input"]))
+    prompt = tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    plan = target(rec["output"])
+    # the assistant turn as the template writes it, up to and including its end-of-turn token
+    full = tok.apply_chat_template(messages + [{"role": "assistant", "content": plan}], tokenize=False)
+    reply = full[len(prompt):] if full.startswith(prompt) else ""
+    end = reply.find(tok.eos_token, reply.find(plan) + len(plan)) if plan in reply else -1
+    reply = reply[:end + len(tok.eos_token)] if end >= 0 else plan + tok.eos_token
+    prompt_ids = tok(prompt, add_special_tokens=False)["input_ids"]  # as HFBackend encodes it
+    reply_ids = tok(reply, add_special_tokens=False)["input_ids"]
+    ids = prompt_ids + reply_ids
+    if len(ids) > max_length:
+        return None  # a truncated plan would teach the student to stop mid-object
+    return ids, [-100] * len(prompt_ids) + reply_ids
+
+def batches(examples, batch_size, pad_id, rng):
+    """Shuffled batches of similar length (sorted within windows of 50 batches) to keep padding low."""
+    order = list(range(len(examples)))
+    rng.shuffle(order)
+    window = batch_size * 50
+    for w in range(0, len(order), window):
+        chunk = sorted(order[w:w + window], key=lambda i: len(examples[i][0]))
+        groups = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+        rng.shuffle(groups)
+        for g in groups:
+            width = max(len(examples[i][0]) for i in g)
+            ids = torch.full((len(g), width), pad_id, dtype=torch.long)
+            labels = torch.full((len(g), width), -100, dtype=torch.long)
+            mask = torch.zeros((len(g), width), dtype=torch.long)
+            for row, i in enumerate(g):
+                x, y = examples[i]
+                ids[row, :len(x)] = torch.tensor(x)
+                labels[row, :len(y)] = torch.tensor(y)
+                mask[row, :len(x)] = 1
+            yield ids, labels, mask
+
+def tiny_student(data_paths, args):
+    tok = build_tokenizer(data_paths[0], args.vocab_size)
+    cfg = LlamaConfig(
+        vocab_size=len(tok), hidden_size=args.hidden, intermediate_size=args.hidden * 3,
+        num_hidden_layers=args.layers, num_attention_heads=args.heads, num_key_value_heads=args.kv_heads,
+        max_position_embeddings=max(4096, args.max_length), bos_token_id=tok.bos_token_id,
+        eos_token_id=tok.eos_token_id, pad_token_id=tok.pad_token_id, tie_word_embeddings=True,
+    )
+    return tok, LlamaForCausalLM(cfg)
+
+def pretrained_student(name):
+    tok = AutoTokenizer.from_pretrained(name, use_fast=True)
+    model = AutoModelForCausalLM.from_pretrained(name, torch_dtype=torch.float32)
+    use_chat_template(tok, model)
+    return tok, model
+
+def train(model, tok, examples, args, device):
+    steps_per_epoch = math.ceil(len(examples) / args.batch_size / args.grad_accum)
+    total = args.max_steps or steps_per_epoch * args.epochs
+    opt = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=0.0)
+    sched = get_cosine_schedule_with_warmup(opt, int(total * args.warmup_ratio), total)
+    amp = device.type == "cuda" and torch.cuda.is_bf16_supported()
+    rng = random.Random(args.seed)
+    model.train()
+    step, micro, t0, tokens, run_loss, run_steps = 0, 0, time.perf_counter(), 0, 0.0, 0
+    while step < total:
+        for ids, labels, mask in batches(examples, args.batch_size, tok.pad_token_id, rng):
+            ids, labels, mask = ids.to(device), labels.to(device), mask.to(device)
+            with torch.autocast(device.type, dtype=torch.bfloat16, enabled=amp):
+                loss = model(input_ids=ids, attention_mask=mask, labels=labels).loss
+            (loss / args.grad_accum).backward()
+            run_loss += loss.item() / args.grad_accum
+            tokens += int(mask.sum())
+            micro += 1
+            if micro % args.grad_accum:
+                continue
+            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            opt.step()
+            sched.step()
+            opt.zero_grad(set_to_none=True)
+            step += 1
+            run_steps += 1
+            if step % args.log_every == 0 or step == total:
+                dt = time.perf_counter() - t0
+                print(f"step {step}/{total} loss {run_loss / run_steps:.4f} lr {sched.get_last_lr()[0]:.2e} "
+                      f"{tokens / dt:,.0f} tok/s")
+                run_loss, run_steps = 0.0, 0
+            if step >= total:
+                break
+    model.eval()
+    return {"steps": step, "train_s": round(time.perf_counter() - t0, 1), "train_tokens": tokens}
+
+def evaluate(name, val, schema, args, backend):
+    """Pass rate (plans that parse, pass the schema and comply with the brief) and latency on the serving path."""
+    ok, lat, toks = 0, [], 0
+    for ex in tqdm(val, desc=name):
+        t0 = time.perf_counter()
+        plan, meta = generate_plan_with(backend, ex["input"], schema, args.max_new_tokens, args.temperature,
+                                        args.top_p, sectioned=False)
+        lat.append((time.perf_counter() - t0) * 1000)
+        toks += meta["new_tokens"]
+        ok += "plan_raw" not in plan and validate_plan(plan, schema)[0] and (meta.get("compliance") or {}).get("ok", True)
+    n = max(1, len(val))
+    return {"backend": name, "n": len(val), "schema_pass": ok, "pass_rate": round(ok / n, 4),
+            "latency_ms_mean": round(sum(lat) / n, 1), "latency_ms_p50": round(pct(lat, 0.5), 1),
+            "latency_ms_p95": round(pct(lat, 0.95), 1), "new_tokens": toks,
+            "tokens_per_sec": round(toks / sum(lat) * 1000, 1) if sum(lat) else None}
+
+def model_stats(model, path=None):
+    params = sum(p.numel() for p in model.parameters())
+    size = None
+    if path and os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.endswith(".safetensors"))
+    return {"params_m": round(params / 1e6, 2), "size_mb": round(size / 2**20, 1) if size is not None else None}
+
+def main():
+    ap = argparse.ArgumentParser(description="Distil teacher plans into a small student LM and score it")
+    ap.add_argument("--data", nargs="+", default=["data/train_synth_clean.jsonl"],
+                    help="Teacher JSONL / .jsonl.gz ({input, output}), e.g. generate_synthetic_plans.py output")
+    ap.add_argument("--student", default=STUDENT_MODEL, help="HF id or directory of the student base model")
+    ap.add_argument("--tiny", action="store_true", help="Random tiny Llama + BPE fitted on --data (CPU tests)")
+    ap.add_argument("--out", default="outputs/student")
+    ap.add_argument("--eval-only", action="store_true", help="Skip training; score the checkpoint already in --out")
+    ap.add_argument("--limit", type=int, default=0, help="Use only the first N teacher plans (0 = all)")
+    ap.add_argument("--max-length", type=int, default=1536, help="Longer prompt + plan pairs are dropped")
+    ap.add_argument("--epochs", type=int, default=3)
+    ap.add_argument("--max-steps", type=int, default=0, help="Optimizer steps (overrides --epochs)")
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--grad-accum", type=int, default=1)
+    ap.add_argument("--lr", type=float, default=None, help="Default: 1e-3 for --tiny, 5e-5 otherwise")
+    ap.add_argument("--warmup-ratio", type=float, default=0.03)
+    ap.add_argument("--log-every", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    # --tiny student shape (as scripts/make_tiny_llama.py)
+    ap.add_argument("--vocab-size", type=int, default=4096)
+    ap.add_argument("--hidden", type=int, default=128)
+    ap.add_argument("--layers", type=int, default=2)
+    ap.add_argument("--heads", type=int, default=4)
+    ap.add_argument("--kv-heads", type=int, default=2)
+    # evaluation (serving path: generator.generate_plan_with)
+    ap.add_argument("--compare", nargs="*", default=[], help="Also score these backends, e.g. hf (the teacher)")
+    ap.add_argument("--eval-limit", type=int, default=0, help="Score only the first N of data/val.jsonl (0 = all)")
+    ap.add_argument("--max-new-tokens", type=int, default=1024)
+    ap.add_argument("--temperature", type=float, default=0.7)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    ap.add_argument("--threads", type=int, default=None, help="CPU threads for scoring the student")
+    ap.add_argument("--report", default=None, help="Optional JSON report path (default: <out>/distill_report.json)")
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    val = load_jsonl(VAL_PATH)
+    schema = DEFAULT_SCHEMA
+    info = {}
+
+    if not args.eval_only:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        tok, model = tiny_student(args.data, args) if args.tiny else pretrained_student(args.student)
+        model.to(device)
+        held_out = {brief_key(ex["input"]) for ex in val}
+        examples, dropped = [], 0
+        for rec in teacher_records(args.data, held_out):
+            enc = encode(tok, rec, args.max_length)
+            if enc is None:
+                dropped += 1
+            else:
+                examples.append(enc)
+            if args.limit and len(examples) >= args.limit:
+                break
+        if not examples:
+            print(f"[ERR] No usable teacher plans in {', '.join(args.data)}.", file=sys.stderr)
+            sys.exit(2)
+        args.lr = args.lr or (1e-3 if args.tiny else 5e-5)
+        print(f"{len(examples)} teacher plans ({dropped} over --max-length dropped), student "
+              f"{'tiny' if args.tiny else args.student} {model_stats(model)['params_m']}M params on {device}")
+        info = train(model, tok, examples, args, device)
+        info.update(train_examples=len(examples), plan_solver=PLAN_SOLVER, output_format=OUTPUT_FORMAT)
+        model.generation_config.eos_token_id = tok.eos_token_id
+        model.generation_config.pad_token_id = tok.pad_token_id
+        os.makedirs(args.out, exist_ok=True)
+        model.save_pretrained(args.out)
+        tok.save_pretrained(args.out)
+        print(f"[OK] student -> {args.out} ({info['steps']} steps in {info['train_s']}s)")
+        del model
+
+    if args.eval_limit > 0:
+        val = val[:args.eval_limit]
+    student = get_backend("hf-cpu", model_dir=args.out, local_files_only=True, num_threads=args.threads,
+                          adapter_dir=None)
+    rows = [dict(evaluate("student", val, schema, args, backend=student), **model_stats(student.model, args.out), **info)]
+    for name in args.compare:
+        b = get_backend(name)
+        mdl = getattr(b, "model", None)
+        rows.append(dict(evaluate(name, val, schema, args, backend=b),
+                         **(model_stats(mdl) if isinstance(mdl, torch.nn.Module) else {})))
+
+    base = rows[1] if len(rows) > 1 else None
+    print(f"\n{'model':<10}{'params M':>10}{'pass':>8}{'p50 ms':>10}{'p95 ms':>10}{'tok/s':>9}{'speedup':>9}")
+    for r in rows:
+        speedup = f"{base['latency_ms_p50'] / r['latency_ms_p50']:.1f}x" if base and r["latency_ms_p50"] else "-"
+        print(f"{r['backend']:<10}{r.get('params_m') or '-':>10}{r['pass_rate']:>8.2%}{r['latency_ms_p50']:>10}"
+              f"{r['latency_ms_p95']:>10}{r['tokens_per_sec'] or '-':>9}{speedup:>9}")
+    report = args.report or os.path.join(args.out, "distill_report.json")
+    with open(report, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    print(f"[OK] Report -> {report}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,15 @@
-import os, json, torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
+import argparse, os, sys, json, time
 from jsonschema import validate, ValidationError
 from tqdm import tqdm
 from typing import Optional, Any, Dict, Tuple, List
 import re
 from utils import json_after_assistant, align_plan_to_schema
 
-BASE_MODEL = os.getenv("BASE_MODEL","meta-llama/Meta-Llama-3.1-8B-Instruct")
-ADAPTER_DIR = os.getenv("ADAPTER_DIR","outputs/lora-llama31-8b")
+# serving backends live in deploy/; appended so scripts/utils.py keeps precedence
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy"))
+from backends import get_backend  # noqa: E402
+
+BACKEND = os.getenv("INFERENCE_BACKEND", "hf")  # hf | hf-cpu | onnx | standin (see deploy/backends.py)
 VAL_PATH = "data/val.jsonl"
 SCHEMA_PATH = "schema/campaign.schema.json"
 
@@ -32,38 +33,58 @@ def build_chat(user):
 def load_jsonl(p): 
     return [json.loads(l) for l in open(p,"r",encoding="utf-8")]
 
-def main():
-    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL, use_fast=True)
-    model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.bfloat16, device_map="auto")
-    model = PeftModel.from_pretrained(model, ADAPTER_DIR)
-    model.eval()
-
-    schema = json.load(open(SCHEMA_PATH))
-    val = load_jsonl(VAL_PATH)
+def pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))] if xs else 0.0
 
-    ok = 0
-    for ex in tqdm(val):
+def evaluate(name: str, val: List[Dict[str, Any]], schema: Dict[str, Any], args) -> Dict[str, Any]:
+    backend = get_backend(name)
+    ok, lat, toks = 0, [], 0
+    for ex in tqdm(val, desc=name):
         user = build_user(ex["input"])
         prompt = build_chat(user)
-        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-        with torch.no_grad():
-            out = model.generate(**inputs, max_new_tokens=1024, do_sample=True, top_p=0.9, temperature=0.7)
-        text = tokenizer.decode(out[0], skip_special_tokens=True)
-        # take the last JSON-ish block
-        start = text.find("{")
-        end = text.rfind("}")
+        t0 = time.perf_counter()
+        c = backend.generate(prompt, max_new_tokens=args.max_new_tokens, temperature=args.temperature, top_p=args.top_p)
+        lat.append((time.perf_counter() - t0) * 1000)
+        toks += c.new_tokens
         try:
-            js = align_plan_to_schema(json_after_assistant(text[start:end+1]))
-            print(js)
-            # js = json.loads(js)
+            js = align_plan_to_schema(json_after_assistant(c.text))
             validate(js, schema)
             ok += 1
         except Exception:
             pass
-        
-        break
+    n = max(1, len(val))
+    return {"backend": name, "n": len(val), "schema_pass": ok, "pass_rate": round(ok / n, 4),
+            "latency_ms_mean": round(sum(lat) / n, 1), "latency_ms_p50": round(pct(lat, 0.5), 1),
+            "latency_ms_p95": round(pct(lat, 0.95), 1), "new_tokens": toks,
+            "tokens_per_sec": round(toks / sum(lat) * 1000, 1) if sum(lat) else None}
+
+def main():
+    ap = argparse.ArgumentParser(description="Schema pass rate + latency on data/val.jsonl, per backend")
+    ap.add_argument("--backends", nargs="+", default=[BACKEND], help="e.g. hf-cpu onnx (see deploy/backends.py)")
+    ap.add_argument("--limit", type=int, default=0, help="Evaluate only the first N examples (0 = all)")
+    ap.add_argument("--max-new-tokens", type=int, default=1024)
+    ap.add_argument("--temperature", type=float, default=0.7)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    ap.add_argument("--out", default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    schema = json.load(open(SCHEMA_PATH))
+    val = load_jsonl(VAL_PATH)
+    if args.limit > 0:
+        val = val[:args.limit]
 
-    print(f"Schema pass rate: {ok}/{len(val)} = {ok/len(val):.2%}")
+    rows = [evaluate(b, val, schema, args) for b in args.backends]
+    for r in rows:
+        print(f"[{r['backend']}] Schema pass rate: {r['schema_pass']}/{r['n']} = {r['pass_rate']:.2%}")
+    print(f"\n{'backend':<10}{'pass':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'tok/s':>9}")
+    for r in rows:
+        print(f"{r['backend']:<10}{r['pass_rate']:>8.2%}{r['latency_ms_mean']:>10}{r['latency_ms_p50']:>10}"
+              f"{r['latency_ms_p95']:>10}{r['tokens_per_sec']:>9}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[OK] Report -> {args.out}")
 
 if __name__ == "__main__":
     main()
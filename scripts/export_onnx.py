@@ -0,0 +1,64 @@
+# scripts/export_onnx.py
+# Export Llama 3.1 (+ the LoRA adapter merged into the weights) to ONNX with KV-cache inputs/outputs
+# for the "onnx" inference backend (deploy/onnx_backend.py), optionally with int8 dynamic quantization.
+#
+#   MODEL_DIR=/models/llama31-8b python scripts/export_onnx.py --out outputs/onnx-llama31-8b --int8
+#   python scripts/export_onnx.py --model-dir /tmp/tiny-llama --adapter-dir /tmp/tiny-lora --out /tmp/tiny-onnx --int8
+from __future__ import annotations
+import argparse, os, shutil, sys, tempfile, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+import torch  # noqa: E402
+from config import MODEL_DIR, HF_TOKEN, LOCAL_FILES_ONLY, ADAPTER_DIR, ONNX_DIR  # noqa: E402
+from model_loader import load_llama_cpu  # noqa: E402
+
+def merge(model_dir: str | None, adapter_dir: str | None, out_dir: str) -> None:
+    """fp32 base + merged adapter as a plain HF checkpoint (what the ONNX exporter consumes)."""
+    tok, mdl = load_llama_cpu(model_dir=model_dir, local_files_only=LOCAL_FILES_ONLY, hf_token=HF_TOKEN,
+                              adapter_dir=adapter_dir, dtype=torch.float32)
+    mdl.save_pretrained(out_dir)
+    tok.save_pretrained(out_dir)
+
+def quantize_int8(out_dir: str) -> str:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    src = os.path.join(out_dir, "model.onnx")
+    dst = os.path.join(out_dir, "model.int8.onnx")
+    # 8B weights exceed the 2 GB protobuf limit; keep tensors in an external data file
+    big = os.path.getsize(src) + sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir)
+                                     if f.endswith(".onnx_data")) > 2 * 1024 ** 3
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8, use_external_data_format=big)
+    return dst
+
+def main():
+    ap = argparse.ArgumentParser(description="Export the (LoRA-merged) model to ONNX with KV cache")
+    ap.add_argument("--model-dir", default=MODEL_DIR, help="Base model dir (default: MODEL_DIR or the HF repo)")
+    ap.add_argument("--adapter-dir", default=ADAPTER_DIR, help='LoRA adapter to merge ("" = base model only)')
+    ap.add_argument("--out", default=ONNX_DIR)
+    ap.add_argument("--int8", action="store_true", help="Also write model.int8.onnx (dynamic int8 weights)")
+    ap.add_argument("--opset", type=int, default=None)
+    args = ap.parse_args()
+
+    from optimum.exporters.onnx import main_export
+
+    t0 = time.perf_counter()
+    merged = tempfile.mkdtemp(prefix="merged-")
+    try:
+        merge(args.model_dir, args.adapter_dir or None, merged)
+        print(f"[OK] Merged checkpoint ({time.perf_counter() - t0:.1f}s)")
+        # text-generation-with-past: inputs input_ids/attention_mask/position_ids/past_key_values.*,
+        # outputs logits/present.* -- one graph for both prefill (empty past) and decode steps
+        main_export(merged, output=args.out, task="text-generation-with-past", device="cpu",
+                    opset=args.opset, local_files_only=True)
+    finally:
+        shutil.rmtree(merged, ignore_errors=True)
+    print(f"[OK] ONNX -> {os.path.join(args.out, 'model.onnx')} ({time.perf_counter() - t0:.1f}s)")
+
+    if args.int8:
+        t1 = time.perf_counter()
+        dst = quantize_int8(args.out)
+        print(f"[OK] int8 -> {dst} ({time.perf_counter() - t1:.1f}s)")
+
+if __name__ == "__main__":
+    main()
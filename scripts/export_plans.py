@@ -0,0 +1,76 @@
+# scripts/export_plans.py
+# Export plans from JSONL ({"input", "output"} training / audit lines, plan-store {"brief", "plan"} hits, or bare
+# plans) to Markdown for decks, or CSV / XLSX with flattened channel / budget / KPI columns for CRM import.
+# Streams: memory stays flat on any input size; large inputs render on all cores (deploy/export.py).
+#
+#   python scripts/export_plans.py --in data/train_synth_clean.jsonl --out exports/plans.csv
+#   python scripts/export_plans.py --in logs/audit --out exports/plans.xlsx          # directory of .jsonl.gz segments
+#   python scripts/export_plans.py --in data/val.jsonl --out - --format md | less    # "-" = stdout
+#
+# Format comes from the --out extension unless --format is given.
+from __future__ import annotations
+import argparse, glob, os, sys
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import EXPORT_MAX_CHANNELS, EXPORT_MAX_KPIS, EXPORT_WORKERS  # noqa: E402
+from export import FORMATS, export_lines  # noqa: E402
+import audit_log  # noqa: E402
+
+def input_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "*.jsonl*")))
+        else:
+            yield path
+
+def read_lines(files):
+    for fp in files:
+        yield from audit_log.read_lines(fp)
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream plans from JSONL to Markdown / CSV / XLSX")
+    ap.add_argument("--in", dest="inp", nargs="+", required=True, help="JSONL / .jsonl.gz files or directories")
+    ap.add_argument("--out", required=True, help="Output file, or - for stdout")
+    ap.add_argument("--format", choices=FORMATS, default=None, help="Default: from the --out extension")
+    ap.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Render processes (0 = one per core)")
+    ap.add_argument("--chunk", type=int, default=2000, help="Lines per rendering chunk")
+    ap.add_argument("--parallel-min-mb", type=float, default=16.0,
+                    help="Inputs smaller than this render in-process (pool startup is not worth it)")
+    ap.add_argument("--max-channels", type=int, default=EXPORT_MAX_CHANNELS)
+    ap.add_argument("--max-kpis", type=int, default=EXPORT_MAX_KPIS)
+    ap.add_argument("--bom", action="store_true", help="CSV: start with a UTF-8 BOM so Excel reads Thai correctly")
+    args = ap.parse_args()
+
+    fmt = args.format or os.path.splitext(args.out)[1].lstrip(".").lower().replace("markdown", "md")
+    if fmt not in FORMATS:
+        print(f"[ERR] Cannot tell the format from {args.out!r}; pass --format {{{','.join(FORMATS)}}}.", file=sys.stderr)
+        sys.exit(2)
+    files = list(input_files(args.inp))
+    missing = [f for f in files if not os.path.isfile(f)]
+    if not files or missing:
+        print(f"[ERR] No input files{': ' + ', '.join(missing) if missing else ''}.", file=sys.stderr)
+        sys.exit(2)
+    size_mb = sum(os.path.getsize(f) for f in files) / 2**20
+    workers = args.workers or os.cpu_count() or 1
+    if size_mb < args.parallel_min_mb:
+        workers = 1
+
+    if args.out == "-":
+        out = sys.stdout.buffer
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        out = open(args.out, "wb")
+    try:
+        stats = export_lines(read_lines(files), fmt, out, workers=workers, chunk_lines=args.chunk,
+                             max_channels=args.max_channels, max_kpis=args.max_kpis, bom=args.bom)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    rate = stats["records"] / max(stats["elapsed_s"], 1e-9)
+    print(f"[OK] {stats['records']} plans -> {args.out} ({fmt}; {stats['skipped']} lines skipped) in "
+          f"{stats['elapsed_s']:.1f}s, {rate:,.0f} plans/s, {workers} worker(s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# scripts/fit_length_model.py
+# Fit the output-length predictor (deploy/length_model.py) from historical plans and report how
+# tight its budgets are vs the fixed GEN_MAX_NEW_TOKENS.
+#
+#   python scripts/fit_length_model.py --tokenizer meta-llama/Meta-Llama-3.1-8B-Instruct
+#   python scripts/fit_length_model.py --tokenizer approx     # stand-in backend token counts, no download
+from __future__ import annotations
+import argparse, json, os, sys
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import GEN_MAX_NEW_TOKENS, LENGTH_MODEL_PATH, HF_TOKEN, LOCAL_FILES_ONLY  # noqa: E402
+from length_model import fit, save, LengthPredictor, language_of  # noqa: E402
+
+TRAIN_PATHS = ["data/train_synth_clean.jsonl", "data/train_synth_bilingual.jsonl"]
+
+def load(paths):
+    rows = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            rows += [json.loads(l) for l in f if l.strip()]
+    return rows
+
+def token_counter(name: str):
+    if name == "approx":
+        from backends import ApproxTokenizer
+        tk = ApproxTokenizer()
+        return lambda s: len(tk.pieces(s))
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(name, use_fast=True, token=HF_TOKEN, local_files_only=LOCAL_FILES_ONLY)
+    return lambda s: len(tok(s, add_special_tokens=False)["input_ids"])
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit per-brief max_new_tokens budgets from historical outputs")
+    ap.add_argument("--data", nargs="+", default=TRAIN_PATHS, help="JSONL {input, output}; missing files are skipped")
+    ap.add_argument("--eval", default="data/val.jsonl", help="Held-out plans for the coverage report")
+    ap.add_argument("--tokenizer", default=os.getenv("MODEL_DIR") or "meta-llama/Meta-Llama-3.1-8B-Instruct",
+                    help='HF tokenizer (dir or id), or "approx" for the stand-in tokenizer')
+    ap.add_argument("--quantile", type=float, default=0.98)
+    ap.add_argument("--margin", type=float, default=0.1, help="Headroom on top of the quantile")
+    ap.add_argument("--min-count", type=int, default=20, help="Smaller buckets back off to coarser ones")
+    ap.add_argument("--out", default=LENGTH_MODEL_PATH)
+    args = ap.parse_args()
+
+    count = token_counter(args.tokenizer)
+    train = load(args.data)
+    model = fit(train, count, args.quantile, args.min_count)
+    model.update(tokenizer=args.tokenizer, records=len(train))
+    save(model, args.out)
+
+    print(f"{'bucket':<28}{'n':>6}{'p50':>7}{'q' + str(args.quantile):>8}{'max':>7}")
+    for k, b in sorted(model["buckets"].items()):
+        print(f"{k:<28}{b['n']:>6}{b['p50']:>7}{b['q']:>8}{b['max']:>7}")
+
+    pred = LengthPredictor(model, margin=args.margin)
+    held = load([args.eval])
+    if held:
+        fits, budgets, langs = 0, [], {}
+        for r in held:
+            need = count(json.dumps(r["output"], ensure_ascii=False))
+            b = pred.budget(r["input"])
+            budgets.append(b)
+            fits += need <= b
+            langs[language_of(r["input"], r["output"])] = langs.get(language_of(r["input"], r["output"]), 0) + 1
+        avg = sum(budgets) / len(budgets)
+        print(f"\n{args.eval}: {len(held)} plans {langs}")
+        print(f"  fit in first pass : {fits}/{len(held)} = {fits / len(held):.1%} (the rest take one overflow continuation)")
+        print(f"  avg budget        : {avg:.0f} tokens vs {GEN_MAX_NEW_TOKENS} fixed ({avg / GEN_MAX_NEW_TOKENS:.0%} of the reservation)")
+    print(f"[OK] Length model -> {args.out}")
+
+if __name__ == "__main__":
+    main()
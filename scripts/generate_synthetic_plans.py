@@ -1,14 +1,38 @@
 import os, json, math, time, random, pathlib
 from tqdm import tqdm
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, LogitsProcessor, LogitsProcessorList
 import torch, jsonschema
-from typing import Optional, Any, Dict, Tuple
+from typing import Optional, Any, Dict, List, Tuple
+from work_queue import Shard, WorkQueue, item_keys
+from pipeline import Pipeline
 
 BASE_MODEL = os.getenv("BASE_MODEL","meta-llama/Meta-Llama-3.1-8B-Instruct")
 BRIEFS_PATH = os.getenv("BRIEFS_PATH","data/briefs_train.jsonl")
 OUT_PATH = os.getenv("OUT_PATH","data/train_synth.jsonl")
 HF_TOKEN = os.getenv("HF_TOKEN")
 SCHEMA_PATH = "schema/campaign.schema.json"
+# Batched generation: BATCH_SIZE prompts per generate() call (left-padded; 1 = one brief at a time). Briefs are
+# sorted by prompt length within windows of SORT_WINDOW batches so rows in a batch pad little, and each window is
+# written back in input order. REPORT_PATH optionally receives the throughput report as JSON.
+BATCH_SIZE = int(os.getenv("BATCH_SIZE","16"))
+SORT_WINDOW = int(os.getenv("SORT_WINDOW","32"))
+MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS","1024"))
+LIMIT = int(os.getenv("LIMIT","0"))  # first N briefs only (0 = all)
+REPORT_PATH = os.getenv("REPORT_PATH")
+# Resumable, multi-worker runs (work_queue.py): briefs are split into units of UNIT_SIZE; every worker started with
+# the same BRIEFS_PATH / WORK_DIR (processes, or machines sharing the directory) leases units until none are left.
+# Finished batches are fsync'd to per-unit shards, so a rerun after a crash skips what was already generated
+# (by content hash). The last worker to finish merges the shards into OUT_PATH in brief order; MERGE_ONLY=1 only
+# merges. A lease not renewed for LEASE_TTL_S (dead worker) is taken over. Delete WORK_DIR to start from scratch.
+WORK_DIR = os.getenv("WORK_DIR", OUT_PATH + ".work")
+UNIT_SIZE = int(os.getenv("UNIT_SIZE","256"))
+LEASE_TTL_S = float(os.getenv("LEASE_TTL_S","900"))
+WORKER_ID = os.getenv("WORKER_ID") or None  # default: <hostname>-<pid>
+MERGE_ONLY = os.getenv("MERGE_ONLY","0") in ("1","true","True")
+# Post-processing (decode, parse, normalize, validate) runs in POSTPROC_WORKERS processes while the next batch
+# generates (pipeline.py); at most PIPELINE_DEPTH batches wait for it (0 = 2 per worker). 0 workers = writer thread.
+POSTPROC_WORKERS = int(os.getenv("POSTPROC_WORKERS","2"))
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH","0"))
 
 SYS = ("You are a senior marketing strategist for Thailand. "
        "Return ONLY a single JSON object that strictly follows the provided schema. "
@@ -212,46 +236,172 @@ def normalize_to_schema(plan: Dict[str, Any]) -> Dict[str, Any]:
 
     return out
 
+class RowSampling(LogitsProcessor):
+    """Temperature + top-k + top-p with one temperature / top-p per batch row (HF's warpers take a single value for
+    the whole batch). top_k is applied before top-p, as model.generate does (0 = off)."""
+
+    def __init__(self, temps: List[float], top_ps: List[float], top_k: int = 50):
+        self.temps = torch.tensor(temps).unsqueeze(1)
+        self.top_ps = torch.tensor(top_ps).unsqueeze(1)
+        self.top_k = top_k
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        scores = scores / self.temps.to(scores.device, scores.dtype)
+        if 0 < self.top_k < scores.shape[-1]:
+            kth = torch.topk(scores, self.top_k, dim=-1).values[..., -1:]
+            scores = scores.masked_fill(scores < kth, float("-inf"))
+        sorted_logits, sorted_idx = torch.sort(scores, descending=False, dim=-1)
+        cum = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        remove = cum <= (1 - self.top_ps.to(scores.device, cum.dtype))
+        remove[..., -1:] = False  # always keep the most likely token
+        return scores.masked_fill(remove.scatter(1, sorted_idx, remove), float("-inf"))
+
+def generate_batch(model, tok, prompts: List[str], temps: List[float], top_ps: List[float]) -> Tuple[List[List[int]], int]:
+    """Token ids of prompt+completion per row (left padding included) and the new-token count.
+    A batch that runs out of GPU memory is retried as two halves."""
+    try:
+        enc = tok(prompts, return_tensors="pt", padding=True).to(model.device)
+        with torch.no_grad():
+            out_ids = model.generate(**enc, max_new_tokens=MAX_NEW_TOKENS, do_sample=True,
+                                     temperature=1.0, top_p=1.0, top_k=0,  # sampling is RowSampling's job
+                                     logits_processor=LogitsProcessorList([RowSampling(
+                                         temps, top_ps, model.generation_config.top_k or 0)]),
+                                     pad_token_id=tok.pad_token_id)
+    except torch.cuda.OutOfMemoryError:
+        if len(prompts) == 1:
+            raise
+        torch.cuda.empty_cache()
+        h = len(prompts) // 2
+        a, na = generate_batch(model, tok, prompts[:h], temps[:h], top_ps[:h])
+        b, nb = generate_batch(model, tok, prompts[h:], temps[h:], top_ps[h:])
+        return a + b, na + nb
+    new = out_ids[:, enc["input_ids"].shape[1]:]
+    return out_ids.cpu().tolist(), int((new != tok.pad_token_id).sum())
+
+def to_record(brief: Dict[str, Any], txt: str, schema: Dict[str, Any]) -> Optional[str]:
+    """The output JSONL line for one generation, or None if it does not parse / validate."""
+    js = try_parse_json(txt)
+    if not js:
+        return None
+    js = normalize_plan(js)
+    
+    js = normalize_to_schema(js)
+
+    # validate; skip if invalid
+    try:
+        jsonschema.validate(js, schema)
+    except Exception:
+        return None
+
+    return json.dumps({"input": brief, "output": js}, ensure_ascii=False)+"\n"
+
+# ---------- post-processing (pipeline.py worker processes)
+
+_WORKER: Dict[str, Any] = {}
+
+def init_worker(model_name: str) -> None:
+    _WORKER["tok"] = AutoTokenizer.from_pretrained(model_name, use_fast=True, token=HF_TOKEN)
+    _WORKER["schema"] = json.load(open(SCHEMA_PATH))
+
+def postprocess(rows: List[Tuple[Dict[str, Any], List[int]]]) -> List[Optional[str]]:
+    """Decode prompt+completion (as the one-at-a-time loop decoded it), parse, normalize and validate each row."""
+    texts = _WORKER["tok"].batch_decode([ids for _, ids in rows], skip_special_tokens=True)
+    return [to_record(brief, txt, _WORKER["schema"]) for (brief, _), txt in zip(rows, texts)]
+
+def line_key(line: str) -> str:
+    return item_keys([json.loads(line)["input"]])[0]
+
 def main():
-    schema = json.load(open(SCHEMA_PATH))
+    briefs = list(load_briefs(BRIEFS_PATH))
+    if LIMIT > 0:
+        briefs = briefs[:LIMIT]
+    keys = item_keys(briefs)
+    queue = WorkQueue(WORK_DIR, keys, UNIT_SIZE, WORKER_ID, LEASE_TTL_S)
+    if MERGE_ONLY or not queue.pending():
+        print(f"Merged {queue.merge(OUT_PATH, line_key)} plans ->", OUT_PATH)
+        return
+
+    # start the post-processing processes before the model takes the memory
+    pipe = Pipeline(postprocess, POSTPROC_WORKERS, PIPELINE_DEPTH, init_worker, (BASE_MODEL,))
     tok = AutoTokenizer.from_pretrained(BASE_MODEL, use_fast=True, token=HF_TOKEN)
+    tok.padding_side = "left"  # decoder-only: rows must end where generation starts
+    if tok.pad_token is None:
+        tok.pad_token = tok.eos_token
     model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.bfloat16, device_map="auto", token=HF_TOKEN)
     model.eval()
 
     pathlib.Path(os.path.dirname(OUT_PATH)).mkdir(exist_ok=True, parents=True)
-    out = open(OUT_PATH,"w",encoding="utf-8")
 
-    briefs = list(load_briefs(BRIEFS_PATH))
     rng = random.Random(123)
+    # small sampling jitter to diversify outputs (drawn per brief in input order, so a brief gets the same values
+    # whichever worker generates it)
+    jitter = [(rng.uniform(0.6, 0.9), rng.uniform(0.85, 0.95)) for _ in briefs]
+    prompts = [build_chat(build_user(brief)) for brief in briefs]
+    lens = [len(ids) for ids in tok(prompts)["input_ids"]]
 
-    for brief in tqdm(briefs, total=len(briefs)):
-        # small sampling jitter to diversify outputs
-        temp = rng.uniform(0.6, 0.9)
-        top_p = rng.uniform(0.85, 0.95)
-        mx=1024
-        user = build_user(brief)
-        prompt = build_chat(user)
-        inputs = tok(prompt, return_tensors="pt").to(model.device)
-        with torch.no_grad():
-            out_ids = model.generate(**inputs, max_new_tokens=mx, do_sample=True, temperature=temp, top_p=top_p)
-        txt = tok.decode(out_ids[0], skip_special_tokens=True)
-        js = try_parse_json(txt)
-        if not js:
-            continue
-        js = normalize_plan(js)
-        
-        js = normalize_to_schema(js)
+    bs, window = max(1, BATCH_SIZE), max(1, BATCH_SIZE) * max(1, SORT_WINDOW)
+    tally = {"done": 0, "valid": 0}
+    skipped, new_tokens, pad_tokens, gen_s, t0 = 0, 0, 0, 0.0, time.perf_counter()
+    print(f"{len(briefs)} briefs in {queue.n_units} units of {UNIT_SIZE}; worker {queue.worker_id}, work dir {WORK_DIR}")
+    with tqdm(total=len(briefs)) as bar:
+        bar.update(sum(len(queue.bounds(u)) for u in range(queue.n_units) if queue.is_done(u)))
 
-        # validate; skip if invalid
-        try:
-            jsonschema.validate(js, schema)
-        except Exception:
-            continue
+        def written(shard, lease, rows):
+            def on_done(lines):  # writer thread, in submission order
+                kept = [l for l in lines if l]
+                lease.heartbeat()  # raises LeaseLost if another worker took the unit over
+                shard.commit(kept, [keys[i] for i in rows])  # crash-safe from here on
+                tally["done"] += len(rows)
+                tally["valid"] += len(kept)
+                bar.update(len(rows))
+                hours = (time.perf_counter() - t0) / 3600
+                bar.set_postfix(plans_per_hour=f"{tally['valid'] / hours:,.0f}",
+                                valid=f"{tally['valid'] / tally['done']:.1%}")
+            return on_done
 
-        out.write(json.dumps({"input": brief, "output": js}, ensure_ascii=False)+"\n")
+        while (lease := queue.claim()) is not None:
+            shard = Shard(queue.path(lease.unit, "jsonl"), line_key)
+            unit = queue.bounds(lease.unit)
+            todo = [i for i in unit if keys[i] not in shard.done]
+            skipped += len(unit) - len(todo)
+            bar.update(len(unit) - len(todo))
+            for w in range(0, len(todo), window):
+                idx = sorted(todo[w:w + window], key=lambda i: lens[i])
+                for b in range(0, len(idx), bs):
+                    rows = idx[b:b + bs]
+                    g0 = time.perf_counter()
+                    ids, nt = generate_batch(model, tok, [prompts[i] for i in rows],
+                                             [jitter[i][0] for i in rows], [jitter[i][1] for i in rows])
+                    gen_s += time.perf_counter() - g0
+                    lease.heartbeat()
+                    new_tokens += nt
+                    pad_tokens += sum(max(lens[i] for i in rows) - lens[i] for i in rows)
+                    pipe.submit([(briefs[i], r) for i, r in zip(rows, ids)], written(shard, lease, rows))
+            pipe.call(lambda lease=lease, shard=shard, n=len(unit): lease.complete({"briefs": n, "kept": shard.kept}))
+        stages = pipe.close()
 
-    out.close()
-    print("Done ->", OUT_PATH)
+    elapsed = time.perf_counter() - t0
+    done, valid = tally["done"], tally["valid"]
+    report = {"briefs": done, "valid": valid, "valid_rate": round(valid / max(1, done), 4), "resumed_skipped": skipped,
+              "batch_size": BATCH_SIZE, "elapsed_s": round(elapsed, 1), "plans_per_hour": round(valid / elapsed * 3600, 1),
+              "briefs_per_hour": round(done / elapsed * 3600, 1), "new_tokens_per_s": round(new_tokens / elapsed, 1),
+              "prompt_pad_share": round(pad_tokens / max(1, sum(lens)), 4),
+              "stages": dict(stages, generate_s=round(gen_s, 2), postproc_workers=POSTPROC_WORKERS)}
+    print(f"{valid}/{done} valid ({report['valid_rate']:.1%}), {report['plans_per_hour']:,.0f} plans/hour, "
+          f"{report['new_tokens_per_s']:,.0f} new tokens/s, batch {BATCH_SIZE}, prompt padding {report['prompt_pad_share']:.1%}"
+          + (f"; {skipped} briefs already done" if skipped else ""))
+    print(f"stages: generate {gen_s:.1f}s ({gen_s / elapsed:.0%} of wall), post-process {stages['post_cpu_s']:.1f} "
+          f"CPU-s on {POSTPROC_WORKERS} workers, write {stages['write_s']:.1f}s, generation blocked on a full queue "
+          f"{stages['backpressure_s']:.1f}s, writer waiting on post-processing {stages['post_wait_s']:.1f}s")
+    if REPORT_PATH:
+        with open(REPORT_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    pending = queue.pending()
+    if pending:
+        print(f"{len(pending)} units still held by other workers; the last one to finish merges "
+              f"(or run again with MERGE_ONLY=1).")
+        return
+    print(f"Merged {queue.merge(OUT_PATH, line_key)} plans ->", OUT_PATH)
 
 if __name__ == "__main__":
     main()
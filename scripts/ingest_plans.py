@@ -0,0 +1,103 @@
+# scripts/ingest_plans.py
+# Bulk-load {"input": brief, "output": plan} JSONL (training data, audit log segments) into the SQLite plan
+# store served by the API's /plans/search (deploy/plan_store.py), then time a set of typical queries.
+#
+#   python scripts/ingest_plans.py --in data/train_synth_clean.jsonl --db data/plans.db
+#   python scripts/ingest_plans.py --in logs/audit --db data/plans.db            # directory of .jsonl.gz segments
+#   python scripts/ingest_plans.py --in data/train_synth_clean.jsonl --db /tmp/plans-2m.db --repeat 1000 --fast
+#
+# --repeat N loads every row N times (as distinct plans) to check ingest rate and query latency at scale.
+from __future__ import annotations
+import argparse, glob, json, os, random, sys, time
+
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from config import PLAN_STORE_PATH, PLAN_STORE_TOKENIZER  # noqa: E402
+from plan_store import PlanStore  # noqa: E402
+from audit_log import read_lines  # noqa: E402
+
+def read_rows(paths):
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.jsonl*"))) if os.path.isdir(path) else [path]
+        for fp in files:
+            for line in read_lines(fp):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+def repeated(rows, n: int):
+    rows = list(rows)
+    for i in range(n):
+        for j, r in enumerate(rows):
+            # a synthetic identity per copy, so copies are not deduplicated away
+            yield dict(r, _hash=f"repeat:{i}:{j}") if i else r
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+
+def bench(store: PlanStore, rows, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    briefs = [r["input"] for r in rows if isinstance(r.get("input"), dict)]
+    words = [w for r in rows[:500] for w in str((r.get("output") or {}).get("big_idea", "")).split() if len(w) > 4]
+    kinds = {
+        "recent page": lambda b: {},
+        "industry+objective": lambda b: {"industry": b["industry"], "objective": b["objective"]},
+        "industry+age+tone": lambda b: {"industry": b["industry"], "age": (b.get("audience") or {}).get("age"),
+                                        "tone": (b.get("constraints") or {}).get("brand_tone")},
+        "channel+budget": lambda b: {"channels": ["LINE OA"], "min_budget": 500000, "max_budget": 2000000},
+        "text": lambda b: {"q": rng.choice(words)},
+        "text+objective": lambda b: {"q": rng.choice(words), "objective": b["objective"]},
+        "text, relevance": lambda b: {"q": rng.choice(words), "order": "relevance"},
+        "second page": lambda b: {"industry": b["industry"], "cursor": None},
+    }
+    print(f"\n{'query':<22}{'p50 ms':>9}{'p95 ms':>9}{'hits':>7}")
+    for name, make in kinds.items():
+        lat, hits = [], 0
+        for _ in range(n):
+            kw = make(rng.choice(briefs))
+            if "cursor" in kw:
+                first = store.search(limit=20, **{k: v for k, v in kw.items() if k != "cursor"})
+                kw["cursor"] = first["next_cursor"]
+            t0 = time.perf_counter()
+            res = store.search(limit=20, **kw)
+            lat.append((time.perf_counter() - t0) * 1000)
+            hits += len(res["results"])
+        print(f"{name:<22}{pct(lat, 0.5):>9.2f}{pct(lat, 0.95):>9.2f}{hits / n:>7.1f}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-ingest plans into the SQLite/FTS5 plan store and time queries")
+    ap.add_argument("--in", dest="inp", nargs="+", default=["data/train_synth_clean.jsonl"],
+                    help="JSONL / .jsonl.gz files or directories of segments")
+    ap.add_argument("--db", default=PLAN_STORE_PATH or "data/plans.db")
+    ap.add_argument("--source", default=None, help="Source label stored with each plan (default: file name)")
+    ap.add_argument("--batch", type=int, default=5000, help="Rows per transaction")
+    ap.add_argument("--repeat", type=int, default=1, help="Load test: ingest every row N times")
+    ap.add_argument("--fast", action="store_true", help="No fsync during the load (rebuildable stores only)")
+    ap.add_argument("--bench", type=int, default=200, help="Queries per kind to time afterwards (0 = skip)")
+    args = ap.parse_args()
+
+    rows = list(read_rows(args.inp))
+    if not rows:
+        print("[ERR] No rows found.", file=sys.stderr)
+        sys.exit(2)
+    store = PlanStore(args.db, PLAN_STORE_TOKENIZER)
+    before = store.count()
+    t0 = time.perf_counter()
+    stats = store.ingest(repeated(rows, args.repeat), source=args.source or os.path.basename(args.inp[0]),
+                         batch_size=args.batch, fast=args.fast)
+    load_s = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    store.optimize()
+    print(f"[OK] {stats['rows']} rows -> {args.db}: {stats['added']} added, {stats['duplicates']} duplicates, "
+          f"{stats['skipped']} skipped in {load_s:.1f}s ({stats['rows'] / max(load_s, 1e-9):,.0f} rows/s); "
+          f"optimize {time.perf_counter() - t1:.1f}s; store now ~{max(before, store.count()):,} plans, "
+          f"{os.path.getsize(args.db) / 2**20:,.0f} MB")
+    if args.bench:
+        bench(store, rows, args.bench)
+
+if __name__ == "__main__":
+    main()
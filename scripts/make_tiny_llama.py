@@ -0,0 +1,80 @@
+# scripts/make_tiny_llama.py
+# Build a tiny, randomly initialized Llama-architecture checkpoint (+ optional LoRA adapter) fully
+# offline, for exercising the CPU / ONNX / compile paths end-to-end without the gated 8B weights.
+#
+#   python scripts/make_tiny_llama.py --out outputs/tiny-llama --adapter-out outputs/tiny-lora
+#   INFERENCE_BACKEND=hf-cpu MODEL_DIR=outputs/tiny-llama ADAPTER_DIR=outputs/tiny-lora python deploy/api_app.py
+import argparse, json, os
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+from transformers import PreTrainedTokenizerFast, LlamaConfig, LlamaForCausalLM
+import torch
+
+SPECIALS = ["<|begin_of_text|>", "<|end_of_text|>", "<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>"]
+
+# same layout as the Llama 3.1 template: header, blank-free content, <|eot_id|>
+CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for m in messages %}"
+    "<|start_header_id|>{{ m['role'] }}<|end_header_id|>\n{{ m['content'] }}\n<|eot_id|>"
+    "{% endfor %}{% if add_generation_prompt %}<|start_header_id|>assistant<|end_header_id|>\n{% endif %}"
+)
+
+def corpus(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                yield json.dumps(rec["input"], ensure_ascii=False)
+                yield json.dumps(rec["output"], ensure_ascii=False)
+
+def build_tokenizer(data_path: str, vocab_size: int) -> PreTrainedTokenizerFast:
+    tk = Tokenizer(models.BPE())
+    tk.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tk.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=SPECIALS,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tk.train_from_iterator(corpus(data_path), trainer=trainer)
+    tok = PreTrainedTokenizerFast(tokenizer_object=tk, bos_token="<|begin_of_text|>", eos_token="<|eot_id|>",
+                                  pad_token="<|end_of_text|>", additional_special_tokens=SPECIALS[2:4],
+                                  model_input_names=["input_ids", "attention_mask"])
+    tok.chat_template = CHAT_TEMPLATE
+    return tok
+
+def main():
+    ap = argparse.ArgumentParser(description="Create a tiny offline Llama checkpoint for tests/benchmarks")
+    ap.add_argument("--out", default="outputs/tiny-llama")
+    ap.add_argument("--adapter-out", default=None, help="Also write a random LoRA adapter here")
+    ap.add_argument("--data", default="data/train_synth_clean.jsonl", help="Text used to fit the BPE vocab")
+    ap.add_argument("--vocab-size", type=int, default=4096)
+    ap.add_argument("--hidden", type=int, default=128)
+    ap.add_argument("--layers", type=int, default=2)
+    ap.add_argument("--heads", type=int, default=4)
+    ap.add_argument("--kv-heads", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    torch.manual_seed(args.seed)
+    tok = build_tokenizer(args.data, args.vocab_size)
+    cfg = LlamaConfig(
+        vocab_size=len(tok), hidden_size=args.hidden, intermediate_size=args.hidden * 3,
+        num_hidden_layers=args.layers, num_attention_heads=args.heads, num_key_value_heads=args.kv_heads,
+        max_position_embeddings=4096, bos_token_id=tok.bos_token_id, eos_token_id=tok.eos_token_id,
+        pad_token_id=tok.pad_token_id, tie_word_embeddings=False,
+    )
+    model = LlamaForCausalLM(cfg)
+    model.generation_config.eos_token_id = tok.eos_token_id
+    model.generation_config.pad_token_id = tok.pad_token_id
+    os.makedirs(args.out, exist_ok=True)
+    model.save_pretrained(args.out)
+    tok.save_pretrained(args.out)
+    n = sum(p.numel() for p in model.parameters())
+    print(f"[OK] tiny Llama ({n/1e6:.2f}M params, vocab {len(tok)}) -> {args.out}")
+
+    if args.adapter_out:
+        from peft import LoraConfig, TaskType, get_peft_model
+        lora = LoraConfig(r=4, lora_alpha=8, task_type=TaskType.CAUSAL_LM, init_lora_weights=False,
+                          target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"])
+        get_peft_model(model, lora).save_pretrained(args.adapter_out)
+        print(f"[OK] random LoRA adapter -> {args.adapter_out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# scripts/pipeline.py
+# Keep the accelerator busy in the data-generation scripts: the generation loop hands each batch's token ids to a
+# process pool (detokenize, parse, normalize, validate) and goes straight on with the next batch, while a writer
+# thread collects the results in submission order and writes them. At most `depth` batches are in flight; beyond
+# that submit() blocks, so a slow pool or disk throttles generation instead of piling up memory.
+#
+#   pipe = Pipeline(postprocess, workers=4, depth=8, initializer=init_worker, initargs=(model_name,))
+#   pipe.submit(payload, on_done)   # on_done(result) runs on the writer thread, in submission order
+#   pipe.call(fn)                   # run fn on the writer thread once everything submitted before it is written
+#   stats = pipe.close()            # drain; per-stage seconds and counts
+from __future__ import annotations
+import multiprocessing as mp
+import queue, threading, time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+def _timed(fn: Callable[[Any], Any], payload: Any) -> Tuple[float, Any]:
+    t0 = time.process_time()
+    out = fn(payload)
+    return time.process_time() - t0, out
+
+class Pipeline:
+    def __init__(self, fn: Callable[[Any], Any], workers: int = 2, depth: int = 0,
+                 initializer: Optional[Callable[..., None]] = None, initargs: Tuple = ()):
+        self.fn = fn
+        # spawn, not fork: the parent holds CUDA state and the tokenizer's threads
+        self.pool = ProcessPoolExecutor(workers, mp.get_context("spawn"), initializer, initargs) if workers > 0 else None
+        if self.pool is not None:
+            for _ in range(workers):  # start (import, load the tokenizer) now, while the caller loads its model
+                self.pool.submit(time.sleep, 0)
+        if self.pool is None and initializer is not None:
+            initializer(*initargs)  # workers=0: post-process inline on the writer thread
+        self.q: "queue.Queue" = queue.Queue(maxsize=max(1, depth or 2 * max(1, workers)))
+        self.stats: Dict[str, float] = {"batches": 0, "backpressure_s": 0.0, "post_cpu_s": 0.0, "post_wait_s": 0.0,
+                                        "write_s": 0.0, "writer_idle_s": 0.0}
+        self._error: Optional[BaseException] = None
+        self._t0 = time.perf_counter()
+        self._writer = threading.Thread(target=self._write_loop, name="pipeline-writer", daemon=True)
+        self._writer.start()
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("post-processing / writing failed") from self._error
+
+    def _put(self, item) -> None:
+        t0 = time.perf_counter()
+        while True:
+            self._check()
+            try:
+                self.q.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.stats["backpressure_s"] += time.perf_counter() - t0
+
+    def submit(self, payload: Any, on_done: Callable[[Any], None]) -> None:
+        job = self.pool.submit(_timed, self.fn, payload) if self.pool is not None else payload
+        self._put(("job", job, on_done))
+
+    def call(self, fn: Callable[[], None]) -> None:
+        self._put(("call", None, fn))
+
+    def _write_loop(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            item = self.q.get()
+            self.stats["writer_idle_s"] += time.perf_counter() - t0
+            if item is None:
+                return
+            kind, job, fn = item
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks on a dead writer
+            try:
+                if kind == "job":
+                    t0 = time.perf_counter()
+                    cpu_s, result = job.result() if isinstance(job, Future) else _timed(self.fn, job)
+                    self.stats["post_wait_s"] += time.perf_counter() - t0
+                    self.stats["post_cpu_s"] += cpu_s
+                    self.stats["batches"] += 1
+                    t0 = time.perf_counter()
+                    fn(result)
+                    self.stats["write_s"] += time.perf_counter() - t0
+                else:
+                    fn()
+            except BaseException as e:
+                self._error = e
+
+    def close(self) -> Dict[str, float]:
+        """Wait until everything submitted is written; re-raises a post-processing / writer error."""
+        self.q.put(None)
+        self._writer.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self._check()
+        self.stats["wall_s"] = time.perf_counter() - self._t0
+        return {k: round(v, 2) for k, v in self.stats.items()}
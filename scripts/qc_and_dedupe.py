@@ -1,4 +1,27 @@
-import json, pathlib, math, difflib
+# scripts/qc_and_dedupe.py
+# Quality gate + dedupe for the synthetic training set: drop records that fail the basic checks, then coarse
+# duplicates (same industry / objective / first channels), then near-duplicates by pack_text (title, big idea, key
+# message) over the whole corpus. The near-duplicate rule is the old one - a record is dropped when its text has
+# difflib ratio > --threshold with an earlier kept record - but candidates come from a MinHash + LSH index instead of
+# a window over the last 500 kept texts, so far-apart duplicates are found too and the cost is near-linear:
+#   1. scan    input cut into byte-range shards; each worker parses, gates and signs its records (MinHash over
+#              character k-grams, so Thai needs no word splitting); signatures go to a file in --work-dir
+#   2. lsh     per band, records are sorted by band hash; records sharing a bucket become candidate pairs, kept if
+#              the signatures' estimated Jaccard reaches --min-jaccard (vectorized, on the memory-mapped file)
+#   3. verify  in input order, each candidate is checked with difflib against earlier *kept* records only
+# Memory is ~60 bytes per record plus the surviving candidate pairs; texts are re-read from the input on demand.
+# Near-duplicates are reported as clusters (kept record + the ones dropped for it) in --report.
+#
+#   python scripts/qc_and_dedupe.py
+#   python scripts/qc_and_dedupe.py --in data/train_synth_more.jsonl --out data/train_synth_more_clean.jsonl --workers 8
+from __future__ import annotations
+import argparse, difflib, hashlib, json, os, pathlib, shutil, tempfile, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
 from tqdm import tqdm
 
 IN_PATH = "data/train_synth.jsonl"
@@ -10,41 +33,308 @@ def pack_text(rec):
     title = o.get("concept_title",""); idea = o.get("big_idea",""); km = o.get("key_message","")
     return f"{title} || {idea} || {km}"
 
+def passes_gate(rec) -> bool:
+    o = rec["output"]
+    if len(o.get("channels",[])) == 0 or not o.get("concept_title"):
+        return False
+    return 1 <= o.get("timeline_weeks", 0) <= 24
+
+def coarse_key(rec) -> int:
+    o = rec["output"]; i = rec["input"]
+    key = (i["industry"], i["objective"], tuple(sorted([c["name"] for c in o.get("channels",[]) if "name" in c]))[:3])
+    return int.from_bytes(hashlib.blake2b(json.dumps(key, ensure_ascii=False).encode("utf-8"), digest_size=8).digest(), "little")
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, elementwise (uint64 arithmetic wraps)."""
+    x = x ^ (x >> np.uint64(30)); x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27)); x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+class MinHasher:
+    """MinHash signature (uint32 x num_perm) of a text's character k-grams, lowercased with whitespace collapsed."""
+
+    def __init__(self, num_perm: int, shingle: int, seed: int = 1):
+        rng = np.random.default_rng(seed)  # same seed in every worker -> comparable signatures
+        self.shingle = shingle
+        self.a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    def __call__(self, text: str) -> np.ndarray:
+        cps = np.frombuffer(" ".join(text.lower().split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = max(1, min(self.shingle, len(cps)))
+        m = max(1, len(cps) - k + 1)
+        h = np.zeros(m, dtype=np.uint64)
+        for q in range(min(k, len(cps))):
+            h = h * np.uint64(0x100000001B3) + cps[q:q + m]
+        h = _mix(h)
+        # universal multiply-shift hash per permutation; the min over shingles is the signature
+        return ((self.a[:, None] * h[None, :] + self.b[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+def shard_bounds(path: str, shard_bytes: int) -> List[Tuple[int, int]]:
+    """Byte ranges of about shard_bytes, each ending on a line boundary."""
+    size = os.path.getsize(path)
+    bounds, start = [], 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(size, start + shard_bytes))
+            f.readline()
+            end = min(size, f.tell())
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+def scan_shard(job: Tuple[str, int, int, MinHasher]) -> Dict[str, Any]:
+    """Gate + coarse key + signature for every line in one byte range."""
+    path, start, end, hasher = job
+    offsets, lines, coarse, sigs = [], [], [], []
+    n = bad = gated = 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                rec = json.loads(line)
+                ok = passes_gate(rec)
+                if ok:
+                    key = coarse_key(rec)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                bad += 1
+            else:
+                if ok:
+                    offsets.append(pos); lines.append(n); coarse.append(key)
+                    sigs.append(hasher(pack_text(rec)))
+                else:
+                    gated += 1
+            pos += len(line)
+            n += 1
+    width = len(hasher.a)
+    return {"lines": n, "bad": bad, "gated": gated, "bytes": end - start,
+            "offsets": np.array(offsets, dtype=np.int64), "line_no": np.array(lines, dtype=np.int64),
+            "coarse": np.array(coarse, dtype=np.uint64),
+            "sig": np.stack(sigs) if sigs else np.zeros((0, width), dtype=np.uint32)}
+
+def ordered(fn: Callable[[Any], Any], jobs: Iterable[Any], workers: int) -> Iterator[Any]:
+    """fn(job) for every job, in order; at most 2 jobs per worker in flight (workers <= 1: in-process)."""
+    if workers <= 1:
+        yield from map(fn, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight: deque = deque()
+        for job in jobs:
+            inflight.append(pool.submit(fn, job))
+            if len(inflight) >= 2 * workers:
+                yield inflight.popleft().result()
+        while inflight:
+            yield inflight.popleft().result()
+
+def band_keys(sig: np.ndarray, rows: np.ndarray, cols: slice, chunk: int = 1 << 20) -> np.ndarray:
+    keys = np.empty(len(rows), dtype=np.uint64)
+    for s in range(0, len(rows), chunk):
+        block = sig[rows[s:s + chunk], cols].astype(np.uint64)
+        h = np.full(len(block), cols.start + 1, dtype=np.uint64)
+        for c in range(block.shape[1]):
+            h = _mix(h ^ block[:, c])
+        keys[s:s + chunk] = h
+    return keys
+
+def bucket_pairs(keys: np.ndarray, anchors: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """(earlier, later) positions sharing a key. Each bucket member is paired with the first `anchors` members
+    before it, so a bucket of m identical texts costs m * anchors pairs, not m^2."""
+    order = np.argsort(keys, kind="stable")  # stable: ascending position within a bucket
+    sk = keys[order]
+    starts = np.flatnonzero(np.r_[True, sk[1:] != sk[:-1]])
+    sizes = np.diff(np.r_[starts, len(sk)])
+    multi = sizes > 1
+    starts, sizes = starts[multi], sizes[multi]
+    for a in range(min(anchors, int(sizes.max(initial=1)) - 1)):
+        g = sizes > a + 1
+        first, cnt = starts[g] + a, sizes[g] - a - 1
+        left = np.repeat(first, cnt)
+        right = left + 1 + np.arange(int(cnt.sum())) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        yield order[left], order[right]
+
+def candidate_pairs(sig: np.ndarray, alive: np.ndarray, bands: int, rows: int, anchors: int, min_jaccard: float,
+                    chunk: int = 1 << 20) -> Tuple[np.ndarray, int]:
+    """Sorted unique codes j * n + i (i < j, record indices) of LSH pairs whose signatures agree on at least
+    min_jaccard of the hashes; also the number of raw bucket pairs looked at."""
+    n = len(sig)
+    found = np.zeros(0, dtype=np.int64)
+    raw = 0
+    for b in range(bands):
+        keys = band_keys(sig, alive, slice(b * rows, (b + 1) * rows))
+        new_codes = []
+        for left, right in bucket_pairs(keys, anchors):
+            raw += len(left)
+            for s in range(0, len(left), chunk):
+                i, j = alive[left[s:s + chunk]], alive[right[s:s + chunk]]
+                code = j * n + i
+                if len(found):  # near-duplicates share most bands; only the first one pays for the gather
+                    pos = np.minimum(np.searchsorted(found, code), len(found) - 1)
+                    new = found[pos] != code
+                    i, j, code = i[new], j[new], code[new]
+                est = (sig[i] == sig[j]).mean(axis=1)
+                new_codes.append(code[est >= min_jaccard])
+        # new codes are unique within a band and not in found, so a sort does (timsort keeps found as one run)
+        found = np.sort(np.concatenate([found] + new_codes), kind="stable")
+    return found, raw
+
+def similarity(t: str, prev: str, threshold: float) -> float:
+    """difflib ratio of t against prev, or 0.0 once it cannot exceed threshold."""
+    if t == prev:
+        return 1.0
+    sm = difflib.SequenceMatcher(None, t, prev)
+    # real_quick_ratio / quick_ratio are cheap upper bounds of ratio
+    if sm.real_quick_ratio() <= threshold or sm.quick_ratio() <= threshold:
+        return 0.0
+    return sm.ratio()
+
+def first_match(job: Tuple[str, float, List[int], List[List[int]]]) -> List[Tuple[int, float, int]]:
+    """For each record (by offset) the position of its first candidate (offsets, ascending) with similarity above
+    threshold, whether that candidate is kept or not (-1 = none), the ratio and the number of checks made."""
+    path, threshold, offsets, candidates = job
+    texts: Dict[int, str] = {}
+    out = []
+    with open(path, "rb") as f:
+        def text(off: int) -> str:
+            if off not in texts:
+                f.seek(off)
+                texts[off] = pack_text(json.loads(f.readline()))
+            return texts[off]
+
+        for off, cands in zip(offsets, candidates):
+            t, hit = text(off), (-1, 0.0, len(cands))
+            for k, c in enumerate(cands):
+                r = similarity(t, text(c), threshold)
+                if r > threshold:
+                    hit = (k, r, k + 1)
+                    break
+            out.append(hit)
+    return out
+
 def main():
-    seen_keys = set()
-    kept = []
-    for line in tqdm(open(IN_PATH,"r",encoding="utf-8")):
-        rec = json.loads(line)
-        o = rec["output"]; i = rec["input"]
-        # basic gating
-        if len(o.get("channels",[])) == 0 or not o.get("concept_title"):
-            continue
-        if not (1 <= o.get("timeline_weeks", 0) <= 24):
-            continue
-        # coarse dedup key
-        key = (i["industry"], i["objective"], tuple(sorted([c["name"] for c in o.get("channels",[]) if "name" in c]))[:3])
-        if key in seen_keys:
-            continue
-        seen_keys.add(key)
-        kept.append(rec)
-
-    # fuzzy prune near-duplicates (O(n^2) on small batches; shard if large)
-    kept2 = []
-    texts = []
-    for rec in kept:
-        t = pack_text(rec)
-        is_dup = False
-        for prev in texts[-500:]:  # local window
-            if difflib.SequenceMatcher(None, t, prev).ratio() > 0.92:
-                is_dup = True; break
-        if not is_dup:
-            kept2.append(rec); texts.append(t)
-
-    pathlib.Path(OUT_PATH).parent.mkdir(exist_ok=True, parents=True)
-    with open(OUT_PATH,"w",encoding="utf-8") as f:
-        for rec in kept2:
-            f.write(json.dumps(rec, ensure_ascii=False)+"\n")
-    print(f"Kept {len(kept2)} / {len(kept)} after fuzzy dedupe; wrote -> {OUT_PATH}")
+    ap = argparse.ArgumentParser(description="Gate, coarse-dedupe and near-dedupe (MinHash LSH + difflib) synthetic plans")
+    ap.add_argument("--in", dest="inp", default=IN_PATH, help="Input JSONL")
+    ap.add_argument("--out", default=OUT_PATH)
+    ap.add_argument("--report", default=None, help="Duplicate clusters, JSONL, largest first (default: <out>.dupes.jsonl)")
+    ap.add_argument("--threshold", type=float, default=0.92, help="difflib ratio above which a text is a near-duplicate")
+    ap.add_argument("--shingle", type=int, default=5, help="Character k-gram size")
+    ap.add_argument("--bands", type=int, default=20)
+    ap.add_argument("--rows", type=int, default=5, help="Hashes per band; signatures have bands * rows hashes")
+    ap.add_argument("--min-jaccard", type=float, default=0.45,
+                    help="Estimated Jaccard a bucket pair needs to reach difflib (ratio > 0.92 texts sit above ~0.6)")
+    ap.add_argument("--anchors", type=int, default=8, help="Earlier bucket members each record is paired with")
+    ap.add_argument("--workers", type=int, default=0, help="Scan / verify processes (0 = one per core)")
+    ap.add_argument("--shard-mb", type=float, default=16.0, help="Input bytes per scan shard")
+    ap.add_argument("--verify-chunk", type=int, default=2000, help="Records per verify job")
+    ap.add_argument("--work-dir", default=None, help="Where the signature file goes (default: next to --out)")
+    args = ap.parse_args()
+
+    report_path = args.report or args.out + ".dupes.jsonl"
+    pathlib.Path(args.out).parent.mkdir(exist_ok=True, parents=True)
+    work = tempfile.mkdtemp(prefix=".dedupe-", dir=args.work_dir or os.path.dirname(os.path.abspath(args.out)))
+    try:
+        hasher = MinHasher(args.bands * args.rows, args.shingle)
+        width = args.bands * args.rows
+        workers = args.workers or os.cpu_count() or 1
+
+        # 1. scan: offsets / line numbers / coarse keys in memory, signatures appended to a file
+        t0 = time.perf_counter()
+        sig_path = os.path.join(work, "signatures.u32")
+        offsets, line_no, coarse = [], [], []
+        lines = bad = gated = 0
+        with open(sig_path, "wb") as sf, tqdm(total=os.path.getsize(args.inp), unit="B", unit_scale=True) as bar:
+            jobs = [(args.inp, s, e, hasher) for s, e in shard_bounds(args.inp, int(args.shard_mb * 2**20))]
+            for part in ordered(scan_shard, jobs, workers if len(jobs) > 1 else 1):
+                offsets.append(part["offsets"]); line_no.append(part["line_no"] + lines); coarse.append(part["coarse"])
+                sf.write(part["sig"].tobytes())
+                lines += part["lines"]; bad += part["bad"]; gated += part["gated"]
+                bar.update(part["bytes"])
+        # an empty input has no shards at all
+        offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+        line_no = np.concatenate(line_no) if line_no else np.zeros(0, dtype=np.int64)
+        coarse = np.concatenate(coarse) if coarse else np.zeros(0, dtype=np.uint64)
+        n = len(offsets)
+        sig = np.memmap(sig_path, dtype=np.uint32, mode="r", shape=(n, width)) if n else np.zeros((0, width), np.uint32)
+        # coarse dedup: first record of each key survives
+        alive = np.sort(np.unique(coarse, return_index=True)[1]) if n else np.zeros(0, dtype=np.int64)
+        del coarse
+        scan_s = time.perf_counter() - t0
+
+        # 2. lsh
+        t0 = time.perf_counter()
+        codes, raw_pairs = candidate_pairs(sig, alive, args.bands, args.rows, args.anchors, args.min_jaccard)
+        lsh_s = time.perf_counter() - t0
+
+        # 3. verify: a record is dropped for its first *kept* candidate with ratio > threshold (the old rule, over
+        # the whole corpus). Workers find each record's first similar candidate regardless of kept status; in input
+        # order that answer stands if the candidate is kept, and only otherwise do the later candidates get checked.
+        t0 = time.perf_counter()
+        keep = np.zeros(n, dtype=bool); keep[alive] = True
+        parent = np.full(n, -1, dtype=np.int64)
+        ratio = np.zeros(n, dtype=np.float32)
+        js, cand = codes // max(n, 1), codes % max(n, 1)
+        del codes
+        starts = np.flatnonzero(np.r_[True, js[1:] != js[:-1]]) if len(js) else np.zeros(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(js)]
+        chunks = [(s, min(s + args.verify_chunk, len(starts))) for s in range(0, len(starts), args.verify_chunk)]
+        jobs = ((args.inp, args.threshold, offsets[js[starts[a:b]]].tolist(),
+                 [offsets[cand[s:e]].tolist() for s, e in zip(starts[a:b], ends[a:b])]) for a, b in chunks)
+        checks = 0
+        with open(args.inp, "rb") as src:
+            @lru_cache(maxsize=1 << 16)
+            def record(idx: int) -> Dict[str, Any]:
+                src.seek(int(offsets[idx]))
+                return json.loads(src.readline())
+
+            for (a, _), hits in zip(chunks, ordered(first_match, jobs, workers if len(chunks) > 1 else 1)):
+                for g, (k, r, c) in enumerate(hits, start=a):
+                    checks += c
+                    if k < 0:
+                        continue
+                    j, cands = int(js[starts[g]]), cand[starts[g]:ends[g]]
+                    i = int(cands[k])
+                    if not keep[i]:  # the similar one was dropped itself: go on with the later, kept candidates
+                        t, i, r = pack_text(record(j)), -1, 0.0
+                        for c2 in cands[k + 1:].tolist():
+                            if keep[c2]:
+                                checks += 1
+                                r = similarity(t, pack_text(record(c2)), args.threshold)
+                                if r > args.threshold:
+                                    i = c2
+                                    break
+                        if i < 0:
+                            continue
+                    keep[j] = False; parent[j] = i; ratio[j] = r
+            verify_s = time.perf_counter() - t0
+
+            # duplicate clusters: every dropped record points at the kept one it matched
+            dropped = np.flatnonzero(parent >= 0)
+            by_parent = dropped[np.argsort(parent[dropped], kind="stable")]
+            heads, first, sizes = np.unique(parent[by_parent], return_index=True, return_counts=True)
+            with open(report_path, "w", encoding="utf-8") as rf:
+                for c in np.argsort(-sizes, kind="stable").tolist():
+                    head, members = int(heads[c]), by_parent[first[c]:first[c] + sizes[c]]
+                    rf.write(json.dumps({"keep_line": int(line_no[head]) + 1, "size": int(sizes[c]) + 1,
+                                         "title": record(head)["output"].get("concept_title", ""),
+                                         "dups": [{"line": int(line_no[m]) + 1, "ratio": round(float(ratio[m]), 4)}
+                                                  for m in members.tolist()]}, ensure_ascii=False) + "\n")
+
+        keep_line = np.zeros(lines, dtype=bool); keep_line[line_no[keep]] = True
+        with open(args.inp, "r", encoding="utf-8") as src, open(args.out, "w", encoding="utf-8") as f:
+            for k, line in enumerate(src):
+                if keep_line[k]:
+                    f.write(json.dumps(json.loads(line), ensure_ascii=False) + "\n")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"Kept {int(keep.sum())} / {len(alive)} after fuzzy dedupe ({gated} failed the gate, {n - len(alive)} coarse "
+          f"dups, {bad} unreadable of {lines} lines); wrote -> {args.out}")
+    print(f"{len(heads)} duplicate clusters (largest {int(sizes.max()) + 1 if len(sizes) else 0}) -> "
+          f"{report_path}; {raw_pairs} bucket pairs, {len(js)} after the Jaccard filter, {checks} difflib checks; "
+          f"scan {scan_s:.1f}s on {workers} worker(s), lsh {lsh_s:.1f}s, verify {verify_s:.1f}s")
 
 if __name__ == "__main__":
     main()
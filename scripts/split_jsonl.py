@@ -1,23 +1,43 @@
 from __future__ import annotations
-import argparse, json, os, random, sys, hashlib
+import argparse, glob, json, os, random, sys, hashlib
 from typing import Any, Dict, List, Tuple, Iterable, Optional
 from collections import defaultdict, Counter
 from pathlib import Path
 
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+sys.path.insert(0, os.path.abspath(DEPLOY_DIR))
+
+from audit_log import read_lines  # noqa: E402
+
+def input_files(path: str) -> List[str]:
+    """A file, a glob, or a directory of segments (*.jsonl / *.jsonl.gz, e.g. the API's AUDIT_LOG_DIR)."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.jsonl")) + glob.glob(os.path.join(path, "*.jsonl.gz")))
+    return sorted(glob.glob(path)) or [path]
+
 def read_jsonl(path: str) -> List[Dict[str, Any]]:
     rows = []
     bad = 0
-    with open(path, "r", encoding="utf-8") as f:
-        for i, line in enumerate(f, 1):
+    empty = 0
+    for fp in input_files(path):
+        for i, line in enumerate(read_lines(fp), 1):
             line = line.strip()
             if not line:
                 continue
             try:
-                rows.append(json.loads(line))
+                row = json.loads(line)
             except Exception as e:
                 bad += 1
+                continue
+            # audit log lines of failed / rejected requests carry no plan
+            if isinstance(row, dict) and "output" in row and row["output"] is None:
+                empty += 1
+                continue
+            rows.append(row)
     if bad:
         print(f"[WARN] Skipped {bad} malformed line(s).", file=sys.stderr)
+    if empty:
+        print(f"[INFO] Skipped {empty} record(s) without output.", file=sys.stderr)
     return rows
 
 def write_jsonl(path: str, rows: Iterable[Dict[str, Any]]):
@@ -100,7 +120,7 @@ def compute_stats(rows: List[Dict[str, Any]], stratify_key: Optional[str]) -> Di
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--input", required=True, help="Path to input JSONL (e.g., train_synth_clean.jsonl)")
+    ap.add_argument("--input", required=True, help="Input JSONL (e.g., train_synth_clean.jsonl), .jsonl.gz, glob, or a directory of segments (audit log)")
     ap.add_argument("--outdir", required=True, help="Output directory")
     ap.add_argument("--val-size", required=True, type=float, help="Validation size: fraction (0,1] or integer (>=1)")
     ap.add_argument("--seed", type=int, default=42)
@@ -1,5 +1,5 @@
 # scripts/train_lora.py
-import os, json, torch
+import os, sys, json, torch
 from datasets import load_dataset, Dataset, Features, Value
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 from peft import LoraConfig, get_peft_model
@@ -8,14 +8,25 @@ from dataclasses import dataclass
 from typing import Dict
 from peft import TaskType
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")))
+from config import OUTPUT_FORMAT, PLAN_SOLVER  # noqa: E402
+from compact import training_target as target  # noqa: E402
+from audit_log import read_lines  # noqa: E402
+
 BASE_MODEL = os.getenv("BASE_MODEL","meta-llama/Meta-Llama-3.1-8B-Instruct")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR","outputs/lora-llama31-8b")
 TRAIN_PATH = "data/train.jsonl"
 VAL_PATH   = "data/val.jsonl"
+# Match serving's PLAN_SOLVER: with it on, budget_split / timeline_weeks are computed (deploy/planner.py), so the
+# adapter is trained to leave them out of its output. OUTPUT_FORMAT=compact trains on the compact line encoding
+# (deploy/compact.py) instead of JSON; serve with the same settings (both are read from deploy/config.py).
 
 SYS_PROMPT = ("You are a senior marketing strategist for Thailand. "
               "Return ONLY a single JSON object that strictly follows the provided schema. "
-              "No prose, no markdown—JSON only.")
+              "No prose, no markdown—JSON only.") if OUTPUT_FORMAT != "compact" else (
+              "You are a senior marketing strategist for Thailand. "
+              "Return ONLY the plan in compact line format: one tagged line per field or list item. "
+              "No prose, no markdown.")
 
 def build_prompt(ex: Dict) -> str:
     inp = ex["input"]
@@ -27,36 +38,35 @@ def build_prompt(ex: Dict) -> str:
         f"- Budget (THB): {inp['budget_thb']}\n"
         f"- Objective: {inp['objective']}\n"
         f"- Constraints: {json.dumps(inp.get('constraints',{}),ensure_ascii=False)}\n\n"
-        f"JSON fields to produce: concept_title, big_idea, key_message, channels[], assets[], timeline_weeks, budget_split[], kpis{{}}\n"
+        f"{'Compact plan lines' if OUTPUT_FORMAT == 'compact' else 'JSON fields'} to produce: "
+        f"concept_title, big_idea, key_message, channels[], assets[], "
+        f"{'' if PLAN_SOLVER else 'timeline_weeks, budget_split[], '}kpis{{}}\n"
         f"<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n"
-        f"{json.dumps(ex['output'],ensure_ascii=False)}"
+        f"{target(ex['output'])}"
     )
 
 def load_jsonl(path):
     return [{"text": build_prompt(json.loads(l))} for l in open(path, "r", encoding="utf-8")]
 
 def gen_text(jsonl_path):
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line=line.strip()
-            if not line: continue
+    # plain or gzip'd JSONL (audit log segments, see deploy/audit_log.py)
+    for line in read_lines(jsonl_path):
+        line=line.strip()
+        if not line: continue
+        try:
+            obj = json.loads(line)
+        except Exception:
             try:
-                obj = json.loads(line)
+                from json_repair import repair_json
+                obj = json.loads(repair_json(line))
             except Exception:
-                try:
-                    from json_repair import repair_json
-                    obj = json.loads(repair_json(line))
-                except Exception:
-                    continue
-            # Build your train string here; adjust to your file structure
-            inp  = obj.get("input", {})
-            outp = obj.get("output", obj)
-            text = (
-                "<|system|>You are a marketing strategist. JSON only.\n"
-                f"<|user|>{json.dumps(inp, ensure_ascii=False)}\n"
-                f"<|assistant|>{json.dumps(outp, ensure_ascii=False)}"
-            )
-            yield {"text": text}
+                continue
+        if obj.get("output", obj) is None:
+            continue  # audit line of a failed request
+        if "input" not in obj:
+            continue  # no brief to build the serving prompt from
+        # Same prompt and target encoding as load_jsonl (SYS_PROMPT / OUTPUT_FORMAT / PLAN_SOLVER)
+        yield {"text": build_prompt({"input": obj["input"], "output": obj.get("output", obj)})}
 
 def main():
     # 4-bit quant for QLoRA
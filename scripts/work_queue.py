@@ -0,0 +1,240 @@
+# scripts/work_queue.py
+# Crash-safe, resumable work splitting for the long data-generation runs (generate_synthetic_plans.py).
+#
+# The input is cut deterministically into units of `unit_size` consecutive items. A worker (process or machine on
+# a shared filesystem) claims a unit by creating <dir>/unit-NNNNN.lease with O_EXCL and keeps it alive by touching
+# it; a lease not touched for `ttl_s` is stale and can be taken over. Every lease holds a unique token, so a takeover
+# that raced another one is detected and undone, and a worker whose lease was taken over finds out at its next
+# heartbeat (before it commits anything else). Each unit writes its results to
+# <dir>/unit-NNNNN.jsonl plus the content-hash keys of every item it finished (kept or rejected) to
+# <dir>/unit-NNNNN.keys. Both are appended in whole batches with one write + fsync, and a torn tail from a crash is
+# cut off on reopen, so a restarted worker skips exactly the items that were committed. A finished unit gets
+# <dir>/unit-NNNNN.done; once all units have one, merge() writes the single ordered output file atomically.
+from __future__ import annotations
+import hashlib, json, os, socket, time, uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+def item_keys(items: Iterable[Any]) -> List[str]:
+    """Content hash per item; the n-th repeat of identical content gets its own key."""
+    seen: Dict[str, int] = {}
+    keys = []
+    for item in items:
+        h = hashlib.sha1(json.dumps(item, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+        k = seen.get(h, 0)
+        seen[h] = k + 1
+        keys.append(h if k == 0 else f"{h}-{k}")
+    return keys
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # not supported (e.g. Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _recover(path: str) -> bytes:
+    """Contents of an append-only file up to its last complete line; a torn tail is truncated away."""
+    if not os.path.exists(path):
+        return b""
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+    return data[:end]
+
+class LeaseLost(RuntimeError):
+    """Another worker took the unit over (this one went silent for longer than the TTL)."""
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+class Shard:
+    """Output lines + committed keys of one unit."""
+
+    def __init__(self, path: str, key_of_line: Callable[[str], str]):
+        self.path = path
+        self.keys_path = path[:-len(".jsonl")] + ".keys"
+        lines = _recover(self.path).decode("utf-8").splitlines()
+        self.done: Set[str] = {k for k in _recover(self.keys_path).decode("utf-8").split()}
+        self.done.update(key_of_line(l) for l in lines)  # written, but the crash came before its keys
+        self.kept = len(lines)
+
+    @staticmethod
+    def _append(path: str, data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def commit(self, lines: List[str], keys: List[str]) -> None:
+        """Append a batch: output lines first, then the keys of every item it covered."""
+        if lines:
+            self._append(self.path, "".join(lines).encode("utf-8"))
+        self._append(self.keys_path, "".join(k + "\n" for k in keys).encode("utf-8"))
+        self.done.update(keys)
+        self.kept += len(lines)
+
+class Lease:
+    def __init__(self, queue: "WorkQueue", unit: int, token: str):
+        self.queue = queue
+        self.unit = unit
+        self.path = queue.path(unit, "lease")
+        self.token = token
+
+    def owned(self) -> bool:
+        try:
+            return _read(self.path) == self.token
+        except FileNotFoundError:
+            return False
+
+    def heartbeat(self) -> None:
+        """Renew the lease; raises LeaseLost if it is no longer ours."""
+        if not self.owned():
+            raise LeaseLost(f"unit-{self.unit:05d} was taken over by another worker after this one stalled for "
+                            f"more than {self.queue.ttl_s:.0f}s; stopping. Its committed work is kept.")
+        os.utime(self.path)
+
+    def complete(self, stats: Dict[str, Any]) -> None:
+        self.heartbeat()
+        done = self.queue.path(self.unit, "done")
+        with open(done + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(dict(stats, worker=self.queue.worker_id), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(done + ".tmp", done)
+        _fsync_dir(self.queue.dir)
+        if self.owned():
+            os.remove(self.path)
+
+class WorkQueue:
+    def __init__(self, work_dir: str, keys: List[str], unit_size: int, worker_id: Optional[str] = None,
+                 ttl_s: float = 900.0):
+        self.dir = work_dir
+        self.keys = keys
+        self.unit_size = max(1, unit_size)
+        self.n_units = (len(keys) + self.unit_size - 1) // self.unit_size
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl_s = ttl_s
+        os.makedirs(work_dir, exist_ok=True)
+        self._check_manifest()
+
+    def _check_manifest(self) -> None:
+        """All workers (and resumed runs) must cut the same input the same way."""
+        manifest = {"items": len(self.keys), "unit_size": self.unit_size,
+                    "keys_sha1": hashlib.sha1("\n".join(self.keys).encode("utf-8")).hexdigest()}
+        path = os.path.join(self.dir, "manifest.json")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            with open(path, "r", encoding="utf-8") as f:
+                have = json.load(f)
+            if have != manifest:
+                raise SystemExit(f"[ERR] {self.dir} belongs to a different input or unit size ({have}); "
+                                 "use another work directory or delete it to start over.")
+            return
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def path(self, unit: int, ext: str) -> str:
+        return os.path.join(self.dir, f"unit-{unit:05d}.{ext}")
+
+    def bounds(self, unit: int) -> range:
+        return range(unit * self.unit_size, min(len(self.keys), (unit + 1) * self.unit_size))
+
+    def is_done(self, unit: int) -> bool:
+        return os.path.exists(self.path(unit, "done"))
+
+    def pending(self) -> List[int]:
+        return [u for u in range(self.n_units) if not self.is_done(u)]
+
+    def _stale(self, path: str) -> Optional[Tuple[str, float]]:
+        """(token, mtime) of the lease at `path` if it is stale, else None."""
+        try:
+            mtime = os.path.getmtime(path)
+            token = _read(path)
+        except FileNotFoundError:
+            return None
+        return (token, mtime) if time.time() - mtime >= self.ttl_s else None
+
+    def _take_over(self, path: str, seen: Tuple[str, float], token: str) -> bool:
+        """Move the stale lease we looked at out of the way. The rename can hit a lease that changed since we looked
+        (another worker's takeover, or a late heartbeat of the owner): then it is put back and we back off."""
+        moved = f"{path}.stale-{token}"
+        try:
+            os.rename(path, moved)
+        except FileNotFoundError:
+            return True  # released or taken over meanwhile; race for it with O_EXCL
+        try:
+            now = (_read(moved), os.path.getmtime(moved))
+        except FileNotFoundError:
+            now = None
+        if now is not None and now != seen:
+            try:
+                os.link(moved, path)  # no-clobber restore; its owner keeps touching the same inode
+            except FileExistsError:
+                pass  # a third worker already created one; the displaced owner sees LeaseLost at its next heartbeat
+            os.remove(moved)
+            return False
+        return True
+
+    def _take(self, unit: int) -> Optional[Lease]:
+        path = self.path(unit, "lease")
+        token = f"{self.worker_id}.{uuid.uuid4().hex[:12]}"
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            seen = self._stale(path)
+            if seen is None or not self._take_over(path, seen, token):
+                return None
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                return None
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+        lease = Lease(self, unit, token)
+        if self.is_done(unit):  # finished between our check and the lease
+            if lease.owned():
+                os.remove(path)
+            return None
+        return lease
+
+    def claim(self) -> Optional[Lease]:
+        """Next unit nobody holds (or whose holder went silent); None when there is nothing left to take."""
+        for unit in self.pending():
+            lease = self._take(unit)
+            if lease is not None:
+                return lease
+        return None
+
+    def merge(self, out_path: str, key_of_line: Callable[[str], str]) -> int:
+        """All units' lines, in input order, into `out_path` (written to a temp file and renamed)."""
+        missing = self.pending()
+        if missing:
+            raise SystemExit(f"[ERR] {len(missing)} of {self.n_units} units are not finished yet "
+                             f"(first: unit-{missing[0]:05d}); run the workers again.")
+        index = {k: i for i, k in enumerate(self.keys)}
+        tmp = f"{out_path}.tmp-{self.worker_id}"
+        n = 0
+        with open(tmp, "w", encoding="utf-8") as out:
+            for unit in range(self.n_units):
+                lines = _recover(self.path(unit, "jsonl")).decode("utf-8").splitlines(keepends=True)
+                for line in sorted(lines, key=lambda l: index[key_of_line(l)]):
+                    out.write(line)
+                    n += 1
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, out_path)
+        _fsync_dir(os.path.dirname(os.path.abspath(out_path)))
+        return n